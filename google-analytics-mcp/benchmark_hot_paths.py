@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the get_ga4_data and run_ga4_query hot paths.
+
+Synthetic RunReportResponse pages are served by a fake client, so nothing
+touches the network or needs credentials. Pages are built directly as protobuf
+messages (and reused for every page of a report), so setting up a 1M-row report
+takes well under a second.
+
+Per call, independent of report size:
+  parse_fields        dimensions and metrics sent as JSON and comma-separated strings
+  order_bys           parse_order_bys + build_order_bys
+  filter_compile      compiling a dimension filter not seen before
+  filter_cached       compiling a filter seen before (memoized)
+  prepare_report      all of _prepare_report: parsing, filters, request and cache key
+
+Per report size:
+  rows                decoding pages into row dicts (iter_report_rows, get_ga4_data's default)
+  columnar            ColumnarReport decoding and to_dict (output_format="columnar")
+  get_ga4_data        the MCP tool end to end, with use_cache=False and max_rows=size (past the inline cap)
+  run_ga4_query       the Streamlit data layer end to end, rows to DataFrame (needs pandas)
+  dataframe           pd.DataFrame.from_records of the row dicts
+  dataframe_columnar  ColumnarReport.to_pandas
+  json                json.dumps of the row dicts, as MCP serializes tool results
+
+Times are the best of --repeat runs. Decoding through proto-plus is slow, so
+1M-row reports take minutes per case and are only run when asked for with
+--sizes. Peak memory is the Python heap peak
+(tracemalloc) during one more run; memory held inside protobuf messages is
+not included.
+
+Usage:
+  python benchmark_hot_paths.py [--sizes 1000,10000,100000] [--repeat 3] [--no-memory]
+  python benchmark_hot_paths.py --sizes 1000000 --repeat 1 --no-memory
+  python benchmark_hot_paths.py --save baseline.json
+  python benchmark_hot_paths.py --compare baseline.json [--tolerance 0.25]   # exits 1 on a regression
+
+Debug output of the server goes to stderr; add 2>/dev/null to hide it.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(HERE)
+sys.path.append(os.path.join(HERE, "streamlit_ui"))
+
+# Keep the benchmark's caches out of the real cache directory, and leave serialization
+# to the json case instead of sampling it inside get_ga4_data
+os.environ["GA4_CACHE_DIR"] = tempfile.mkdtemp(prefix="ga4-benchmark-")
+os.environ.setdefault("GA4_TELEMETRY_SERIALIZE_SAMPLE", "1000000000")
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DIMENSIONS = ["country", "city", "deviceCategory"]
+METRICS = [("sessions", "TYPE_INTEGER"), ("totalUsers", "TYPE_INTEGER"), ("bounceRate", "TYPE_FLOAT")]
+METRIC_NAMES = [name for name, _ in METRICS]
+PAGE_SIZE = 10000
+CALLS = 2000
+
+COUNTRIES = ["United States", "India", "Germany", "Brazil", "Japan", "France", "Canada", "Nigeria"]
+DEVICES = ["desktop", "mobile", "tablet"]
+FILTER = {"andGroup": {"expressions": [
+    {"filter": {"fieldName": "country", "inListFilter": {"values": ["United States", "Canada"]}}},
+    {"notExpression": {"filter": {"fieldName": "deviceCategory", "stringFilter": {"value": "tablet"}}}},
+]}}
+
+
+def make_page(rows, total_rows):
+    """Build a RunReportResponse with `rows` synthetic rows out of `total_rows`."""
+    from google.analytics.data_v1beta.types import MetricType, RunReportResponse
+
+    pb = RunReportResponse.pb()()
+    for name in DIMENSIONS:
+        pb.dimension_headers.add(name=name)
+    for name, metric_type in METRICS:
+        pb.metric_headers.add(name=name, type_=MetricType[metric_type].value)
+    for i in range(rows):
+        row = pb.rows.add()
+        row.dimension_values.add(value=COUNTRIES[i % len(COUNTRIES)])
+        row.dimension_values.add(value=f"City {i}")
+        row.dimension_values.add(value=DEVICES[i % len(DEVICES)])
+        row.metric_values.add(value=str(100 + i % 5000))
+        row.metric_values.add(value=str(50 + i % 3000))
+        row.metric_values.add(value=f"{(i % 1000) / 1000:.4f}")
+    pb.row_count = total_rows
+    return RunReportResponse.wrap(pb)
+
+
+class SyntheticClient:
+    """Stands in for the GA4 client: serves a report of total_rows rows page by page."""
+
+    def __init__(self, total_rows):
+        self.total_rows = total_rows
+        self.pages = {}
+
+    def run_report(self, request, **kwargs):
+        rows = max(0, min(request.limit or PAGE_SIZE, self.total_rows - request.offset))
+        page = self.pages.get(rows)
+        if page is None:
+            page = self.pages[rows] = make_page(rows, self.total_rows)
+        return page
+
+    def get_metadata(self, name):
+        raise RuntimeError("Synthetic property has no metadata; the bundled catalog is used")
+
+
+def report_request(server):
+    from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
+
+    return RunReportRequest(
+        property=f"properties/{server.GA4_PROPERTY_ID}",
+        dimensions=[Dimension(name=d) for d in DIMENSIONS],
+        metrics=[Metric(name=m) for m in METRIC_NAMES],
+        date_ranges=[DateRange(start_date="28daysAgo", end_date="yesterday")],
+    )
+
+
+def time_per_call(fn, calls=CALLS):
+    fn(0)
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls
+
+
+def per_call_cases(server):
+    from ga4_filters import FilterCompiler
+    from ga4_reports import build_order_bys, parse_order_bys
+
+    catalog = server.get_catalog()
+    compiler = FilterCompiler(catalog.dimensions, catalog.metrics)
+    dimensions_json = json.dumps(DIMENSIONS)
+    metrics_csv = ",".join(METRIC_NAMES)
+
+    cold_compiler = FilterCompiler(catalog.dimensions, catalog.metrics)
+
+    def cold_filter(i):
+        # A new value every call, so the memoized expressions never match
+        spec = {"filter": {"fieldName": "country", "stringFilter": {"value": f"Country {i}", "matchType": "EXACT"}}}
+        cold_compiler.compile(spec)
+
+    return {
+        "parse_fields": lambda i: (server._parse_fields(dimensions_json), server._parse_fields(metrics_csv)),
+        "order_bys": lambda i: build_order_bys(parse_order_bys('["-sessions", "country"]'), DIMENSIONS, METRIC_NAMES),
+        "filter_compile": cold_filter,
+        "filter_cached": lambda i: compiler.compile(json.dumps(FILTER)),
+        "prepare_report": lambda i: server._prepare_report(
+            dimensions_json, metrics_csv, "28daysAgo", "yesterday", json.dumps(FILTER), None, ["-sessions"]
+        ),
+    }
+
+
+def per_size_cases(server, size):
+    """Return {case: zero-argument callable} for a report of `size` rows."""
+    from ga4_columnar import ColumnarReport
+    from ga4_reports import iter_report_pages, iter_report_rows
+
+    client = SyntheticClient(size)
+    server.get_client = lambda credentials_path, property_id: client
+    rows = list(iter_report_rows(client, report_request(server)))
+    columnar = ColumnarReport.from_pages(iter_report_pages(client, report_request(server)))
+    cases = {
+        "rows": lambda: list(iter_report_rows(client, report_request(server))),
+        "columnar": lambda: ColumnarReport.from_pages(iter_report_pages(client, report_request(server))).to_dict(),
+        "get_ga4_data": lambda: server.get_ga4_data(
+            dimensions=DIMENSIONS, metrics=METRIC_NAMES, date_range_start="28daysAgo", date_range_end="yesterday",
+            use_cache=False, max_rows=size
+        ),
+        "json": lambda: json.dumps(rows),
+    }
+    try:
+        import pandas as pd
+        import ga4_api
+    except ImportError:
+        return cases
+    ga4_api.get_client = lambda credentials_path, property_id: client
+    cases.update({
+        "run_ga4_query": lambda: ga4_api.run_ga4_query(
+            "0", None, METRIC_NAMES, DIMENSIONS, "28daysAgo", "yesterday", use_cache=False
+        ),
+        "dataframe": lambda: pd.DataFrame.from_records(rows, columns=DIMENSIONS + METRIC_NAMES),
+        "dataframe_columnar": columnar.to_pandas,
+    })
+    return cases
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+        if isinstance(result, dict) and "error" in result:
+            raise RuntimeError(result["error"])
+        del result
+    return min(times)
+
+
+def peak_memory(fn):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def compare(results, baseline, tolerance):
+    """Print each case against the baseline and return the cases more than tolerance slower."""
+    regressions = []
+    print(f"\nCompared with baseline (tolerance {tolerance:.0%}):")
+    for group in ("per_call", "per_size"):
+        for case, result in results[group].items():
+            before = baseline.get(group, {}).get(case)
+            if not before:
+                continue
+            ratio = result["seconds"] / before["seconds"]
+            flag = "❌" if ratio > 1 + tolerance else "✅"
+            if ratio > 1 + tolerance:
+                regressions.append(case)
+            print(f"  {flag} {case:<32} {ratio:>6.2f}x")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the get_ga4_data and run_ga4_query hot paths.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated report sizes in rows (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best time is kept")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory runs")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as JSON, e.g. as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Compare with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    import ga4_mcp_server as server
+    server.get_client = lambda credentials_path, property_id: SyntheticClient(1)
+    results = {
+        "python": platform.python_version(), "platform": platform.platform(), "per_call": {}, "per_size": {},
+    }
+
+    print("⏱️  Per-call argument handling\n")
+    print(f"{'case':<20} {'us/call':>10} {'calls/s':>12}")
+    for case, fn in per_call_cases(server).items():
+        seconds = time_per_call(fn)
+        results["per_call"][case] = {"seconds": seconds}
+        print(f"{case:<20} {seconds * 1e6:>10.1f} {1 / seconds:>12,.0f}")
+
+    print(f"\n⏱️  Report paths, best of {args.repeat}\n")
+    print(f"{'case':<20} {'rows':>9} {'seconds':>9} {'rows/s':>12} {'peak MB':>9}")
+    for size in sizes:
+        for case, fn in per_size_cases(server, size).items():
+            if size <= PAGE_SIZE:
+                fn()  # warm up imports and page construction
+            seconds = best_time(fn, args.repeat)
+            peak = None if args.no_memory else peak_memory(fn)
+            results["per_size"][f"{case}@{size}"] = {"seconds": seconds, "rows": size, "peak_bytes": peak}
+            peak_text = "-" if peak is None else f"{peak / 1024 / 1024:.1f}"
+            print(f"{case:<20} {size:>9,} {seconds:>9.3f} {size / seconds:>12,.0f} {peak_text:>9}")
+        print()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} case(s) slower than the baseline: {', '.join(regressions)}")
+            return False
+        print("\n✅ No regressions")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Multi-property fan-out benchmark for the GA4 MCP server.
+
+Runs the same report through get_ga4_data(property_ids=[...]) for 1, 2, 4, ...
+properties, bypassing the report cache, and prints the wall time and
+throughput of each run. Concurrent fan-out should keep the wall time close to
+that of a single property until the worker limit (GA4_MAX_CONCURRENT_REPORTS)
+is reached.
+
+Usage:
+  python benchmark_properties.py PROPERTY_ID [PROPERTY_ID ...]   # live API, uses CREDENTIALS_PATH
+  python benchmark_properties.py --simulate [N] [LATENCY_MS]    # N fake properties, no credentials needed
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(HERE)
+
+DIMENSIONS = ["country"]
+METRICS = ["sessions", "totalUsers"]
+
+
+class SimulatedClient:
+    """Stands in for the GA4 client: answers every report after a fixed latency."""
+
+    def __init__(self, property_id, latency):
+        self.property_id = property_id
+        self.latency = latency
+
+    def run_report(self, request, **kwargs):
+        from google.analytics.data_v1beta.types import (
+            DimensionHeader, DimensionValue, MetricHeader, MetricValue, Row, RunReportResponse
+        )
+
+        time.sleep(self.latency)
+        rows = [
+            Row(dimension_values=[DimensionValue(value=f"Country {i}")],
+                metric_values=[MetricValue(value=str(100 + i)), MetricValue(value=str(50 + i))])
+            for i in range(20)
+        ]
+        return RunReportResponse(
+            dimension_headers=[DimensionHeader(name=d) for d in DIMENSIONS],
+            metric_headers=[MetricHeader(name=m) for m in METRICS],
+            rows=rows, row_count=len(rows),
+        )
+
+    def get_metadata(self, name):
+        raise RuntimeError("Simulated properties have no metadata; the bundled catalog is used")
+
+
+def run(server, property_ids):
+    start = time.perf_counter()
+    result = server.get_ga4_data(
+        dimensions=DIMENSIONS, metrics=METRICS, date_range_start="28daysAgo", date_range_end="yesterday",
+        use_cache=False, property_ids=property_ids,
+    )
+    elapsed = time.perf_counter() - start
+    if isinstance(result, dict):
+        raise RuntimeError(result.get("error") or result.get("errors"))
+    return elapsed, len(result)
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        return False
+
+    if args[0] == "--simulate":
+        count = int(args[1]) if len(args) > 1 else 32
+        latency = float(args[2]) / 1000 if len(args) > 2 else 0.25
+        # Keep the simulated run's metadata out of the real cache directory
+        os.environ["GA4_CACHE_DIR"] = tempfile.mkdtemp(prefix="ga4-benchmark-")
+        import ga4_mcp_server as server
+        server.get_client = lambda credentials_path, property_id: SimulatedClient(property_id, latency)
+        property_ids = [str(100000000 + i) for i in range(count)]
+        print(f"⏱️  Simulating {count} properties with {latency * 1000:.0f} ms per report...\n")
+    else:
+        import ga4_mcp_server as server
+        property_ids = args
+        print(f"⏱️  Fanning out over {len(property_ids)} live properties...\n")
+    # Warm up clients and the field catalogs, so the runs below only measure reports
+    try:
+        run(server, property_ids)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return False
+
+    sizes = []
+    n = 1
+    while n < len(property_ids):
+        sizes.append(n)
+        n *= 2
+    sizes.append(len(property_ids))
+
+    baseline = None
+    print(f"{'properties':>10} {'rows':>7} {'wall s':>8} {'reports/s':>10} {'vs serial':>10}")
+    for n in sizes:
+        try:
+            elapsed, rows = run(server, property_ids[:n])
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return False
+        baseline = baseline or elapsed
+        print(f"{n:>10} {rows:>7} {elapsed:>8.2f} {n / elapsed:>10.1f} {n * baseline / elapsed:>9.1f}x")
+    print(f"\nConcurrency limit: {server.MAX_CONCURRENT_REPORTS} properties at a time (GA4_MAX_CONCURRENT_REPORTS)")
+    return True
+
+
+if __name__ == "__main__":
+    main()
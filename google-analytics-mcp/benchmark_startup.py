@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the GA4 MCP server.
+
+MCP clients start the server once per session, so cold start is user-visible.
+This measures, over several fresh processes:
+  1. the time to import ga4_mcp_server (and whether the Google client stack was loaded), and
+  2. the time from spawning the server until the first list_dimension_categories
+     response arrives over stdio.
+
+Usage: python benchmark_startup.py [runs]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import ga4_mcp_server
+elapsed = time.perf_counter() - start
+heavy = sorted(m for m in ("google.analytics.data_v1beta", "grpc", "google.api_core", "pandas") if m in sys.modules)
+print(json.dumps([elapsed, heavy]))
+"""
+
+
+def measure_import():
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=HERE, capture_output=True, text=True, check=True
+    )
+    elapsed, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    return elapsed, heavy
+
+
+def send(process, message):
+    process.stdin.write(json.dumps(message) + "\n")
+    process.stdin.flush()
+
+
+def read_response(process, request_id):
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError("Server exited before responding (check CREDENTIALS_PATH in ga4_mcp_server.py)")
+        message = json.loads(line)
+        if message.get("id") == request_id:
+            return message
+
+
+def measure_first_call():
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "ga4_mcp_server.py"], cwd=HERE, text=True,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    try:
+        send(process, {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "protocolVersion": "2024-11-05", "capabilities": {},
+            "clientInfo": {"name": "benchmark_startup", "version": "1.0"},
+        }})
+        read_response(process, 1)
+        send(process, {"jsonrpc": "2.0", "method": "notifications/initialized"})
+        send(process, {"jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {
+            "name": "list_dimension_categories", "arguments": {},
+        }})
+        response = read_response(process, 2)
+        elapsed = time.perf_counter() - start
+        if "error" in response:
+            raise RuntimeError(f"list_dimension_categories failed: {response['error']}")
+        return elapsed
+    finally:
+        process.kill()
+        process.wait()
+
+
+def summarize(label, values):
+    print(f"{label}: median {statistics.median(values) * 1000:.0f} ms, "
+          f"min {min(values) * 1000:.0f} ms, max {max(values) * 1000:.0f} ms")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"⏱️  Measuring GA4 MCP server startup over {runs} runs...\n")
+
+    imports = [measure_import() for _ in range(runs)]
+    summarize("Import ga4_mcp_server", [elapsed for elapsed, _ in imports])
+    heavy = imports[-1][1]
+    print(f"Heavy modules loaded at import: {', '.join(heavy) or 'none'}")
+
+    try:
+        summarize("Spawn to first list_dimension_categories", [measure_first_call() for _ in range(runs)])
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    main()
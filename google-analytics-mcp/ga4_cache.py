@@ -0,0 +1,287 @@
+"""
+Persistent on-disk cache for GA4 report results.
+
+Results are stored in a SQLite file under GA4_CACHE_DIR (default
+~/.cache/ga4-mcp), keyed by a hash of the normalized request: property, sorted
+dimensions and metrics, resolved date range and canonical filter JSON. Entries
+for closed historical ranges live for days; ranges that touch today or the
+last few days, which GA4 is still processing, expire within minutes or an hour.
+The file is kept under a size budget by evicting least recently used entries.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from ga4_reports import resolve_date
+from ga4_singleflight import report_flights
+from ga4_telemetry import increment, phase
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ga4-mcp")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Time-to-live by how recent the end of the date range is. GA4 keeps
+# revising data for roughly 72 hours after it is collected.
+TODAY_TTL = 5 * 60
+RECENT_TTL = 60 * 60
+HISTORICAL_TTL = 7 * 24 * 60 * 60
+RECENT_DAYS = 3
+
+
+def canonical_json(value):
+    """
+    Serialize a value to JSON with sorted keys and no whitespace, for hashing.
+
+    A string holding JSON (as MCP clients often send filters) is parsed first,
+    so it produces the same output as the equivalent dict.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            pass
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _normalize_date(value, today=None):
+    """Resolve a date to ISO format, leaving strings the API would reject untouched."""
+    try:
+        return resolve_date(value, today).isoformat()
+    except ValueError:
+        return str(value)
+
+
+def normalize_date_ranges(date_ranges, today=None):
+    """Resolve a list of (start, end) pairs to absolute ISO date strings."""
+    return [(_normalize_date(start, today), _normalize_date(end, today)) for start, end in date_ranges]
+
+
+def report_cache_key(property_id, dimensions, metrics, date_ranges, dimension_filter=None, extra=None, today=None,
+                     metric_filter=None):
+    """
+    Build the content-addressed cache key for a report request.
+
+    Args:
+        property_id: GA4 property ID.
+        dimensions: Dimension names. Order does not affect the key.
+        metrics: Metric names. Order does not affect the key.
+        date_ranges: List of (start, end) date strings; relative dates are resolved first.
+        dimension_filter: Optional filter as a dict or JSON string.
+        extra: Optional dict of further request options that change the result (e.g. row caps).
+        today: Optional date used to resolve relative dates.
+        metric_filter: Optional metric filter as a dict or JSON string.
+
+    Returns:
+        Hex SHA-256 digest identifying the request.
+    """
+    normalized = {
+        "property": str(property_id),
+        "dimensions": sorted(dimensions),
+        "metrics": sorted(metrics),
+        "date_ranges": normalize_date_ranges(date_ranges, today),
+        "dimension_filter": json.loads(canonical_json(dimension_filter)) if dimension_filter else None,
+        "metric_filter": json.loads(canonical_json(metric_filter)) if metric_filter else None,
+        "extra": extra or None,
+    }
+    return hashlib.sha256(canonical_json(normalized).encode("utf-8")).hexdigest()
+
+
+def ttl_for_date_ranges(date_ranges, today=None):
+    """Pick a TTL in seconds from the most recent end date across the ranges."""
+    today = today or date.today()
+    try:
+        latest_end = max(resolve_date(end, today) for _, end in date_ranges)
+    except ValueError:
+        return TODAY_TTL
+    if latest_end >= today:
+        return TODAY_TTL
+    if latest_end >= today - timedelta(days=RECENT_DAYS):
+        return RECENT_TTL
+    return HISTORICAL_TTL
+
+
+class ReportCache:
+    """SQLite-backed report cache with TTL expiry, LRU size eviction and hit/miss counters."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reports_last_access ON reports (last_access)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @phase("cache_read")
+    def get(self, key, record_stats=True):
+        """Return the cached rows for a key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM reports WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+                    self._conn.commit()
+                if record_stats:
+                    self.misses += 1
+                    increment("ga4_cache_lookups_total", result="miss")
+                return None
+            self._conn.execute("UPDATE reports SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            if record_stats:
+                self.hits += 1
+                increment("ga4_cache_lookups_total", result="hit")
+        return json.loads(row[0])
+
+    @phase("cache_write")
+    def put(self, key, rows, ttl):
+        """Store rows under a key for ttl seconds, evicting old entries if over budget."""
+        value = json.dumps(rows, separators=(",", ":")).encode("utf-8")
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (key, value, size, created_at, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now + ttl, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        self._conn.execute("DELETE FROM reports WHERE expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM reports").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM reports ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove every cached report."""
+        with self._lock:
+            self._conn.execute("DELETE FROM reports")
+            self._conn.commit()
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current size of the cache."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reports").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_report_cache():
+    """
+    Return the process-wide report cache, creating it on first use.
+
+    Location and size come from GA4_CACHE_DIR and GA4_CACHE_MAX_MB. Returns
+    None if the cache cannot be opened, so callers fall back to the API.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache_dir = os.environ.get("GA4_CACHE_DIR", DEFAULT_CACHE_DIR)
+                max_bytes = int(float(os.environ.get("GA4_CACHE_MAX_MB", DEFAULT_MAX_BYTES / (1024 * 1024))) * 1024 * 1024)
+                try:
+                    _cache = ReportCache(os.path.join(cache_dir, "reports.sqlite3"), max_bytes)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"DEBUG: Report cache disabled: {e}", file=sys.stderr)
+                    return None
+    return _cache
+
+
+def cached_report(key, date_ranges, fetch, use_cache=True):
+    """
+    Return the cached rows for key, or call fetch() and cache what it returns.
+
+    Concurrent misses for the same key are coalesced: one caller runs fetch()
+    and the others wait for and share its result.
+
+    Args:
+        key: Cache key from report_cache_key.
+        date_ranges: The request's (start, end) pairs, used to choose the TTL.
+        fetch: Zero-argument callable that runs the report and returns a list of rows.
+        use_cache: If False, skip the cache lookup and store (concurrent calls are still coalesced).
+
+    Returns:
+        List of row dictionaries.
+    """
+    cache = get_report_cache() if use_cache else None
+    if cache is not None:
+        rows = cache.get(key)
+        if rows is not None:
+            return rows
+
+    def fetch_and_store():
+        # A flight for this key may have finished between the lookup above and now
+        rows = cache.get(key, record_stats=False) if cache is not None else None
+        if rows is None:
+            rows = fetch()
+            if cache is not None:
+                cache.put(key, rows, ttl_for_date_ranges(date_ranges))
+        return rows
+
+    return report_flights.do(key, fetch_and_store)
+
+
+async def cached_report_async(key, date_ranges, fetch, use_cache=True):
+    """
+    Async counterpart of cached_report.
+
+    Args:
+        key: Cache key from report_cache_key.
+        date_ranges: The request's (start, end) pairs, used to choose the TTL.
+        fetch: Zero-argument coroutine function that runs the report and returns a list of rows.
+        use_cache: If False, skip the cache lookup and store (concurrent calls are still coalesced).
+
+    Returns:
+        List of row dictionaries.
+    """
+    cache = get_report_cache() if use_cache else None
+    if cache is not None:
+        rows = await asyncio.to_thread(cache.get, key)
+        if rows is not None:
+            return rows
+
+    async def fetch_and_store():
+        rows = await asyncio.to_thread(cache.get, key, False) if cache is not None else None
+        if rows is None:
+            rows = await fetch()
+            if cache is not None:
+                await asyncio.to_thread(cache.put, key, rows, ttl_for_date_ranges(date_ranges))
+        return rows
+
+    return await report_flights.do_async(key, fetch_and_store)
@@ -0,0 +1,203 @@
+"""
+Process-wide pool of GA4 Data API clients.
+
+Constructing a BetaAnalyticsDataClient reads the service account key, redoes
+auth and opens a new gRPC channel. The pool builds one client per
+(credentials, property) pair on first use and hands the same instance back on
+every later call. The key file is parsed once, and each pooled client keeps
+its access token until it expires, so repeat reports skip both the file read
+and the auth round trip. Both the MCP server and the Streamlit data layer use
+this module.
+
+Async clients (BetaAnalyticsDataAsyncClient) are pooled the same way, but
+also per event loop, because a gRPC asyncio channel cannot be shared across
+loops.
+"""
+import asyncio
+import atexit
+import sys
+import threading
+import time
+
+from google.analytics.data_v1beta import BetaAnalyticsDataAsyncClient, BetaAnalyticsDataClient
+
+from ga4_telemetry import increment
+
+# Read-only scope is all the Data API needs
+GA4_SCOPES = ["https://www.googleapis.com/auth/analytics.readonly"]
+
+
+class ClientPool:
+    """Thread-safe pool of lazily created BetaAnalyticsDataClient instances."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._credentials = {}
+
+    def _load_credentials(self, credentials_path):
+        """Load (once) the credentials for a key file, or application default credentials."""
+        creds = self._credentials.get(credentials_path)
+        if creds is None:
+            if credentials_path:
+                from google.oauth2 import service_account
+                creds = service_account.Credentials.from_service_account_file(credentials_path, scopes=GA4_SCOPES)
+            else:
+                import google.auth
+                creds, _ = google.auth.default(scopes=GA4_SCOPES)
+            self._credentials[credentials_path] = creds
+        return creds
+
+    def get_client(self, credentials_path=None, property_id=None):
+        """
+        Return the pooled client for a credentials file and property, creating it on first use.
+
+        Args:
+            credentials_path: Path to a service account JSON key. None uses application default credentials.
+            property_id: GA4 property ID the client will be used for.
+
+        Returns:
+            A BetaAnalyticsDataClient shared by every caller with the same key.
+        """
+        key = (credentials_path or None, str(property_id) if property_id else None)
+        return self._get_pooled(key, BetaAnalyticsDataClient)
+
+    def get_async_client(self, credentials_path=None, property_id=None):
+        """
+        Return the pooled async client for a credentials file and property on the running event loop.
+
+        Must be called from a coroutine. Clients are created lazily, one per event loop.
+
+        Args:
+            credentials_path: Path to a service account JSON key. None uses application default credentials.
+            property_id: GA4 property ID the client will be used for.
+
+        Returns:
+            A BetaAnalyticsDataAsyncClient bound to the current event loop.
+        """
+        loop = asyncio.get_running_loop()
+        key = (credentials_path or None, str(property_id) if property_id else None, id(loop))
+        return self._get_pooled(key, BetaAnalyticsDataAsyncClient)
+
+    def _get_pooled(self, key, client_class):
+        """Look up a pooled client by key, creating it with client_class on first use."""
+        entry = self._clients.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._clients.get(key)
+                if entry is None:
+                    creds = self._load_credentials(key[0])
+                    entry = {
+                        "client": client_class(credentials=creds),
+                        "credentials": creds,
+                        "created_at": time.time(),
+                        "last_used": None,
+                        "uses": 0,
+                        "is_async": client_class is BetaAnalyticsDataAsyncClient,
+                    }
+                    self._clients[key] = entry
+                    increment("ga4_clients_created_total", client=client_class.__name__)
+        entry["last_used"] = time.time()
+        entry["uses"] += 1
+        return entry["client"]
+
+    def health_check(self, refresh=False):
+        """
+        Report the state of every pooled client.
+
+        Args:
+            refresh: If True, refresh expired or missing access tokens so auth problems show up here
+                     rather than on the next report.
+
+        Returns:
+            List of dictionaries, one per pooled client, with usage counters and token status.
+        """
+        with self._lock:
+            items = list(self._clients.items())
+        status = []
+        for key, entry in items:
+            credentials_path, property_id = key[0], key[1]
+            creds = entry["credentials"]
+            error = None
+            if refresh and not creds.valid:
+                try:
+                    from google.auth.transport.requests import Request
+                    creds.refresh(Request())
+                except Exception as e:
+                    error = str(e)
+            expiry = getattr(creds, "expiry", None)
+            status.append({
+                "credentials_path": credentials_path,
+                "property_id": property_id,
+                "async": entry["is_async"],
+                "uses": entry["uses"],
+                "age_seconds": round(time.time() - entry["created_at"], 1),
+                "token_valid": bool(creds.valid),
+                "token_expiry": expiry.isoformat() if expiry else None,
+                "healthy": error is None,
+                "error": error,
+            })
+        return status
+
+    def shutdown(self):
+        """
+        Close every pooled sync client's transport and empty the pool.
+
+        Async clients are dropped without awaiting their close; use shutdown_async
+        from the owning event loop to close them cleanly.
+        """
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+            self._credentials.clear()
+        for entry in entries:
+            if entry["is_async"]:
+                continue
+            try:
+                entry["client"].transport.close()
+            except Exception as e:
+                print(f"DEBUG: Error closing GA4 client: {e}", file=sys.stderr)
+
+    async def shutdown_async(self):
+        """Close the async clients bound to the running event loop, then the rest of the pool."""
+        loop_id = id(asyncio.get_running_loop())
+        with self._lock:
+            keys = [key for key, entry in self._clients.items() if entry["is_async"] and key[2] == loop_id]
+            entries = [self._clients.pop(key) for key in keys]
+        for entry in entries:
+            try:
+                await entry["client"].transport.close()
+            except Exception as e:
+                print(f"DEBUG: Error closing GA4 async client: {e}", file=sys.stderr)
+        self.shutdown()
+
+
+_pool = ClientPool()
+
+
+def get_client(credentials_path=None, property_id=None):
+    """Return the process-wide pooled client for the given credentials and property."""
+    return _pool.get_client(credentials_path, property_id)
+
+
+def get_async_client(credentials_path=None, property_id=None):
+    """Return the process-wide pooled async client for the running event loop."""
+    return _pool.get_async_client(credentials_path, property_id)
+
+
+def health_check(refresh=False):
+    """Health report for the process-wide pool. See ClientPool.health_check."""
+    return _pool.health_check(refresh)
+
+
+def shutdown():
+    """Close all clients in the process-wide pool."""
+    _pool.shutdown()
+
+
+async def shutdown_async():
+    """Close all clients in the process-wide pool, awaiting async clients on this loop."""
+    await _pool.shutdown_async()
+
+
+atexit.register(shutdown)
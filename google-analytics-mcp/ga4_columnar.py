@@ -0,0 +1,161 @@
+"""
+Columnar, typed representation of GA4 report results.
+
+The default row format turns every cell into a string in a per-row dict, and
+callers then parse the numbers back out. ColumnarReport instead decodes each
+page of a RunReportResponse straight into one typed array per metric (int64
+for TYPE_INTEGER, float64 for every other metric type) and one
+dictionary-encoded column per dimension (distinct values plus int32 codes).
+It can be serialized to a compact JSON dict for MCP clients, or converted to a
+pandas DataFrame or pyarrow Table without re-parsing any strings.
+"""
+import math
+from array import array
+
+from ga4_telemetry import phase
+
+OUTPUT_FORMATS = ("rows", "columnar")
+
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value)) if value else 0
+
+
+def _parse_float(value):
+    return float(value) if value else math.nan
+
+
+class ColumnarReport:
+    """Accumulates report pages into typed metric arrays and dictionary-encoded dimensions."""
+
+    def __init__(self, dimension_names, metric_names, metric_types):
+        self.dimension_names = list(dimension_names)
+        self.metric_names = list(metric_names)
+        self.metric_types = list(metric_types)
+        self.row_count = 0
+        self._dictionaries = [[] for _ in self.dimension_names]
+        self._lookups = [{} for _ in self.dimension_names]
+        self._codes = [array("i") for _ in self.dimension_names]
+        self._values = [array("q" if t == "TYPE_INTEGER" else "d") for t in self.metric_types]
+
+    @classmethod
+    def from_response(cls, response):
+        """Create an empty report with the headers (names and metric types) of a response."""
+        from google.analytics.data_v1beta.types import MetricType
+
+        return cls(
+            [h.name for h in response.dimension_headers],
+            [h.name for h in response.metric_headers],
+            [MetricType(h.type_).name for h in response.metric_headers],
+        )
+
+    @classmethod
+    def from_pages(cls, pages):
+        """Build a report from an iterable of RunReportResponse pages (e.g. iter_report_pages)."""
+        report = None
+        for response in pages:
+            if report is None:
+                report = cls.from_response(response)
+            report.add_response(response)
+        return report
+
+    @phase("decode")
+    def add_response(self, response):
+        """Decode one page of rows into the columns."""
+        for i, codes in enumerate(self._codes):
+            lookup = self._lookups[i]
+            dictionary = self._dictionaries[i]
+            for row in response.rows:
+                if i >= len(row.dimension_values):
+                    codes.append(-1)
+                    continue
+                value = row.dimension_values[i].value
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(dictionary)
+                    dictionary.append(value)
+                codes.append(code)
+        for i, values in enumerate(self._values):
+            parse = _parse_int if values.typecode == "q" else _parse_float
+            missing = 0 if values.typecode == "q" else math.nan
+            values.extend(
+                parse(row.metric_values[i].value) if i < len(row.metric_values) else missing
+                for row in response.rows
+            )
+        self.row_count += len(response.rows)
+
+    def to_dict(self):
+        """
+        Return a JSON-serializable dict of the columns.
+
+        Dimensions come back as {"dictionary": [...distinct values], "codes": [...]} where code -1
+        means the value was missing; metrics as {"type": "TYPE_INTEGER", "values": [...]}.
+        NaN metric values are returned as None.
+        """
+        return {
+            "format": "columnar",
+            "row_count": self.row_count,
+            "dimensions": {
+                name: {"dictionary": list(self._dictionaries[i]), "codes": self._codes[i].tolist()}
+                for i, name in enumerate(self.dimension_names)
+            },
+            "metrics": {
+                name: {
+                    "type": self.metric_types[i],
+                    "values": [None if isinstance(v, float) and math.isnan(v) else v for v in self._values[i]],
+                }
+                for i, name in enumerate(self.metric_names)
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a report from the output of to_dict (e.g. after a cache round trip)."""
+        dims = data.get("dimensions", {})
+        mets = data.get("metrics", {})
+        report = cls(list(dims), list(mets), [m["type"] for m in mets.values()])
+        for i, column in enumerate(dims.values()):
+            report._dictionaries[i] = list(column["dictionary"])
+            report._lookups[i] = {v: c for c, v in enumerate(column["dictionary"])}
+            report._codes[i] = array("i", column["codes"])
+        for i, column in enumerate(mets.values()):
+            typecode = report._values[i].typecode
+            report._values[i] = array(typecode, (math.nan if v is None else v for v in column["values"]))
+        report.row_count = data.get("row_count", 0)
+        return report
+
+    def to_pandas(self):
+        """Return a DataFrame with categorical dimension columns and int64/float64 metric columns."""
+        import numpy as np
+        import pandas as pd
+
+        columns = {}
+        for i, name in enumerate(self.dimension_names):
+            columns[name] = pd.Categorical.from_codes(
+                np.frombuffer(self._codes[i], dtype=np.int32), categories=pd.Index(self._dictionaries[i])
+            )
+        for i, name in enumerate(self.metric_names):
+            dtype = np.int64 if self._values[i].typecode == "q" else np.float64
+            columns[name] = np.frombuffer(self._values[i], dtype=dtype)
+        return pd.DataFrame(columns, index=pd.RangeIndex(self.row_count))
+
+    def to_arrow(self):
+        """Return a pyarrow Table with dictionary-encoded dimensions. Requires pyarrow."""
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("pyarrow is required for Arrow output: pip install pyarrow")
+        import numpy as np
+
+        arrays = []
+        for i in range(len(self.dimension_names)):
+            codes = np.frombuffer(self._codes[i], dtype=np.int32)
+            codes = pa.array(codes, mask=codes == -1, type=pa.int32())
+            arrays.append(pa.DictionaryArray.from_arrays(codes, pa.array(self._dictionaries[i], type=pa.string())))
+        for i in range(len(self.metric_names)):
+            dtype = np.int64 if self._values[i].typecode == "q" else np.float64
+            arrays.append(pa.array(np.frombuffer(self._values[i], dtype=dtype)))
+        return pa.Table.from_arrays(arrays, names=self.dimension_names + self.metric_names)
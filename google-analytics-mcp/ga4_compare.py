@@ -0,0 +1,126 @@
+"""
+Period-over-period comparisons from a single multi-range report.
+
+A RunReportRequest accepts up to four named date ranges; the API then adds a
+"dateRange" dimension holding each row's range name. compare_date_ranges
+regroups those rows by the remaining dimensions, with each range's metric
+values side by side and the change of the first (primary) range against every
+other range precomputed, so "this week vs last week" is one API call instead
+of two reports joined by the caller.
+"""
+import json
+
+from ga4_reports import resolve_date
+
+# The Data API accepts at most four date ranges per report, and only adds the dateRange
+# dimension when there are at least two
+MIN_DATE_RANGES = 2
+MAX_DATE_RANGES = 4
+
+# Dimension the API adds to multi-range reports, holding the range name
+DATE_RANGE_DIMENSION = "dateRange"
+
+
+def parse_date_ranges(spec):
+    """
+    Parse the date_ranges argument.
+
+    Args:
+        spec: List (or JSON string) of {"name", "start", "end"} dicts; "startDate"/"endDate" are also
+              accepted. Names default to "range_1", "range_2", ... The first range is the primary one.
+
+    Returns:
+        List of (name, start, end) tuples.
+
+    Raises:
+        ValueError: If the spec is malformed, has fewer than MIN_DATE_RANGES or more than MAX_DATE_RANGES
+                    ranges, repeats a name, or has an invalid or reversed range.
+    """
+    if isinstance(spec, str):
+        try:
+            spec = json.loads(spec)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Failed to parse date_ranges JSON: {e}")
+    if not isinstance(spec, list) or not spec:
+        raise ValueError("date_ranges must be a non-empty list of {\"name\", \"start\", \"end\"} objects.")
+    if len(spec) < MIN_DATE_RANGES:
+        raise ValueError(f"date_ranges needs at least {MIN_DATE_RANGES} ranges to compare, got {len(spec)}; "
+                         "use date_range_start/date_range_end for a single range.")
+    if len(spec) > MAX_DATE_RANGES:
+        raise ValueError(f"date_ranges accepts at most {MAX_DATE_RANGES} ranges, got {len(spec)}.")
+
+    ranges = []
+    for i, item in enumerate(spec):
+        if not isinstance(item, dict):
+            raise ValueError(f"date_ranges[{i}] must be an object with start and end.")
+        name = str(item.get("name") or f"range_{i + 1}")
+        start = item.get("start", item.get("startDate"))
+        end = item.get("end", item.get("endDate"))
+        if not start or not end:
+            raise ValueError(f"date_ranges[{i}] needs both start and end.")
+        if name.startswith("date_range_") or name in [r[0] for r in ranges]:
+            raise ValueError(f"date_ranges[{i}]: name '{name}' is reserved or already used.")
+        if resolve_date(start) > resolve_date(end):
+            raise ValueError(f"date_ranges[{i}]: start ({start}) is after end ({end}).")
+        ranges.append((name, str(start), str(end)))
+    return ranges
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _change(current, previous):
+    current, previous = _number(current), _number(previous)
+    if current is None or previous is None:
+        return {"delta": None, "pct_change": None}
+    delta = current - previous
+    if delta.is_integer():
+        delta = int(delta)
+    pct_change = round(delta / previous * 100, 2) if previous else None
+    return {"delta": delta, "pct_change": pct_change}
+
+
+def compare_date_ranges(rows, dimensions, metrics, ranges):
+    """
+    Regroup the rows of a multi-range report into one row per dimension combination.
+
+    Args:
+        rows: Row dicts of the report, each with a "dateRange" value naming its range.
+        dimensions: Requested dimensions (without dateRange).
+        metrics: Requested metrics.
+        ranges: (name, start, end) tuples from parse_date_ranges; the first is the primary range.
+
+    Returns:
+        Dictionary with "date_ranges" ({name: {"start", "end"}}) and "rows". Each row holds the
+        dimension values, "values" ({range: {metric: value}}, value None if the range had no row)
+        and "changes" ({other range: {metric: {"delta", "pct_change"}}}), comparing the primary
+        range against each other range. pct_change is None when the other range's value is 0.
+    """
+    names = [name for name, _, _ in ranges]
+    primary, others = names[0], names[1:]
+    grouped = {}
+    for row in rows:
+        key = tuple(row.get(d) for d in dimensions)
+        values = grouped.setdefault(key, {name: None for name in names})
+        values[row.get(DATE_RANGE_DIMENSION)] = {m: row.get(m) for m in metrics}
+
+    result_rows = []
+    for key, values in grouped.items():
+        empty = {m: None for m in metrics}
+        values = {name: values.get(name) or empty for name in names}
+        result_rows.append({
+            **dict(zip(dimensions, key)),
+            "values": values,
+            "changes": {
+                other: {m: _change(values[primary][m], values[other][m]) for m in metrics}
+                for other in others
+            },
+        })
+    return {
+        "date_ranges": {name: {"start": start, "end": end} for name, start, end in ranges},
+        "rows": result_rows,
+    }
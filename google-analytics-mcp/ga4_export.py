@@ -0,0 +1,183 @@
+"""
+Streaming export of GA4 reports to CSV or Parquet files.
+
+Reports are written page by page as iter_report_pages fetches them, so only
+one page of rows is in memory however large the report is. CSV is written
+through the csv module (optionally gzip-compressed) and Parquet with one row
+group per page, with dimensions dictionary-encoded as in ColumnarReport;
+several reports can also be streamed into the CSV members of one ZIP file.
+Files are written under a temporary name and renamed when complete, so a
+failed export never leaves a truncated file behind. Exports only go inside
+the export directory and never replace an existing file.
+"""
+import csv
+import gzip
+import itertools
+import os
+import re
+import time
+
+from ga4_cache import DEFAULT_CACHE_DIR
+from ga4_columnar import ColumnarReport
+
+EXPORT_FORMATS = ("csv", "csv.gz", "parquet")
+
+
+_export_ids = itertools.count(1)
+
+
+def export_dir():
+    """Return GA4_EXPORT_DIR (default: the exports folder of the cache directory)."""
+    return os.environ.get("GA4_EXPORT_DIR") or os.path.join(
+        os.environ.get("GA4_CACHE_DIR", DEFAULT_CACHE_DIR), "exports"
+    )
+
+
+def default_export_path(file_format, name="ga4-report"):
+    """Return a new file path under the export directory."""
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(export_dir(), f"{name}-{stamp}-{os.getpid()}-{next(_export_ids)}.{file_format}")
+
+
+def resolve_export_path(output_path):
+    """
+    Resolve a requested export path inside the export directory.
+
+    Relative paths are taken from the export directory; absolute paths must point inside it.
+
+    Raises:
+        ValueError: If the path contains '..' or resolves (following symlinks) outside the export directory.
+    """
+    base = os.path.realpath(export_dir())
+    if ".." in re.split(r"[\\/]", str(output_path)):
+        raise ValueError("output_path may not contain '..'.")
+    path = os.path.realpath(os.path.join(base, str(output_path)))
+    if path == base or os.path.commonpath([base, path]) != base:
+        raise ValueError(f"output_path must be a file inside the export directory {base}.")
+    return path
+
+
+def _write_csv(pages, f):
+    writer = csv.writer(f)
+    rows = 0
+    for page_number, response in enumerate(pages):
+        if page_number == 0:
+            writer.writerow([h.name for h in response.dimension_headers] + [h.name for h in response.metric_headers])
+        writer.writerows(
+            [v.value for v in row.dimension_values] + [v.value for v in row.metric_values] for row in response.rows
+        )
+        rows += len(response.rows)
+    return rows
+
+
+def _write_parquet(pages, path, compression):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is required for Parquet export: pip install pyarrow")
+
+    writer = None
+    rows = 0
+    try:
+        for response in pages:
+            page = ColumnarReport.from_response(response)
+            page.add_response(response)
+            table = page.to_arrow()
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression=compression)
+            writer.write_table(table)
+            rows += page.row_count
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _write_new_file(path, write):
+    """
+    Create path by calling write(partial_path) and return (absolute path, write's result).
+
+    The file is written under a temporary name and linked into place when complete, so a failed
+    export leaves nothing behind and an existing file is never replaced.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists; choose another output_path.")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.part"
+    try:
+        result = write(partial)
+        # A hard link fails if the file appeared meanwhile, where a rename would replace it
+        os.link(partial, path)
+        os.remove(partial)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return path, result
+
+
+def export_pages(pages, path, file_format="csv.gz", compression="zstd"):
+    """
+    Stream report pages into a file.
+
+    Args:
+        pages: Iterable of RunReportResponse pages, e.g. from iter_report_pages.
+        path: Destination file path; parent directories are created. An existing file is never replaced.
+        file_format: 'csv', 'csv.gz' (gzip-compressed CSV) or 'parquet'.
+        compression: Parquet compression codec ('zstd', 'snappy', 'gzip' or 'none').
+
+    Returns:
+        Dictionary with the path, format, number of rows and file size in bytes.
+
+    Raises:
+        ValueError: If file_format is not supported.
+        FileExistsError: If path already exists.
+        ImportError: If Parquet is requested and pyarrow is not installed.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"file_format must be one of {list(EXPORT_FORMATS)}, got '{file_format}'.")
+
+    def write(partial):
+        if file_format == "parquet":
+            return _write_parquet(pages, partial, compression)
+        if file_format == "csv.gz":
+            with gzip.open(partial, "wt", newline="", encoding="utf-8") as f:
+                return _write_csv(pages, f)
+        with open(partial, "w", newline="", encoding="utf-8") as f:
+            return _write_csv(pages, f)
+
+    path, rows = _write_new_file(path, write)
+    return {"path": path, "format": file_format, "rows": rows, "size_bytes": os.path.getsize(path)}
+
+
+def export_pages_zip(members, path):
+    """
+    Stream several reports into CSV members of one ZIP file.
+
+    Each member's pages are written into its compressed entry as they are fetched, so only
+    one page of rows is in memory at a time.
+
+    Args:
+        members: Mapping of member name (e.g. 'users.csv') to an iterable of RunReportResponse pages.
+        path: Destination ZIP path; parent directories are created. An existing file is never replaced.
+
+    Returns:
+        Dictionary with the path, number of rows per member and file size in bytes.
+
+    Raises:
+        FileExistsError: If path already exists.
+    """
+    import io
+    import zipfile
+
+    def write(partial):
+        rows = {}
+        with zipfile.ZipFile(partial, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for name, pages in members.items():
+                with zf.open(name, "w") as member, io.TextIOWrapper(member, encoding="utf-8", newline="") as text:
+                    rows[name] = _write_csv(pages, text)
+        return rows
+
+    path, rows = _write_new_file(path, write)
+    return {"path": path, "rows": rows, "size_bytes": os.path.getsize(path)}
@@ -0,0 +1,173 @@
+"""
+Compiler from GA4 filter JSON to FilterExpression protos.
+
+Filters use the Data API's JSON shape (andGroup / orGroup / notExpression /
+filter), with stringFilter, inListFilter, numericFilter, betweenFilter and
+emptyFilter leaves. Field names are validated against frozen sets of known
+dimensions and metrics built once per compiler, and problems are reported as
+FilterError with the path of the offending node. Compiled expressions are
+memoized by canonical JSON, so repeating a filter costs one dictionary lookup.
+"""
+import difflib
+import json
+from functools import lru_cache
+
+from google.analytics.data_v1beta.types import Filter, FilterExpression, FilterExpressionList, NumericValue
+
+from ga4_cache import canonical_json
+
+STRING_MATCH_TYPES = {name: Filter.StringFilter.MatchType[name] for name in (
+    "EXACT", "BEGINS_WITH", "ENDS_WITH", "CONTAINS", "FULL_REGEXP", "PARTIAL_REGEXP"
+)}
+NUMERIC_OPERATIONS = {name: Filter.NumericFilter.Operation[name] for name in (
+    "EQUAL", "LESS_THAN", "LESS_THAN_OR_EQUAL", "GREATER_THAN", "GREATER_THAN_OR_EQUAL"
+)}
+
+# Compiled expressions kept per compiler
+FILTER_CACHE_SIZE = 512
+
+
+class FilterError(ValueError):
+    """Raised when a filter cannot be compiled; the message names the offending node."""
+
+
+class FilterCompiler:
+    """Validates and compiles filter JSON against a fixed set of dimension and metric names."""
+
+    def __init__(self, dimension_names, metric_names):
+        self.dimensions = frozenset(dimension_names)
+        self.metrics = frozenset(metric_names)
+        self._compile_canonical = lru_cache(maxsize=FILTER_CACHE_SIZE)(self._compile_canonical_uncached)
+
+    def compile(self, spec, kind="dimension"):
+        """
+        Compile a filter to a FilterExpression.
+
+        Args:
+            spec: Filter as a dict or JSON string.
+            kind: "dimension" for dimension_filter (fields must be dimensions) or
+                  "metric" for metric_filter (fields must be metrics).
+
+        Returns:
+            The compiled FilterExpression. Identical filters return the same cached object.
+
+        Raises:
+            FilterError: If the JSON is malformed, a node is not understood, or a field is unknown.
+        """
+        if isinstance(spec, str):
+            try:
+                spec = json.loads(spec)
+            except json.JSONDecodeError as e:
+                raise FilterError(f"Failed to parse {kind}_filter JSON: {e}")
+        if not isinstance(spec, dict):
+            raise FilterError(f"{kind}_filter must be a JSON object or dict.")
+        return self._compile_canonical(canonical_json(spec), kind)
+
+    def cache_info(self):
+        """Hit/miss statistics of the compiled-filter cache."""
+        return self._compile_canonical.cache_info()
+
+    def _compile_canonical_uncached(self, canonical, kind):
+        return self._build(json.loads(canonical), kind, f"{kind}_filter")
+
+    def _build(self, expr, kind, path):
+        if not isinstance(expr, dict):
+            raise FilterError(f"{path}: expected an object, got {type(expr).__name__}.")
+        for group in ("andGroup", "orGroup"):
+            if group in expr:
+                children = (expr[group] or {}).get("expressions")
+                if not isinstance(children, list) or not children:
+                    raise FilterError(f"{path}.{group}: 'expressions' must be a non-empty list.")
+                expressions = [
+                    self._build(child, kind, f"{path}.{group}.expressions[{i}]") for i, child in enumerate(children)
+                ]
+                if group == "andGroup":
+                    return FilterExpression(and_group=FilterExpressionList(expressions=expressions))
+                return FilterExpression(or_group=FilterExpressionList(expressions=expressions))
+        if "notExpression" in expr:
+            return FilterExpression(not_expression=self._build(expr["notExpression"], kind, f"{path}.notExpression"))
+        if "filter" in expr:
+            return FilterExpression(filter=self._build_leaf(expr["filter"], kind, f"{path}.filter"))
+        raise FilterError(
+            f"{path}: expected one of 'andGroup', 'orGroup', 'notExpression' or 'filter', got {sorted(expr)}."
+        )
+
+    def _build_leaf(self, f, kind, path):
+        if not isinstance(f, dict):
+            raise FilterError(f"{path}: expected an object.")
+        field = f.get("fieldName")
+        if not field:
+            raise FilterError(f"{path}: missing 'fieldName'.")
+        valid = self.dimensions if kind == "dimension" else self.metrics
+        if field not in valid:
+            message = f"{path}: unknown {kind} '{field}'."
+            other = "metric" if kind == "dimension" else "dimension"
+            if field in (self.metrics if kind == "dimension" else self.dimensions):
+                message += f" '{field}' is a {other}; filter it with {other}_filter."
+            else:
+                suggestions = difflib.get_close_matches(field, valid, n=3)
+                if suggestions:
+                    message += f" Did you mean: {', '.join(suggestions)}?"
+            raise FilterError(message)
+
+        if "stringFilter" in f:
+            sf = f["stringFilter"] or {}
+            match_type = sf.get("matchType", "EXACT")
+            if match_type not in STRING_MATCH_TYPES:
+                raise FilterError(f"{path}.stringFilter: unknown matchType '{match_type}'. Use one of {list(STRING_MATCH_TYPES)}.")
+            return Filter(field_name=field, string_filter=Filter.StringFilter(
+                value=str(sf.get("value", "")),
+                match_type=STRING_MATCH_TYPES[match_type],
+                case_sensitive=bool(sf.get("caseSensitive", False)),
+            ))
+        if "inListFilter" in f:
+            ilf = f["inListFilter"] or {}
+            values = ilf.get("values")
+            if not isinstance(values, list) or not values:
+                raise FilterError(f"{path}.inListFilter: 'values' must be a non-empty list.")
+            return Filter(field_name=field, in_list_filter=Filter.InListFilter(
+                values=[str(v) for v in values],
+                case_sensitive=bool(ilf.get("caseSensitive", False)),
+            ))
+        if "numericFilter" in f:
+            nf = f["numericFilter"] or {}
+            operation = nf.get("operation", "EQUAL")
+            if operation not in NUMERIC_OPERATIONS:
+                raise FilterError(f"{path}.numericFilter: unknown operation '{operation}'. Use one of {list(NUMERIC_OPERATIONS)}.")
+            return Filter(field_name=field, numeric_filter=Filter.NumericFilter(
+                operation=NUMERIC_OPERATIONS[operation],
+                value=_numeric_value(nf.get("value"), f"{path}.numericFilter.value"),
+            ))
+        if "betweenFilter" in f:
+            bf = f["betweenFilter"] or {}
+            return Filter(field_name=field, between_filter=Filter.BetweenFilter(
+                from_value=_numeric_value(bf.get("fromValue"), f"{path}.betweenFilter.fromValue"),
+                to_value=_numeric_value(bf.get("toValue"), f"{path}.betweenFilter.toValue"),
+            ))
+        if "emptyFilter" in f:
+            return Filter(field_name=field, empty_filter=Filter.EmptyFilter())
+        raise FilterError(
+            f"{path}: expected one of 'stringFilter', 'inListFilter', 'numericFilter', 'betweenFilter' or 'emptyFilter'."
+        )
+
+
+def _numeric_value(value, path):
+    """Build a NumericValue from {"int64Value": ...}, {"doubleValue": ...} or a bare number."""
+    if isinstance(value, dict):
+        if "int64Value" in value:
+            value = value["int64Value"]
+            try:
+                return NumericValue(int64_value=int(value))
+            except (TypeError, ValueError):
+                raise FilterError(f"{path}: int64Value must be an integer, got {value!r}.")
+        if "doubleValue" in value:
+            value = value["doubleValue"]
+            try:
+                return NumericValue(double_value=float(value))
+            except (TypeError, ValueError):
+                raise FilterError(f"{path}: doubleValue must be a number, got {value!r}.")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise FilterError(f"{path}: expected a number or {{'int64Value'|'doubleValue': number}}, got {value!r}.")
+    if isinstance(value, int):
+        return NumericValue(int64_value=value)
+    return NumericValue(double_value=value)
@@ -1,338 +1,145 @@
 from fastmcp import FastMCP
-from google.analytics.data_v1beta import BetaAnalyticsDataClient
-from google.analytics.data_v1beta.types import (
-    DateRange, Dimension, Metric, RunReportRequest, Filter, FilterExpression, FilterExpressionList
-)
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import json
+import time
+# The Google client stack (ga4_client_pool, ga4_filters and the API types) is
+# imported inside the functions that need it, so the server starts and answers
+# catalog calls without loading grpc and protobuf.
+from ga4_reports import (
+    DEFAULT_PAGE_SIZE, build_order_bys, decode_rows, fetch_report_rows_async, iter_report_pages,
+    iter_report_pages_async, iter_report_rows, parse_order_bys, resolve_date
+)
+from ga4_columnar import OUTPUT_FORMATS, ColumnarReport
+from ga4_cache import cached_report, cached_report_async, report_cache_key
+from ga4_quota import BULK, AsyncScheduledClient, QuotaExhaustedError, ScheduledClient, quota_scheduler
+from ga4_store import (
+    describe_report, fetch_incremental, fetch_incremental_async, get_partition_store, report_signature
+)
+from ga4_query import TIME_GRAINS, can_derive, derive_report, is_regrain
+from ga4_compare import DATE_RANGE_DIMENSION, compare_date_ranges, parse_date_ranges
+from ga4_pivot import DEFAULT_COLUMN_LIMIT, DEFAULT_ROW_LIMIT, build_pivots, pivot_matrix
+from ga4_realtime import (
+    DEFAULT_MINUTES, REALTIME_METRICS, REALTIME_POLL_INTERVAL, build_realtime_request, is_realtime_dimension,
+    poll_realtime
+)
+from ga4_sharding import is_additive_metric, merge_shard_rows, needs_reaggregation, split_date_range
+from ga4_telemetry import increment, instrument_tool, observe, phase, render_prometheus, snapshot as telemetry_snapshot
 
 # Configuration - Set your credentials here
 CREDENTIALS_PATH = "/path/to/your/service-account-key.json"  # <-- Set your own credentials path here
 GA4_PROPERTY_ID = "id"
 
-# Set environment variables
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIALS_PATH
-os.environ["GA4_PROPERTY_ID"] = GA4_PROPERTY_ID
-
-# Validate credentials file exists
-if not os.path.exists(CREDENTIALS_PATH):
-    print(f"ERROR: Credentials file not found: {CREDENTIALS_PATH}", file=sys.stderr)
-    print("Please check the credentials path", file=sys.stderr)
-    sys.exit(1)
+# Async reports: how many may run at once, and the default per-call timeout in seconds.
+# GA4 allows 10 concurrent requests per property.
+MAX_CONCURRENT_REPORTS = int(os.environ.get("GA4_MAX_CONCURRENT_REPORTS", "10"))
+DEFAULT_REPORT_TIMEOUT = 60
+# Rows get_ga4_data returns in one result unless max_rows or limit is given; the rest is
+# fetched in further calls with offset=next_offset
+MAX_INLINE_ROWS = int(os.environ.get("GA4_MAX_INLINE_ROWS", "10000"))
+_report_semaphore = None
+_filter_compilers = {}
+_field_index = None
+_bundled_catalog = None
 
 # Initialize FastMCP
 mcp = FastMCP("Google Analytics 4")
 
-# Embedded GA4 Dimensions Data
-GA4_DIMENSIONS = {
-    "time": {
-        "date": "The date of the event in YYYYMMDD format.",
-        "dateHour": "The date and hour of the event in YYYYMMDDHH format.",
-        "dateHourMinute": "The date, hour, and minute of the event in YYYYMMDDHHMM format.",
-        "day": "The day of the month (01-31).",
-        "dayOfWeek": "The day of the week (0-6, where Sunday is 0).",
-        "hour": "The hour of the day (00-23).",
-        "minute": "The minute of the hour (00-59).",
-        "month": "The month of the year (01-12).",
-        "week": "The week of the year (00-53).",
-        "year": "The year (e.g., 2024).",
-        "nthDay": "The number of days since the first visit.",
-        "nthHour": "The number of hours since the first visit.",
-        "nthMinute": "The number of minutes since the first visit.",
-        "nthMonth": "The number of months since the first visit.",
-        "nthWeek": "The number of weeks since the first visit.",
-        "nthYear": "The number of years since the first visit."
-    },
-    "geography": {
-        "city": "The city of the user.",
-        "cityId": "The ID of the city.",
-        "country": "The country of the user.",
-        "countryId": "The ID of the country.",
-        "region": "The region of the user."
-    },
-    "technology": {
-        "browser": "The browser used by the user.",
-        "deviceCategory": "The category of the device (e.g., 'desktop', 'mobile', 'tablet').",
-        "deviceModel": "The model of the device.",
-        "operatingSystem": "The operating system of the user's device.",
-        "operatingSystemVersion": "The version of the operating system.",
-        "platform": "The platform of the user's device (e.g., 'web', 'android', 'ios').",
-        "platformDeviceCategory": "The platform and device category.",
-        "screenResolution": "The resolution of the user's screen."
-    },
-    "traffic_source": {
-        "campaignId": "The ID of the campaign.",
-        "campaignName": "The name of the campaign.",
-        "defaultChannelGroup": "The default channel grouping for the traffic source.",
-        "medium": "The medium of the traffic source.",
-        "source": "The source of the traffic.",
-        "sourceMedium": "The source and medium of the traffic.",
-        "sourcePlatform": "The source platform of the traffic.",
-        "sessionCampaignId": "The campaign ID of the session.",
-        "sessionCampaignName": "The campaign name of the session.",
-        "sessionDefaultChannelGroup": "The default channel group of the session.",
-        "sessionMedium": "The medium of the session.",
-        "sessionSource": "The source of the session.",
-        "sessionSourceMedium": "The source and medium of the session.",
-        "sessionSourcePlatform": "The source platform of the session."
-    },
-    "first_user_attribution": {
-        "firstUserCampaignId": "The campaign ID that first acquired the user.",
-        "firstUserCampaignName": "The campaign name that first acquired the user.",
-        "firstUserDefaultChannelGroup": "The default channel group that first acquired the user.",
-        "firstUserMedium": "The medium that first acquired the user.",
-        "firstUserSource": "The source that first acquired the user.",
-        "firstUserSourceMedium": "The source and medium that first acquired the user.",
-        "firstUserSourcePlatform": "The source platform that first acquired the user."
-    },
-    "content": {
-        "contentGroup": "The content group on your site/app. Populated by the event parameter 'content_group'.",
-        "contentId": "The ID of the content. Populated by the event parameter 'content_id'.",
-        "contentType": "The type of content. Populated by the event parameter 'content_type'.",
-        "fullPageUrl": "The full URL of the page.",
-        "landingPage": "The page path of the landing page.",
-        "pageLocation": "The full URL of the page.",
-        "pagePath": "The path of the page (e.g., '/home').",
-        "pagePathPlusQueryString": "The page path and query string.",
-        "pageReferrer": "The referring URL.",
-        "pageTitle": "The title of the page.",
-        "unifiedScreenClass": "The class of the screen.",
-        "unifiedScreenName": "The name of the screen."
-    },
-    "events": {
-        "eventName": "The name of the event.",
-        "isConversionEvent": "Whether the event is a conversion event ('true' or 'false').",
-        "method": "The method of the event. Populated by the event parameter 'method'."
-    },
-    "ecommerce": {
-        "itemBrand": "The brand of the item.",
-        "itemCategory": "The category of the item.",
-        "itemCategory2": "A secondary category for the item.",
-        "itemCategory3": "A third category for the item.",
-        "itemCategory4": "A fourth category for the item.",
-        "itemCategory5": "A fifth category for the item.",
-        "itemId": "The ID of the item.",
-        "itemListId": "The ID of the item list.",
-        "itemListName": "The name of the item list.",
-        "itemName": "The name of the item.",
-        "itemPromotionCreativeName": "The creative name of the item promotion.",
-        "itemPromotionId": "The ID of the item promotion.",
-        "itemPromotionName": "The name of the item promotion.",
-        "orderCoupon": "The coupon code for the order.",
-        "shippingTier": "The shipping tier for the order.",
-        "transactionId": "The ID of the transaction."
-    },
-    "user_demographics": {
-        "newVsReturning": "Whether the user is new or returning.",
-        "signedInWithUserId": "Whether the user was signed in with a User-ID ('true' or 'false').",
-        "userAgeBracket": "The age bracket of the user.",
-        "userGender": "The gender of the user.",
-        "language": "The language of the user's browser or device.",
-        "languageCode": "The language code."
-    },
-    "google_ads": {
-        "googleAdsAdGroupId": "The ID of the Google Ads ad group.",
-        "googleAdsAdGroupName": "The name of the Google Ads ad group.",
-        "googleAdsAdNetworkType": "The ad network type in Google Ads.",
-        "googleAdsCampaignId": "The ID of the Google Ads campaign.",
-        "googleAdsCampaignName": "The name of the Google Ads campaign.",
-        "googleAdsCampaignType": "The type of the Google Ads campaign.",
-        "googleAdsCreativeId": "The ID of the Google Ads creative.",
-        "googleAdsKeyword": "The keyword from Google Ads.",
-        "googleAdsQuery": "The search query from Google Ads.",
-        "firstUserGoogleAdsAdGroupId": "The Google Ads ad group ID that first acquired the user.",
-        "firstUserGoogleAdsAdGroupName": "The Google Ads ad group name that first acquired the user.",
-        "firstUserGoogleAdsCampaignId": "The Google Ads campaign ID that first acquired the user.",
-        "firstUserGoogleAdsCampaignName": "The Google Ads campaign name that first acquired the user.",
-        "firstUserGoogleAdsCampaignType": "The Google Ads campaign type that first acquired the user.",
-        "firstUserGoogleAdsCreativeId": "The Google Ads creative ID that first acquired the user.",
-        "firstUserGoogleAdsKeyword": "The Google Ads keyword that first acquired the user.",
-        "firstUserGoogleAdsNetworkType": "The Google Ads network type that first acquired the user.",
-        "firstUserGoogleAdsQuery": "The Google Ads query that first acquired the user.",
-        "sessionGoogleAdsAdGroupId": "The Google Ads ad group ID of the session.",
-        "sessionGoogleAdsAdGroupName": "The Google Ads ad group name of the session.",
-        "sessionGoogleAdsCampaignId": "The Google Ads campaign ID of the session.",
-        "sessionGoogleAdsCampaignName": "The Google Ads campaign name of the session.",
-        "sessionGoogleAdsCampaignType": "The Google Ads campaign type of the session.",
-        "sessionGoogleAdsCreativeId": "The Google Ads creative ID of the session.",
-        "sessionGoogleAdsKeyword": "The Google Ads keyword of the session.",
-        "sessionGoogleAdsNetworkType": "The Google Ads network type of the session.",
-        "sessionGoogleAdsQuery": "The Google Ads query of the session."
-    },
-    "manual_campaigns": {
-        "manualAdContent": "The ad content from a manual campaign.",
-        "manualTerm": "The term from a manual campaign.",
-        "firstUserManualAdContent": "The manual ad content that first acquired the user.",
-        "firstUserManualTerm": "The manual term that first acquired the user.",
-        "sessionManualAdContent": "The manual ad content of the session.",
-        "sessionManualTerm": "The manual term of the session."
-    },
-    "app_specific": {
-        "appVersion": "The version of the app.",
-        "streamId": "The ID of the data stream.",
-        "streamName": "The name of the data stream."
-    },
-    "cohort_analysis": {
-        "cohort": "The cohort the user belongs to.",
-        "cohortNthDay": "The day number within the cohort.",
-        "cohortNthMonth": "The month number within the cohort.",
-        "cohortNthWeek": "The week number within the cohort."
-    },
-    "audiences": {
-        "audienceId": "The ID of the audience.",
-        "audienceName": "The name of the audience.",
-        "brandingInterest": "The interest category associated with the user."
-    },
-    "enhanced_measurement": {
-        "fileExtension": "The extension of the downloaded file.",
-        "fileName": "The name of the downloaded file.",
-        "linkClasses": "The classes of the clicked link.",
-        "linkDomain": "The domain of the clicked link.",
-        "linkId": "The ID of the clicked link.",
-        "linkText": "The text of the clicked link.",
-        "linkUrl": "The URL of the clicked link.",
-        "outbound": "Whether the clicked link was outbound ('true' or 'false').",
-        "percentScrolled": "The percentage of the page scrolled.",
-        "searchTerm": "The term used for an internal site search.",
-        "videoProvider": "The provider of the video.",
-        "videoTitle": "The title of the video.",
-        "videoUrl": "The URL of the video.",
-        "visible": "Whether the video was visible on the screen."
-    },
-    "gaming": {
-        "achievementId": "The achievement ID in a game for an event.",
-        "character": "The character in a game.",
-        "groupId": "The group ID in a game.",
-        "virtualCurrencyName": "The name of the virtual currency."
-    },
-    "advertising": {
-        "adFormat": "The format of the ad that was shown (e.g., 'Interstitial', 'Banner', 'Rewarded').",
-        "adSourceName": "The name of the ad network or source that served the ad.",
-        "adUnitName": "The name of the ad unit that displayed the ad."
-    },
-    "testing": {
-        "testDataFilterName": "The name of the test data filter."
-    }
-}
-
-# Embedded GA4 Metrics Data
-GA4_METRICS = {
-    "user_metrics": {
-        "totalUsers": "The total number of unique users.",
-        "newUsers": "The number of users who interacted with your site or app for the first time.",
-        "activeUsers": "The number of distinct users who have logged an engaged session on your site or app.",
-        "active1DayUsers": "The number of distinct users who have been active on your site or app in the last 1 day.",
-        "active7DayUsers": "The number of distinct users who have been active on your site or app in the last 7 days.",
-        "active28DayUsers": "The number of distinct users who have been active on your site or app in the last 28 days.",
-        "userStickiness": "A measure of how frequently users return to your site or app.",
-        "dauPerMau": "The ratio of daily active users to monthly active users.",
-        "dauPerWau": "The ratio of daily active users to weekly active users.",
-        "wauPerMau": "The ratio of weekly active users to monthly active users."
-    },
-    "session_metrics": {
-        "sessions": "The total number of sessions.",
-        "sessionsPerUser": "The average number of sessions per user.",
-        "engagedSessions": "The number of sessions that lasted longer than 10 seconds, or had a conversion event, or had at least 2 pageviews or screenviews.",
-        "bounceRate": "The percentage of sessions that were not engaged.",
-        "engagementRate": "The percentage of sessions that were engaged.",
-        "averageSessionDuration": "The average duration of a session in seconds.",
-        "sessionConversionRate": "The percentage of sessions in which a conversion event occurred."
-    },
-    "pageview_metrics": {
-        "screenPageViews": "The total number of app screens or web pages your users saw.",
-        "screenPageViewsPerSession": "The average number of screens or pages viewed per session.",
-        "screenPageViewsPerUser": "The average number of screens or pages viewed per user."
-    },
-    "event_metrics": {
-        "eventCount": "The total number of events.",
-        "eventCountPerUser": "The average number of events per user.",
-        "eventsPerSession": "The average number of events per session.",
-        "eventValue": "The total value of all 'value' event parameters.",
-        "conversions": "The total number of conversion events.",
-        "userConversionRate": "The percentage of active users who triggered a conversion event."
-    },
-    "engagement_metrics": {
-        "userEngagementDuration": "The average time your app was in the foreground or your website was in focus in the browser.",
-        "scrolledUsers": "The number of users who scrolled at least 90% of the page."
-    },
-    "ecommerce_metrics": {
-        "totalRevenue": "The total revenue from all sources.",
-        "purchaseRevenue": "The total revenue from purchases.",
-        "grossPurchaseRevenue": "The total purchase revenue, before refunds.",
-        "itemRevenue": "The total revenue from items.",
-        "grossItemRevenue": "The total revenue from items, before refunds.",
-        "averageRevenue": "The average revenue per user.",
-        "averagePurchaseRevenue": "The average purchase revenue per user.",
-        "averagePurchaseRevenuePerPayingUser": "The average purchase revenue per paying user.",
-        "transactions": "The total number of transactions.",
-        "ecommercePurchases": "The total number of ecommerce purchases.",
-        "purchasers": "The number of users who made a purchase.",
-        "totalPurchasers": "The total number of unique purchasers.",
-        "purchaserConversionRate": "The percentage of active users who made a purchase.",
-        "firstTimePurchasers": "The number of users who made their first purchase.",
-        "firstTimePurchaserConversionRate": "The percentage of active users who made their first purchase.",
-        "firstTimePurchasersPerNewUser": "The number of first-time purchasers per new user.",
-        "transactionsPerPurchaser": "The average number of transactions per purchaser.",
-        "checkouts": "The number of times users started the checkout process.",
-        "refunds": "The total number of refunds.",
-        "refundAmount": "The total amount of refunds.",
-        "shippingAmount": "The total shipping cost.",
-        "taxAmount": "The total tax amount."
-    },
-    "item_metrics": {
-        "itemViews": "The number of times users viewed items.",
-        "itemsAddedToCart": "The number of units of items added to the cart.",
-        "itemsCheckedOut": "The number of units of items in the checkout process.",
-        "itemPurchaseQuantity": "The total number of units of items purchased.",
-        "itemViewToPurchaseRate": "The rate at which users who viewed items also purchased them.",
-        "purchaseToViewRate": "The rate at which users who viewed items also purchased them.",
-        "itemListViews": "The number of times users viewed item lists.",
-        "itemListClicks": "The number of times users clicked on items in a list.",
-        "itemListClickThroughRate": "The rate at which users clicked on items in a list.",
-        "itemsClickedInList": "The number of units of items clicked in a list.",
-        "itemsViewedInList": "The number of units of items viewed in a list.",
-        "itemPromotionViews": "The number of times users viewed item promotions.",
-        "itemPromotionClicks": "The number of times users clicked on item promotions.",
-        "itemPromotionClickThroughRate": "The rate at which users clicked on item promotions.",
-        "itemsClickedInPromotion": "The number of units of items clicked in a promotion.",
-        "itemsViewedInPromotion": "The number of units of items viewed in a promotion."
-    },
-    "advertising_metrics": {
-        "totalAdRevenue": "The total revenue from all ad sources.",
-        "adRevenue": "The total revenue from ads.",
-        "adImpressions": "The total number of ad impressions.",
-        "publisherAdRevenue": "The total revenue from publisher ads.",
-        "publisherAdImpressions": "The total number of publisher ad impressions.",
-        "publisherAdClicks": "The total number of clicks on publisher ads.",
-        "returnOnAdSpend": "The return on investment from your advertising."
-    },
-    "search_console_metrics": {
-        "organicGoogleSearchClicks": "The number of clicks your website received from organic Google Search.",
-        "organicGoogleSearchImpressions": "The number of times your website appeared in organic Google Search results.",
-        "organicGoogleSearchClickThroughRate": "The click-through rate for your website in organic Google Search results.",
-        "organicGoogleSearchAveragePosition": "The average ranking of your website URLs for the queries reported in Search Console."
-    },
-    "cohort_metrics": {
-        "cohortActiveUsers": "The number of active users in a cohort.",
-        "cohortTotalUsers": "The total number of users in a cohort."
-    },
-    "app_crash_metrics": {
-        "crashAffectedUsers": "The number of users who experienced a crash.",
-        "crashFreeUsersRate": "The percentage of users who did not experience a crash."
-    }
-}
+@phase("client")
+def get_client(credentials_path, property_id):
+    """Return the pooled sync GA4 client, importing the client stack on first use."""
+    from ga4_client_pool import get_client as get_pooled_client
+    return get_pooled_client(credentials_path, property_id)
+
+@phase("client")
+def get_async_client(credentials_path, property_id):
+    """Return the pooled async GA4 client, importing the client stack on first use."""
+    from ga4_client_pool import get_async_client as get_pooled_async_client
+    return get_pooled_async_client(credentials_path, property_id)
 
-# Load functions now use embedded data
+def get_catalog(refresh=False, property_id=None):
+    """Return a property's dimension/metric catalog: live metadata, cached for a day, or the bundled lists."""
+    from ga4_metadata import get_metadata_catalog
+    property_id = property_id or GA4_PROPERTY_ID
+    return get_metadata_catalog(
+        property_id, lambda: get_client(CREDENTIALS_PATH, property_id), refresh=refresh
+    )
+
+def get_browse_catalog():
+    """
+    Return the catalog for the browsing tools without waiting on GetMetadata.
+
+    The property's metadata is used once it has been fetched (by a filtered report or
+    refresh_metadata) or is cached on disk; until then the bundled lists are served, so
+    browsing the catalog never loads the client stack or calls the API.
+    """
+    from ga4_metadata import cached_metadata_catalog, static_catalog
+
+    global _bundled_catalog
+    catalog = cached_metadata_catalog(GA4_PROPERTY_ID)
+    if catalog is not None:
+        return catalog
+    if _bundled_catalog is None:
+        _bundled_catalog = static_catalog()
+    return _bundled_catalog
+
+# Load functions return {category: {name: description}} from the browsing catalog
 def load_dimensions():
-    """Load available dimensions from embedded data"""
-    return GA4_DIMENSIONS
+    """Load available dimensions from the property's catalog"""
+    return get_browse_catalog().dimension_categories
 
 def load_metrics():
-    """Load available metrics from embedded data"""
-    return GA4_METRICS
+    """Load available metrics from the property's catalog"""
+    return get_browse_catalog().metric_categories
+
+def __getattr__(name):
+    # The catalog used to be defined in this module; keep ga4_mcp_server.GA4_DIMENSIONS working
+    if name == "GA4_DIMENSIONS":
+        from ga4_catalog import GA4_DIMENSIONS
+        return GA4_DIMENSIONS
+    if name == "GA4_METRICS":
+        from ga4_catalog import GA4_METRICS
+        return GA4_METRICS
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_filter_compiler(property_id=None):
+    """Return the filter compiler for a property's catalog, rebuilding its name index when the catalog changes."""
+    from ga4_filters import FilterCompiler
+
+    property_id = str(property_id or GA4_PROPERTY_ID)
+    catalog = get_catalog(property_id=property_id)
+    entry = _filter_compilers.get(property_id)
+    if entry is None or entry[0] is not catalog:
+        entry = _filter_compilers[property_id] = (catalog, FilterCompiler(catalog.dimensions, catalog.metrics))
+    return entry[1]
+
+def get_realtime_filter_compiler(property_id=None):
+    """Return the filter compiler for realtime reports: the realtime schema plus the property's customUser dimensions."""
+    from ga4_filters import FilterCompiler
+    from ga4_realtime import REALTIME_DIMENSIONS
+
+    property_id = str(property_id or GA4_PROPERTY_ID)
+    catalog = get_catalog(property_id=property_id)
+    entry = _filter_compilers.get((property_id, "realtime"))
+    if entry is None or entry[0] is not catalog:
+        dimensions = REALTIME_DIMENSIONS | set(catalog.with_prefix("customUser:"))
+        entry = _filter_compilers[(property_id, "realtime")] = (catalog, FilterCompiler(dimensions, REALTIME_METRICS))
+    return entry[1]
+
+def get_field_index():
+    """Return the search index for the current catalog, rebuilding it when the catalog changes."""
+    from ga4_search import FieldIndex
+
+    global _field_index
+    catalog = get_browse_catalog()
+    if _field_index is None or _field_index[0] is not catalog:
+        _field_index = (catalog, FieldIndex(catalog))
+    return _field_index[1]
 
 @mcp.tool()
+@instrument_tool
 def list_dimension_categories():
     """
     List all available GA4 dimension categories with descriptions.
@@ -350,6 +157,7 @@ def list_dimension_categories():
     return result
 
 @mcp.tool()
+@instrument_tool
 def list_metric_categories():
     """
     List all available GA4 metric categories with descriptions.
@@ -367,6 +175,7 @@ def list_metric_categories():
     return result
 
 @mcp.tool()
+@instrument_tool
 def get_dimensions_by_category(category):
     """
     Get all dimensions in a specific category with their descriptions.
@@ -377,14 +186,16 @@ def get_dimensions_by_category(category):
     Returns:
         Dictionary of dimensions and their descriptions for the category.
     """
-    dimensions = load_dimensions()
-    if category in dimensions:
-        return dimensions[category]
+    catalog = get_browse_catalog()
+    dimensions = catalog.find_category(category, "dimension")
+    if dimensions is not None:
+        return dimensions
     else:
-        available_categories = list(dimensions.keys())
+        available_categories = list(catalog.dimension_categories.keys())
         return {"error": f"Category '{category}' not found. Available categories: {available_categories}"}
 
 @mcp.tool()
+@instrument_tool
 def get_metrics_by_category(category):
     """
     Get all metrics in a specific category with their descriptions.
@@ -395,20 +206,549 @@ def get_metrics_by_category(category):
     Returns:
         Dictionary of metrics and their descriptions for the category.
     """
-    metrics = load_metrics()
-    if category in metrics:
-        return metrics[category]
+    catalog = get_browse_catalog()
+    metrics = catalog.find_category(category, "metric")
+    if metrics is not None:
+        return metrics
     else:
-        available_categories = list(metrics.keys())
+        available_categories = list(catalog.metric_categories.keys())
         return {"error": f"Category '{category}' not found. Available categories: {available_categories}"}
 
 @mcp.tool()
+@instrument_tool
+def search_fields(query, kind=None, top_k=10):
+    """
+    Search dimensions and metrics by name and description in one call.
+    
+    Matching is ranked and tolerates plurals, partly typed words and typos, so
+    'traffic source', 'bounce rate', 'purchase revenue' or 'countyr' all work.
+    
+    Args:
+        query: Free-text description of the field(s) you are looking for
+        kind: Optional 'dimension' or 'metric' to only return one kind of field
+        top_k: Maximum number of results (default 10)
+        
+    Returns:
+        Dictionary with the best-matching fields (name, kind, category, description, score), best first.
+    """
+    if kind not in (None, "dimension", "metric"):
+        return {"error": "kind must be 'dimension', 'metric' or omitted."}
+    try:
+        top_k = int(top_k)
+    except (TypeError, ValueError):
+        return {"error": "top_k must be an integer."}
+    if not str(query or "").strip():
+        return {"error": "query cannot be empty."}
+    return {"query": query, "results": get_field_index().search(query, kind, top_k)}
+
+@mcp.tool()
+@instrument_tool
+def refresh_metadata():
+    """
+    Re-fetch the property's dimensions and metrics from the GA4 metadata API.
+    
+    The catalog is cached for a day, so use this after creating custom dimensions or metrics.
+    
+    Returns:
+        Dictionary with the catalog source ('api', 'stale' or 'static'), dimension and metric
+        counts, and the custom dimensions and metrics of the property.
+    """
+    catalog = get_catalog(refresh=True)
+    return {
+        "source": catalog.source,
+        "dimensions": len(catalog.dimensions),
+        "metrics": len(catalog.metrics),
+        "custom_dimensions": [name for name, d in catalog.dimensions.items() if d["customDefinition"]],
+        "custom_metrics": [name for name, m in catalog.metrics.items() if m["customDefinition"]],
+    }
+
+def _parse_fields(fields):
+    """Parse a dimension or metric list, which MCP clients may send as a JSON or comma-separated string."""
+    parsed = fields
+    if isinstance(fields, str):
+        try:
+            parsed = json.loads(fields)
+            if not isinstance(parsed, list):
+                parsed = [str(parsed)]
+        except json.JSONDecodeError:
+            parsed = [f.strip() for f in fields.split(',')]
+    return [str(f).strip() for f in parsed if str(f).strip()]
+
+@phase("parse")
+def _prepare_report(dimensions, metrics, date_range_start, date_range_end, dimension_filter, max_rows,
+                    order_bys=None, limit=None, offset=None, output_format="rows", metric_filter=None,
+                    property_id=None, date_ranges=None, row_cap=None):
+    """
+    Parse get_ga4_data arguments into a RunReportRequest and its cache key.
+
+    If date_ranges is given it replaces date_range_start/date_range_end, and the report's
+    "ranges" holds the parsed (name, start, end) tuples for compare_date_ranges. row_cap
+    bounds the rows of plain row reports that set neither max_rows nor limit (see _cap_rows).
+
+    Returns:
+        Tuple of (report, error). On success report is a dict with the property ID, request, cache key,
+        date ranges, row cap and partition signature (None unless the report can be served
+        from the day-partitioned store) and error is None; otherwise report is None and
+        error is the error dictionary to return to the client.
+    """
+    from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunReportRequest
+    from ga4_filters import FilterError
+
+    property_id = str(property_id or GA4_PROPERTY_ID)
+
+    parsed_dimensions = _parse_fields(dimensions)
+    parsed_metrics = _parse_fields(metrics)
+
+    # Named ranges for period-over-period comparisons; the API adds a dateRange dimension
+    ranges = None
+    if date_ranges:
+        try:
+            ranges = parse_date_ranges(date_ranges)
+        except ValueError as e:
+            return None, {"error": str(e)}
+        if (output_format or "rows") != "rows":
+            return None, {"error": "date_ranges only supports output_format='rows'."}
+        parsed_dimensions = [d for d in parsed_dimensions if d != DATE_RANGE_DIMENSION]
+
+    # Proceed if we have valid dimensions and metrics after parsing (totals are fine when comparing ranges)
+    if not parsed_dimensions and not ranges:
+        return None, {"error": "Dimensions list cannot be empty after parsing."}
+    if not parsed_metrics:
+        return None, {"error": "Metrics list cannot be empty after parsing."}
+
+    # Validate and compile the filters (compiled expressions are memoized per filter). Only
+    # filters need the property's catalog, so unfiltered reports never wait on GetMetadata.
+    filter_expression = metric_filter_expression = None
+    if dimension_filter or metric_filter:
+        try:
+            compiler = get_filter_compiler(property_id)
+            with phase("filter_compile"):
+                filter_expression = compiler.compile(dimension_filter, "dimension") if dimension_filter else None
+                metric_filter_expression = compiler.compile(metric_filter, "metric") if metric_filter else None
+        except FilterError as e:
+            return None, {"error": f"Invalid filter: {e}"}
+
+    # Ordering and limit/offset are applied by the API, so top-N only transfers N rows
+    try:
+        parsed_order_bys = parse_order_bys(order_bys)
+        order_by_objects = build_order_bys(parsed_order_bys, parsed_dimensions, parsed_metrics)
+        limit = int(limit) if limit else None
+        offset = int(offset) if offset else None
+        if max_rows is not None:
+            max_rows = int(max_rows)
+            if max_rows < 1:
+                raise ValueError("max_rows must be at least 1.")
+    except ValueError as e:
+        return None, {"error": str(e)}
+    output_format = output_format or "rows"
+    if output_format not in OUTPUT_FORMATS:
+        return None, {"error": f"output_format must be one of {list(OUTPUT_FORMATS)}."}
+    if max_rows is not None or limit or ranges or output_format != "rows":
+        row_cap = None
+
+    if ranges:
+        date_ranges = [(start, end) for _, start, end in ranges]
+        date_range_objects = [DateRange(start_date=start, end_date=end, name=name) for name, start, end in ranges]
+    else:
+        date_ranges = [(date_range_start, date_range_end)]
+        date_range_objects = [DateRange(start_date=date_range_start, end_date=date_range_end)]
+    dimension_objects = [Dimension(name=d) for d in parsed_dimensions]
+    metric_objects = [Metric(name=m) for m in parsed_metrics]
+    request = RunReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=dimension_objects,
+        metrics=metric_objects,
+        date_ranges=date_range_objects,
+        dimension_filter=filter_expression,
+        metric_filter=metric_filter_expression,
+        order_bys=order_by_objects,
+        limit=limit,
+        offset=offset
+    )
+    cache_key = report_cache_key(
+        property_id, parsed_dimensions, parsed_metrics, date_ranges, dimension_filter,
+        extra={"max_rows": max_rows, "order_bys": parsed_order_bys, "limit": limit, "offset": offset,
+               "output_format": output_format, "range_names": [r[0] for r in ranges] if ranges else None,
+               "row_cap": row_cap},
+        metric_filter=metric_filter
+    )
+    # Plain row reports by date are assembled day by day from the local partition store (an offset is
+    # applied to the assembled rows)
+    signature = description = None
+    if "date" in parsed_dimensions and not (ranges or parsed_order_bys or limit or max_rows is not None) \
+            and output_format == "rows" and _is_valid_range(date_range_start, date_range_end):
+        signature = report_signature(
+            property_id, parsed_dimensions, parsed_metrics, dimension_filter, metric_filter
+        )
+        description = describe_report(parsed_dimensions, parsed_metrics, dimension_filter, metric_filter)
+    return {
+        "property_id": property_id, "request": request, "cache_key": cache_key, "date_ranges": date_ranges,
+        "max_rows": max_rows, "output_format": output_format, "signature": signature,
+        "description": description, "dimension_filter": dimension_filter, "metric_filter": metric_filter,
+        "order_bys": parsed_order_bys, "limit": limit, "offset": offset, "ranges": ranges, "row_cap": row_cap
+    }, None
+
+def _is_valid_range(date_range_start, date_range_end):
+    """Whether both dates resolve and the range is not reversed."""
+    try:
+        return resolve_date(date_range_start) <= resolve_date(date_range_end)
+    except ValueError:
+        return False
+
+@phase("parse")
+def _prepare_shards(dimensions, metrics, date_range_start, date_range_end, dimension_filter, shard_by,
+                    order_bys=None, limit=None, offset=None, output_format="rows", metric_filter=None,
+                    property_id=None):
+    """
+    Split get_ga4_data arguments into one prepared report per date shard.
+
+    Returns:
+        Tuple of (shards, error). On success shards is a list of reports as returned by
+        _prepare_report, in date order, and error is None.
+    """
+    if order_bys or limit:
+        return None, {"error": "order_bys and limit cannot be combined with shard_by."}
+    if (output_format or "rows") != "rows":
+        return None, {"error": "shard_by only supports output_format='rows'."}
+    try:
+        date_ranges = split_date_range(date_range_start, date_range_end, shard_by)
+    except ValueError as e:
+        return None, {"error": str(e)}
+
+    shards = []
+    for start, end in date_ranges:
+        report, error = _prepare_report(
+            dimensions, metrics, start, end, dimension_filter, None, metric_filter=metric_filter,
+            property_id=property_id
+        )
+        if error:
+            return None, error
+        shards.append(report)
+
+    # Without a date dimension, shard rows are summed, which only works for additive metrics
+    request = shards[0]["request"]
+    if needs_reaggregation([d.name for d in request.dimensions]):
+        non_additive = [m.name for m in request.metrics if not is_additive_metric(m.name)]
+        if non_additive:
+            return None, {"error": f"Metrics {non_additive} cannot be summed across shards. "
+                                   "Add 'date' to dimensions or drop shard_by."}
+        if metric_filter:
+            return None, {"error": "metric_filter cannot be combined with shard_by unless 'date' is a dimension."}
+    return shards, None
+
+def _merge_shards(shards, shard_rows, max_rows, offset=None):
+    """Merge per-shard rows back into one report in date order, from offset and capped at max_rows or MAX_INLINE_ROWS."""
+    request = shards[0]["request"]
+    rows = merge_shard_rows(
+        shard_rows, [d.name for d in request.dimensions], [m.name for m in request.metrics]
+    )
+    start = int(offset or 0)
+    if max_rows is not None:
+        return rows[start:start + int(max_rows)]
+    return _cap_rows(rows[start:], MAX_INLINE_ROWS, start)
+
+def _capped_result(rows, row_count, offset):
+    """Return rows, or {"rows", "next_offset", "row_count"} if the report has rows after them."""
+    next_offset = int(offset or 0) + len(rows)
+    if next_offset >= row_count:
+        return rows
+    return {"rows": rows, "next_offset": next_offset, "row_count": row_count}
+
+def _cap_rows(rows, row_cap, offset=None):
+    """
+    Bound the rows of a report, starting at offset, to row_cap rows.
+
+    Returns:
+        rows unchanged if row_cap is None or they fit, otherwise {"rows": the first row_cap rows,
+        "next_offset": offset to pass to fetch the next chunk, "row_count": rows in the whole report}.
+    """
+    if row_cap is None or len(rows) <= row_cap:
+        return rows
+    return _capped_result(rows[:row_cap], int(offset or 0) + len(rows), offset)
+
+def _parse_property_ids(property_ids, output_format="rows"):
+    """
+    Parse the property_ids argument (list, JSON list or comma-separated string) into unique IDs.
+
+    Returns:
+        Tuple of (property_ids, error).
+    """
+    if isinstance(property_ids, str):
+        try:
+            parsed = json.loads(property_ids)
+            property_ids = parsed if isinstance(parsed, list) else [parsed]
+        except json.JSONDecodeError:
+            property_ids = property_ids.split(",")
+    elif not isinstance(property_ids, (list, tuple)):
+        property_ids = [property_ids]
+    ids = []
+    for property_id in property_ids:
+        property_id = str(property_id).strip()
+        if property_id.startswith("properties/"):
+            property_id = property_id[len("properties/"):]
+        if property_id and property_id not in ids:
+            ids.append(property_id)
+    if not ids:
+        return None, {"error": "property_ids cannot be empty after parsing."}
+    if (output_format or "rows") != "rows":
+        return None, {"error": "property_ids only supports output_format='rows'."}
+    return ids, None
+
+def _merge_properties(property_ids, results):
+    """Merge per-property results into one row list with a propertyId column, reporting failed properties."""
+    rows = []
+    errors = {}
+    next_offsets = {}
+    comparison = None
+    for property_id, result in zip(property_ids, results):
+        if isinstance(result, dict) and "error" in result:
+            errors[property_id] = result["error"]
+            continue
+        if isinstance(result, dict) and "next_offset" in result:
+            next_offsets[property_id] = result["next_offset"]
+            result = result["rows"]
+        elif isinstance(result, dict):
+            # Date range comparison: {"date_ranges": ..., "rows": [...]}
+            comparison = {key: value for key, value in result.items() if key != "rows"}
+            result = result["rows"]
+        rows.extend({"propertyId": property_id, **row} for row in result)
+    if len(errors) == len(property_ids):
+        return {"error": "The report failed for every property.", "errors": errors}
+    if not errors and not next_offsets and comparison is None:
+        return rows
+    merged = dict(comparison or {}, rows=rows)
+    if next_offsets:
+        merged["next_offsets"] = next_offsets
+    if errors:
+        merged["errors"] = errors
+    return merged
+
+def _compare_ranges(report, rows):
+    """Regroup a multi-range report's rows by range with deltas; other reports are returned unchanged."""
+    if not report["ranges"] or not isinstance(rows, list):
+        return rows
+    request = report["request"]
+    return compare_date_ranges(
+        rows, [d.name for d in request.dimensions], [m.name for m in request.metrics], report["ranges"]
+    )
+
+def _fetch_report(client, report, page_size):
+    """Run a prepared report, following all pages, and return rows or a columnar dict."""
+    if report["output_format"] == "columnar":
+        pages = iter_report_pages(client, report["request"], page_size=page_size, max_rows=report["max_rows"])
+        return ColumnarReport.from_pages(pages).to_dict()
+    if report["row_cap"] is not None:
+        # The pages' row_count tells whether rows are left after the cap, without fetching any of them
+        rows, row_count = [], 0
+        for response in iter_report_pages(client, report["request"], page_size=page_size, max_rows=report["row_cap"]):
+            rows.extend(decode_rows(response))
+            row_count = response.row_count
+        return _capped_result(rows, row_count, report["offset"])
+    return list(iter_report_rows(client, report["request"], page_size=page_size, max_rows=report["max_rows"]))
+
+def _query_store(report, pivot=None, rollups=False):
+    """
+    Answer a prepared report locally from a stored report that covers it, without calling the API.
+
+    Args:
+        report: Prepared report, as returned by _prepare_report.
+        pivot: Optional dimension to pivot into columns.
+        rollups: Also answer by dropping stored dimensions, as query_local_data does. Otherwise only
+                 stored reports with the same dimensions, or with date coarsened, are used.
+
+    Returns:
+        List of row dictionaries, or None if no stored report can answer it (or pandas is not installed).
+    """
+    if report["ranges"]:
+        return None
+    (start, end), = report["date_ranges"]
+    store = get_partition_store()
+    if store is None or report["output_format"] != "rows" or not _is_valid_range(start, end):
+        return None
+    request = report["request"]
+    dimensions = [d.name for d in request.dimensions]
+    metrics = [m.name for m in request.metrics]
+    start, end = resolve_date(start), resolve_date(end)
+    days = (end - start).days + 1
+    start, end = start.isoformat(), end.isoformat()
+
+    # Prefer the coarsest stored report, which has the fewest rows to scan
+    property_id = report["property_id"]
+    sources = sorted(store.sources(property_id).items(), key=lambda item: len(item[1]["dimensions"]))
+    for signature, source in sources:
+        if not rollups and not is_regrain(source["dimensions"], dimensions):
+            continue
+        if not can_derive(source, dimensions, metrics, report["dimension_filter"], report["metric_filter"]):
+            continue
+        if store.covered_days(property_id, signature, start, end) < days:
+            continue
+        partitions = store.get(property_id, signature, start, end)
+        rows = [row for day in sorted(partitions) for row in partitions[day]]
+        try:
+            rows = derive_report(
+                rows, source["dimensions"], source["metrics"], dimensions, metrics,
+                report["dimension_filter"], report["metric_filter"],
+                report["order_bys"], report["limit"], report["offset"], pivot
+            )
+        except ImportError:
+            return None
+        if report["max_rows"] is not None:
+            return rows[:report["max_rows"]]
+        return _cap_rows(rows, report["row_cap"], report["offset"])
+    return None
+
+def _slice_partitioned(report, rows):
+    """Apply a partitioned report's offset and row cap to the rows assembled from the store."""
+    start = report["offset"] or 0
+    return _cap_rows(rows[start:] if start else rows, report["row_cap"], start)
+
+def _fetch_partitioned(client, report, page_size, refresh=False):
+    """Run a date-partitioned report through the local store, fetching only missing or mutable days."""
+    from google.analytics.data_v1beta.types import DateRange, RunReportRequest
+
+    def fetch_range(start, end):
+        request = RunReportRequest(report["request"])
+        request.date_ranges = [DateRange(start_date=start, end_date=end)]
+        request.offset = 0
+        return list(iter_report_rows(client, request, page_size=page_size))
+
+    (start, end), = report["date_ranges"]
+    rows = fetch_incremental(
+        report["property_id"], report["signature"], start, end, fetch_range, refresh,
+        description=report["description"]
+    )
+    return _slice_partitioned(report, rows)
+
+async def _fetch_partitioned_async(client, report, page_size, timeout, refresh=False):
+    """Async counterpart of _fetch_partitioned."""
+    from google.analytics.data_v1beta.types import DateRange, RunReportRequest
+
+    async def fetch_range(start, end):
+        request = RunReportRequest(report["request"])
+        request.date_ranges = [DateRange(start_date=start, end_date=end)]
+        request.offset = 0
+        return await fetch_report_rows_async(client, request, page_size=page_size, timeout=timeout)
+
+    (start, end), = report["date_ranges"]
+    rows = await fetch_incremental_async(
+        report["property_id"], report["signature"], start, end, fetch_range, refresh,
+        description=report["description"]
+    )
+    return _slice_partitioned(report, rows)
+
+async def _fetch_report_async(client, report, page_size, timeout):
+    """Async counterpart of _fetch_report."""
+    if report["output_format"] == "columnar":
+        columnar = None
+        async for response in iter_report_pages_async(
+            client, report["request"], page_size=page_size, max_rows=report["max_rows"], timeout=timeout
+        ):
+            if columnar is None:
+                columnar = ColumnarReport.from_response(response)
+            columnar.add_response(response)
+        return columnar.to_dict()
+    if report["row_cap"] is not None:
+        rows, row_count = [], 0
+        async for response in iter_report_pages_async(
+            client, report["request"], page_size=page_size, max_rows=report["row_cap"], timeout=timeout
+        ):
+            rows.extend(decode_rows(response))
+            row_count = response.row_count
+        return _capped_result(rows, row_count, report["offset"])
+    return await fetch_report_rows_async(
+        client, report["request"], page_size=page_size, max_rows=report["max_rows"], timeout=timeout
+    )
+
+def _error_response(e):
+    """Format an exception raised while fetching GA4 data as an error dictionary."""
+    increment("ga4_errors_total", type=type(e).__name__)
+    if isinstance(e, QuotaExhaustedError):
+        print(f"DEBUG: {e}", file=sys.stderr)
+        return {"error": str(e)}
+    error_message = f"Error fetching GA4 data: {str(e)}"
+    print(error_message, file=sys.stderr)
+    if hasattr(e, 'details'):
+        error_message += f" Details: {e.details()}"
+    return {"error": error_message}
+
+def _get_report_semaphore():
+    """Return the semaphore bounding concurrent async reports, creating it on first use."""
+    global _report_semaphore
+    if _report_semaphore is None:
+        _report_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REPORTS)
+    return _report_semaphore
+
+def _get_ga4_data(property_id, dimensions, metrics, date_range_start, date_range_end, dimension_filter,
+                  page_size, max_rows, use_cache, order_bys, limit, offset, output_format, metric_filter, shard_by,
+                  date_ranges=None):
+    """Run get_ga4_data for one property; returns rows, a columnar dict or an error dictionary."""
+    started = time.perf_counter()
+    try:
+        if shard_by and date_ranges:
+            return {"error": "date_ranges cannot be combined with shard_by."}
+        if shard_by:
+            shards, error = _prepare_shards(
+                dimensions, metrics, date_range_start, date_range_end, dimension_filter, shard_by,
+                order_bys, limit, offset, output_format, metric_filter, property_id
+            )
+            if error:
+                return error
+            client = ScheduledClient(get_client(CREDENTIALS_PATH, property_id), property_id, BULK)
+
+            def fetch_shard(shard):
+                return cached_report(
+                    shard["cache_key"], shard["date_ranges"],
+                    lambda: _fetch_report(client, shard, page_size),
+                    use_cache=use_cache
+                )
+
+            with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REPORTS, len(shards))) as executor:
+                shard_rows = list(executor.map(fetch_shard, shards))
+            return _merge_shards(shards, shard_rows, max_rows, offset)
+
+        report, error = _prepare_report(
+            dimensions, metrics, date_range_start, date_range_end, dimension_filter, max_rows,
+            order_bys, limit, offset, output_format, metric_filter, property_id, date_ranges, MAX_INLINE_ROWS
+        )
+        if error:
+            return error
+        client = ScheduledClient(get_client(CREDENTIALS_PATH, property_id), property_id)
+
+        def fetch():
+            # Coarser time grains and top-N of stored reports are computed locally
+            rows = _query_store(report) if use_cache else None
+            if rows is not None:
+                return rows
+            if report["signature"]:
+                return _fetch_partitioned(client, report, page_size, refresh=not use_cache)
+            return _fetch_report(client, report, page_size)
+
+        rows = cached_report(report["cache_key"], report["date_ranges"], fetch, use_cache=use_cache)
+        return _compare_ranges(report, rows)
+    except Exception as e:
+        return _error_response(e)
+    finally:
+        observe("ga4_report_duration_seconds", time.perf_counter() - started, property=str(property_id))
+
+@mcp.tool()
+@instrument_tool
 def get_ga4_data(
     dimensions=["date"],
     metrics=["totalUsers", "newUsers", "bounceRate", "screenPageViewsPerSession", "averageSessionDuration"],
     date_range_start="7daysAgo",
     date_range_end="yesterday",
-    dimension_filter=None
+    dimension_filter=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    max_rows=None,
+    use_cache=True,
+    order_bys=None,
+    limit=None,
+    offset=None,
+    output_format="rows",
+    metric_filter=None,
+    shard_by=None,
+    property_ids=None,
+    date_ranges=None
 ):
     """
     Retrieve GA4 metrics data broken down by the specified dimensions.
@@ -421,179 +761,593 @@ def get_ga4_data(
         date_range_start: Start date in YYYY-MM-DD format or relative date like '7daysAgo'.
         date_range_end: End date in YYYY-MM-DD format or relative date like 'yesterday'.
         dimension_filter: (Optional) JSON string or dict representing a GA4 FilterExpression. See GA4 API docs for structure.
+                          Supports stringFilter, inListFilter, numericFilter, betweenFilter and emptyFilter leaves.
+        page_size: (Optional) Rows fetched per API call. All pages are followed automatically.
+        max_rows: (Optional) Maximum number of rows to return (at least 1). Without max_rows or limit, rows
+                  reports return at most GA4_MAX_INLINE_ROWS rows (default 10,000); if there are more, the result is
+                  {"rows": [...], "next_offset": N} and the next chunk is fetched by calling again with offset=N.
+                  For whole large reports, use export_ga4_report or output_format="columnar".
+        use_cache: (Optional) Serve identical recent requests from the local report cache. Set False to force a fresh API call.
+                   Reports with a date dimension (and no ordering, limit or max_rows) are also kept per day,
+                   so a later range only fetches days that are new or still being processed by GA4.
+        order_bys: (Optional) Sort order, applied by the API. List of field names, prefixed with '-' for
+                   descending (e.g., ["-screenPageViews"]), or dicts like {"field": "date", "desc": false}.
+        limit: (Optional) Number of rows to return, counted after ordering. Use with order_bys for top-N queries.
+        offset: (Optional) Number of rows to skip before the first returned row, for fetching the next chunk.
+        output_format: (Optional) "rows" (default) for a list of dicts of strings, or "columnar" for typed
+                       columns: metrics as numbers per metric type, dimensions dictionary-encoded as
+                       {"dictionary": [...distinct values], "codes": [...per-row index]}. Columnar output is
+                       much smaller for large reports.
+        metric_filter: (Optional) JSON string or dict filtering on metric values, applied after aggregation.
+                       Uses numericFilter or betweenFilter leaves, e.g.
+                       {"filter": {"fieldName": "sessions", "numericFilter": {"operation": "GREATER_THAN", "value": {"int64Value": "100"}}}}.
+        shard_by: (Optional) "day", "week" or "month" to split a long date range into shards that are fetched
+                  in parallel and cached separately, then merged in date order. Without a date dimension the
+                  shards are summed, so only additive metrics (e.g. sessions, screenPageViews, eventCount,
+                  totalRevenue) are allowed. Cannot be combined with order_bys, limit or columnar output.
+        property_ids: (Optional) List of GA4 property IDs (or a comma-separated string) to run the same report
+                      against concurrently, each with its own client, quota and cache. Rows from every property
+                      are returned together with a "propertyId" column; limit and max_rows apply per property.
+                      If some properties fail, returns {"rows": [...], "errors": {propertyId: message}}; properties
+                      with rows left over are listed in "next_offsets" ({propertyId: offset}).
+                      Defaults to the configured property. Only output_format='rows' is supported.
+        date_ranges: (Optional) 2 to 4 named date ranges to compare in one request, replacing
+                     date_range_start/date_range_end, e.g. [{"name": "this_week", "start": "7daysAgo", "end": "yesterday"},
+                     {"name": "last_week", "start": "14daysAgo", "end": "8daysAgo"}]. Returns {"date_ranges": {...},
+                     "rows": [...]} with one row per dimension combination holding "values" per range and
+                     "changes" (delta and pct_change) of the first range against each other range.
+                     Dimensions may be empty to compare totals. Cannot be combined with shard_by.
         
     Returns:
-        List of dictionaries containing the requested data, or an error dictionary.
+        List of dictionaries containing the requested data, {"rows": [...], "next_offset": N} when more rows
+        are left, a columnar dict, or an error dictionary.
     """
+    if property_ids:
+        property_ids, error = _parse_property_ids(property_ids, output_format)
+        if error:
+            return error
+        with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REPORTS, len(property_ids))) as executor:
+            results = list(executor.map(
+                lambda property_id: _get_ga4_data(
+                    property_id, dimensions, metrics, date_range_start, date_range_end, dimension_filter,
+                    page_size, max_rows, use_cache, order_bys, limit, offset, output_format, metric_filter, shard_by,
+                    date_ranges
+                ),
+                property_ids
+            ))
+        return _merge_properties(property_ids, results)
+    return _get_ga4_data(
+        GA4_PROPERTY_ID, dimensions, metrics, date_range_start, date_range_end, dimension_filter,
+        page_size, max_rows, use_cache, order_bys, limit, offset, output_format, metric_filter, shard_by,
+        date_ranges
+    )
+
+async def _get_ga4_data_async(property_id, dimensions, metrics, date_range_start, date_range_end,
+                              dimension_filter, page_size, max_rows, use_cache, order_bys, limit, offset,
+                              output_format, metric_filter, shard_by, timeout, date_ranges=None):
+    """Run get_ga4_data_async for one property; returns rows, a columnar dict or an error dictionary."""
+    started = time.perf_counter()
     try:
-        # Handle cases where dimensions might be passed as a string from the MCP client
-        parsed_dimensions = dimensions
-        if isinstance(dimensions, str):
-            try:
-                parsed_dimensions = json.loads(dimensions)
-                if not isinstance(parsed_dimensions, list):
-                    parsed_dimensions = [str(parsed_dimensions)]
-            except json.JSONDecodeError:
-                parsed_dimensions = [d.strip() for d in dimensions.split(',')]
-        parsed_dimensions = [str(d).strip() for d in parsed_dimensions if str(d).strip()]
-
-        # Handle cases where metrics might be passed as a string
-        parsed_metrics = metrics
-        if isinstance(metrics, str):
-            try:
-                parsed_metrics = json.loads(metrics)
-                if not isinstance(parsed_metrics, list):
-                    parsed_metrics = [str(parsed_metrics)]
-            except json.JSONDecodeError:
-                parsed_metrics = [m.strip() for m in metrics.split(',')]
-        parsed_metrics = [str(m).strip() for m in parsed_metrics if str(m).strip()]
-
-        # Proceed if we have valid dimensions and metrics after parsing
-        if not parsed_dimensions:
-            return {"error": "Dimensions list cannot be empty after parsing."}
+        timeout = float(timeout) if timeout else None
+        if shard_by and date_ranges:
+            return {"error": "date_ranges cannot be combined with shard_by."}
+        # Compiling a filter may fetch the property's metadata, which must not block the event loop
+        if shard_by:
+            shards, error = await asyncio.to_thread(
+                _prepare_shards, dimensions, metrics, date_range_start, date_range_end, dimension_filter, shard_by,
+                order_bys, limit, offset, output_format, metric_filter, property_id
+            )
+            if error:
+                return error
+
+            async def fetch_shard(shard):
+                async def fetch():
+                    async with _get_report_semaphore():
+                        client = AsyncScheduledClient(
+                            get_async_client(CREDENTIALS_PATH, property_id), property_id, BULK
+                        )
+                        return await _fetch_report_async(client, shard, page_size, timeout)
+
+                return await cached_report_async(shard["cache_key"], shard["date_ranges"], fetch, use_cache=use_cache)
+
+            shard_rows = await asyncio.wait_for(asyncio.gather(*(fetch_shard(shard) for shard in shards)), timeout)
+            return _merge_shards(shards, shard_rows, max_rows, offset)
+
+        report, error = await asyncio.to_thread(
+            _prepare_report, dimensions, metrics, date_range_start, date_range_end, dimension_filter, max_rows,
+            order_bys, limit, offset, output_format, metric_filter, property_id, date_ranges, MAX_INLINE_ROWS
+        )
+        if error:
+            return error
+
+        async def fetch():
+            rows = await asyncio.to_thread(_query_store, report) if use_cache else None
+            if rows is not None:
+                return rows
+            async with _get_report_semaphore():
+                client = AsyncScheduledClient(get_async_client(CREDENTIALS_PATH, property_id), property_id)
+                if report["signature"]:
+                    return await _fetch_partitioned_async(client, report, page_size, timeout, refresh=not use_cache)
+                return await _fetch_report_async(client, report, page_size, timeout)
+
+        rows = await asyncio.wait_for(
+            cached_report_async(report["cache_key"], report["date_ranges"], fetch, use_cache=use_cache),
+            timeout
+        )
+        return _compare_ranges(report, rows)
+    except asyncio.TimeoutError:
+        return {"error": f"GA4 report did not finish within {timeout} seconds. Try a shorter date range or fewer dimensions."}
+    except Exception as e:
+        return _error_response(e)
+    finally:
+        observe("ga4_report_duration_seconds", time.perf_counter() - started, property=str(property_id))
+
+@mcp.tool()
+@instrument_tool
+async def get_ga4_data_async(
+    dimensions=["date"],
+    metrics=["totalUsers", "newUsers", "bounceRate", "screenPageViewsPerSession", "averageSessionDuration"],
+    date_range_start="7daysAgo",
+    date_range_end="yesterday",
+    dimension_filter=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    max_rows=None,
+    use_cache=True,
+    order_bys=None,
+    limit=None,
+    offset=None,
+    output_format="rows",
+    metric_filter=None,
+    shard_by=None,
+    timeout=DEFAULT_REPORT_TIMEOUT,
+    property_ids=None,
+    date_ranges=None
+):
+    """
+    Retrieve GA4 metrics data without blocking other tool calls while the report runs.
+    
+    Takes the same arguments as get_ga4_data, plus a timeout. Reports run on the async
+    GA4 client, at most GA4_MAX_CONCURRENT_REPORTS at a time per server process.
+    
+    Args:
+        dimensions: List of GA4 dimensions or a string representation, as for get_ga4_data.
+        metrics: List of GA4 metrics or a string representation, as for get_ga4_data.
+        date_range_start: Start date in YYYY-MM-DD format or relative date like '7daysAgo'.
+        date_range_end: End date in YYYY-MM-DD format or relative date like 'yesterday'.
+        dimension_filter: (Optional) JSON string or dict representing a GA4 FilterExpression.
+        page_size: (Optional) Rows fetched per API call. All pages are followed automatically.
+        max_rows: (Optional) Maximum number of rows to return. Without max_rows or limit, at most
+                  GA4_MAX_INLINE_ROWS rows are returned along with next_offset, as for get_ga4_data.
+        use_cache: (Optional) Serve identical recent requests from the local report cache.
+        order_bys: (Optional) Sort order applied by the API, e.g. ["-sessions"].
+        limit: (Optional) Number of rows to return, counted after ordering.
+        offset: (Optional) Number of rows to skip before the first returned row.
+        output_format: (Optional) "rows" (default) or "columnar", as for get_ga4_data.
+        metric_filter: (Optional) JSON string or dict filtering on metric values, as for get_ga4_data.
+        shard_by: (Optional) "day", "week" or "month" to fetch a long date range as concurrent shards, as for get_ga4_data.
+        timeout: (Optional) Seconds to wait for the whole report, including time queued behind other reports.
+        property_ids: (Optional) List of GA4 property IDs to run the report against concurrently, as for get_ga4_data.
+        date_ranges: (Optional) 2 to 4 named date ranges to compare in one request, as for get_ga4_data.
+        
+    Returns:
+        List of dictionaries containing the requested data (or a columnar dict), or an error dictionary.
+    """
+    if property_ids:
+        property_ids, error = _parse_property_ids(property_ids, output_format)
+        if error:
+            return error
+        results = await asyncio.gather(*(
+            _get_ga4_data_async(
+                property_id, dimensions, metrics, date_range_start, date_range_end, dimension_filter,
+                page_size, max_rows, use_cache, order_bys, limit, offset, output_format, metric_filter, shard_by,
+                timeout, date_ranges
+            )
+            for property_id in property_ids
+        ))
+        return _merge_properties(property_ids, results)
+    return await _get_ga4_data_async(
+        GA4_PROPERTY_ID, dimensions, metrics, date_range_start, date_range_end, dimension_filter,
+        page_size, max_rows, use_cache, order_bys, limit, offset, output_format, metric_filter, shard_by, timeout,
+        date_ranges
+    )
+
+@mcp.tool()
+@instrument_tool
+def get_ga4_pivot(
+    rows,
+    columns,
+    metrics,
+    date_range_start="28daysAgo",
+    date_range_end="yesterday",
+    dimension_filter=None,
+    metric_filter=None,
+    row_limit=DEFAULT_ROW_LIMIT,
+    column_limit=DEFAULT_COLUMN_LIMIT,
+    row_order_bys=None,
+    column_order_bys=None,
+    totals=False,
+    use_cache=True,
+    property_id=None
+):
+    """
+    Retrieve a GA4 pivot table, e.g. sessions by country (rows) x deviceCategory (columns).
+    
+    The pivot is computed by the API: each axis is ranked and cut to its limit before any
+    data is returned, so a top-10 x top-5 matrix transfers at most 50 cells instead of the
+    full cross-product. Prefer this over get_ga4_data when you need a matrix.
+    
+    Args:
+        rows: Dimensions forming the rows (list or string representation, as for get_ga4_data), e.g. ["country"].
+        columns: Dimensions forming the columns, e.g. ["deviceCategory"]. May be empty for a ranked list of rows.
+        metrics: List of GA4 metrics; each becomes one matrix in "values".
+        date_range_start: Start date in YYYY-MM-DD format or relative date like '28daysAgo'.
+        date_range_end: End date in YYYY-MM-DD format or relative date like 'yesterday'.
+        dimension_filter: (Optional) Dimension filter, as for get_ga4_data. Its fields must be in rows or columns.
+        metric_filter: (Optional) Metric filter, as for get_ga4_data.
+        row_limit: (Optional) Number of rows to keep (default 10).
+        column_limit: (Optional) Number of columns to keep (default 10). row_limit x column_limit may not exceed 250,000.
+        row_order_bys: (Optional) How rows are ranked, e.g. ["-sessions"] or ["country"]; fields must be
+                       metrics or row dimensions. Default: first metric, descending.
+        column_order_bys: (Optional) How columns are ranked; fields must be metrics or column dimensions.
+                          Default: first metric, descending.
+        totals: (Optional) Also return the total of every row and column and the grand total.
+        use_cache: (Optional) Serve identical recent requests from the local report cache.
+        property_id: (Optional) GA4 property ID to run the report against, with its own client, quota and
+                     cache. Defaults to the configured property.
+        
+    Returns:
+        Dictionary with "row_headers" and "column_headers" (dimension values per row and column),
+        "values" ({metric: [[value per column] per row]}, null where there is no data), "row_count"
+        and "column_count" (distinct values before the limits) and, with totals, "row_totals",
+        "column_totals" and "total"; or an error dictionary.
+    """
+    from google.analytics.data_v1beta.types import DateRange, Dimension, Metric, RunPivotReportRequest
+    from ga4_filters import FilterError
+
+    try:
+        property_id = str(property_id or GA4_PROPERTY_ID)
+        row_fields = _parse_fields(rows)
+        column_fields = _parse_fields(columns or [])
+        parsed_metrics = _parse_fields(metrics)
+        if not row_fields:
+            return {"error": "rows cannot be empty after parsing."}
         if not parsed_metrics:
             return {"error": "Metrics list cannot be empty after parsing."}
+        if set(row_fields) & set(column_fields):
+            return {"error": "A dimension cannot be in both rows and columns."}
+        filter_expression = metric_filter_expression = None
+        if dimension_filter or metric_filter:
+            try:
+                compiler = get_filter_compiler(property_id)
+                with phase("filter_compile"):
+                    filter_expression = compiler.compile(dimension_filter, "dimension") if dimension_filter else None
+                    metric_filter_expression = compiler.compile(metric_filter, "metric") if metric_filter else None
+            except FilterError as e:
+                return {"error": f"Invalid filter: {e}"}
+        try:
+            pivots = build_pivots(
+                row_fields, column_fields, parsed_metrics, row_limit, column_limit,
+                row_order_bys, column_order_bys, totals
+            )
+        except ValueError as e:
+            return {"error": str(e)}
 
-        # Validate dimension_filter and build FilterExpression if provided
-        filter_expression = None
-        if dimension_filter:
-            print(f"DEBUG: Processing dimension_filter: {dimension_filter}", file=sys.stderr)
-            
-            # Load valid dimensions from embedded data
-            valid_dimensions = set()
-            dims_json = load_dimensions()
-            for cat in dims_json.values():
-                valid_dimensions.update(cat.keys())
-            
-            # Parse filter input
-            if isinstance(dimension_filter, str):
-                try:
-                    filter_dict = json.loads(dimension_filter)
-                except Exception as e:
-                    return {"error": f"Failed to parse dimension_filter JSON: {e}"}
-            elif isinstance(dimension_filter, dict):
-                filter_dict = dimension_filter
-            else:
-                return {"error": "dimension_filter must be a JSON string or dict."}
-
-            # Recursive helper to build FilterExpression from dict
-            def build_filter_expr(expr):
-                try:
-                    if 'andGroup' in expr:
-                        expressions = []
-                        for e in expr['andGroup']['expressions']:
-                            built_expr = build_filter_expr(e)
-                            if built_expr is None:
-                                return None
-                            expressions.append(built_expr)
-                        return FilterExpression(and_group=FilterExpressionList(expressions=expressions))
-                    
-                    if 'orGroup' in expr:
-                        expressions = []
-                        for e in expr['orGroup']['expressions']:
-                            built_expr = build_filter_expr(e)
-                            if built_expr is None:
-                                return None
-                            expressions.append(built_expr)
-                        return FilterExpression(or_group=FilterExpressionList(expressions=expressions))
-                    
-                    if 'notExpression' in expr:
-                        built_expr = build_filter_expr(expr['notExpression'])
-                        if built_expr is None:
-                            return None
-                        return FilterExpression(not_expression=built_expr)
-                    
-                    if 'filter' in expr:
-                        f = expr['filter']
-                        field = f.get('fieldName')
-                        if not field:
-                            print(f"DEBUG: Missing fieldName in filter: {f}", file=sys.stderr)
-                            return None
-                        if field not in valid_dimensions:
-                            print(f"DEBUG: Invalid dimension '{field}'. Valid: {sorted(list(valid_dimensions))[:10]}...", file=sys.stderr)
-                            return None
-                        
-                        if 'stringFilter' in f:
-                            sf = f['stringFilter']
-                            # Map string match types to API enum values
-                            match_type_map = {
-                                'EXACT': Filter.StringFilter.MatchType.EXACT,
-                                'BEGINS_WITH': Filter.StringFilter.MatchType.BEGINS_WITH,
-                                'ENDS_WITH': Filter.StringFilter.MatchType.ENDS_WITH,
-                                'CONTAINS': Filter.StringFilter.MatchType.CONTAINS,
-                                'FULL_REGEXP': Filter.StringFilter.MatchType.FULL_REGEXP,
-                                'PARTIAL_REGEXP': Filter.StringFilter.MatchType.PARTIAL_REGEXP
-                            }
-                            match_type = match_type_map.get(sf.get('matchType', 'EXACT'), Filter.StringFilter.MatchType.EXACT)
-                            
-                            return FilterExpression(filter=Filter(
-                                field_name=field,
-                                string_filter=Filter.StringFilter(
-                                    value=sf.get('value', ''),
-                                    match_type=match_type,
-                                    case_sensitive=sf.get('caseSensitive', False)
-                                )
-                            ))
-                        
-                        if 'inListFilter' in f:
-                            ilf = f['inListFilter']
-                            return FilterExpression(filter=Filter(
-                                field_name=field,
-                                in_list_filter=Filter.InListFilter(
-                                    values=ilf.get('values', []),
-                                    case_sensitive=ilf.get('caseSensitive', False)
-                                )
-                            ))
-                    
-                    print(f"DEBUG: Unrecognized filter structure: {expr}", file=sys.stderr)
-                    return None
-                    
-                except Exception as e:
-                    print(f"DEBUG: Exception in build_filter_expr: {e}", file=sys.stderr)
-                    return None
-            
-            filter_expression = build_filter_expr(filter_dict)
-            if filter_expression is None:
-                return {"error": "Invalid or unsupported dimension_filter structure, or invalid dimension name."}
-
-        # GA4 API Call
-        client = BetaAnalyticsDataClient()
-        dimension_objects = [Dimension(name=d) for d in parsed_dimensions]
-        metric_objects = [Metric(name=m) for m in parsed_metrics]
-        request = RunReportRequest(
-            property=f"properties/{GA4_PROPERTY_ID}",
-            dimensions=dimension_objects,
-            metrics=metric_objects,
+        request = RunPivotReportRequest(
+            property=f"properties/{property_id}",
+            dimensions=[Dimension(name=d) for d in row_fields + column_fields],
+            metrics=[Metric(name=m) for m in parsed_metrics],
             date_ranges=[DateRange(start_date=date_range_start, end_date=date_range_end)],
-            dimension_filter=filter_expression if filter_expression else None
+            pivots=pivots,
+            dimension_filter=filter_expression,
+            metric_filter=metric_filter_expression,
+        )
+        date_ranges = [(date_range_start, date_range_end)]
+        cache_key = report_cache_key(
+            property_id, row_fields + column_fields, parsed_metrics, date_ranges, dimension_filter,
+            extra={"pivot": [row_fields, column_fields, int(row_limit), int(column_limit),
+                             parse_order_bys(row_order_bys), parse_order_bys(column_order_bys), bool(totals)]},
+            metric_filter=metric_filter
+        )
+        client = ScheduledClient(get_client(CREDENTIALS_PATH, property_id), property_id)
+        return cached_report(
+            cache_key, date_ranges,
+            lambda: pivot_matrix(client.run_pivot_report(request), row_fields, column_fields),
+            use_cache=use_cache
         )
-        response = client.run_report(request)
-        result = []
-        for row_idx, row in enumerate(response.rows):
-            data_row = {}
-            for i, dimension_header in enumerate(response.dimension_headers):
-                if i < len(row.dimension_values):
-                    data_row[dimension_header.name] = row.dimension_values[i].value
-                else:
-                    data_row[dimension_header.name] = None
-            for i, metric_header in enumerate(response.metric_headers):
-                if i < len(row.metric_values):
-                    data_row[metric_header.name] = row.metric_values[i].value
-                else:
-                    data_row[metric_header.name] = None
-            result.append(data_row)
-        return result
     except Exception as e:
-        error_message = f"Error fetching GA4 data: {str(e)}"
-        print(error_message, file=sys.stderr)
-        if hasattr(e, 'details'):
-            error_message += f" Details: {e.details()}"
-        return {"error": error_message}
+        return _error_response(e)
+
+@mcp.tool()
+@instrument_tool
+def get_realtime_data(
+    dimensions=["country"],
+    metrics=["activeUsers"],
+    dimension_filter=None,
+    metric_filter=None,
+    minutes=DEFAULT_MINUTES,
+    limit=None,
+    cursor=None,
+    poll_interval=REALTIME_POLL_INTERVAL,
+    property_id=None
+):
+    """
+    Retrieve realtime GA4 data (the last 30 minutes) and, on repeated calls, only what changed.
+    
+    Use this instead of get_ga4_data with 'today' for live monitoring. Every caller polling the
+    same report shares one snapshot, refreshed from the API at most once per poll_interval,
+    so many watchers cost no more quota than one. Pass back the cursor from the previous
+    call to get only the rows added or changed since then.
+    
+    Args:
+        dimensions: List of realtime dimensions (or a string representation, as for get_ga4_data), e.g.
+                    ["country"], ["unifiedScreenName"], ["minutesAgo"]. Available: appVersion, audienceId,
+                    audienceName, city, cityId, country, countryId, deviceCategory, eventName, minutesAgo,
+                    platform, streamId, streamName, unifiedScreenName and customUser:* dimensions.
+        metrics: List of realtime metrics: activeUsers, eventCount, keyEvents or screenPageViews.
+        dimension_filter: (Optional) Dimension filter, as for get_ga4_data, on realtime dimensions.
+        metric_filter: (Optional) Metric filter, as for get_ga4_data, on realtime metrics.
+        minutes: (Optional) How many recent minutes to cover: 1-30 (up to 60 on GA4 360 properties).
+        limit: (Optional) Maximum number of rows.
+        cursor: (Optional) Cursor from the previous call. Omit it to get the full snapshot.
+        poll_interval: (Optional) Maximum age in seconds of the shared snapshot before the API is called
+                       again (default GA4_REALTIME_INTERVAL or 15, at least 5).
+        property_id: (Optional) GA4 property ID to watch, with its own client, quota and shared snapshots.
+                     Defaults to the configured property.
+        
+    Returns:
+        Dictionary with "cursor" (pass it to the next call), "reset" (True when "rows" is the full
+        snapshot: first call, or the cursor is too old), "rows" (added or changed rows), "removed"
+        (dimension values of rows no longer present), "row_count", "fetched_at", "changed_at" and
+        "age_seconds"; or an error dictionary.
+    """
+    from ga4_filters import FilterError
+
+    try:
+        property_id = str(property_id or GA4_PROPERTY_ID)
+        parsed_dimensions = _parse_fields(dimensions)
+        parsed_metrics = _parse_fields(metrics)
+        if not parsed_metrics:
+            return {"error": "Metrics list cannot be empty after parsing."}
+        unknown = [d for d in parsed_dimensions if not is_realtime_dimension(d)]
+        unknown += [m for m in parsed_metrics if m not in REALTIME_METRICS]
+        if unknown:
+            return {"error": f"Not available in realtime reports: {unknown}. Use get_ga4_data for these fields."}
+        filter_expression = metric_filter_expression = None
+        if dimension_filter or metric_filter:
+            try:
+                compiler = get_realtime_filter_compiler(property_id)
+                with phase("filter_compile"):
+                    filter_expression = compiler.compile(dimension_filter, "dimension") if dimension_filter else None
+                    metric_filter_expression = compiler.compile(metric_filter, "metric") if metric_filter else None
+            except FilterError as e:
+                return {"error": f"Invalid filter: {e}"}
+        try:
+            minutes = int(minutes)
+            limit = int(limit) if limit else None
+        except ValueError as e:
+            return {"error": str(e)}
+        if not 1 <= minutes <= 60:
+            return {"error": "minutes must be between 1 and 60."}
+
+        request = build_realtime_request(
+            property_id, parsed_dimensions, parsed_metrics, filter_expression, metric_filter_expression,
+            minutes, limit
+        )
+        client = ScheduledClient(get_client(CREDENTIALS_PATH, property_id), property_id)
+        return poll_realtime(
+            type(request).serialize(request), lambda: client.run_realtime_report(request), cursor, poll_interval
+        )
+    except Exception as e:
+        return _error_response(e)
+
+@mcp.tool()
+@instrument_tool
+def export_ga4_report(
+    dimensions,
+    metrics,
+    date_range_start="28daysAgo",
+    date_range_end="yesterday",
+    dimension_filter=None,
+    metric_filter=None,
+    order_bys=None,
+    max_rows=None,
+    file_format="csv.gz",
+    output_path=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    property_id=None
+):
+    """
+    Export a full GA4 report to a CSV or Parquet file and return its path.
+    
+    Rows are written page by page as they arrive, so memory use stays flat however large
+    the report is. Use this instead of get_ga4_data for reports too large to return inline.
+    
+    Args:
+        dimensions: List of GA4 dimensions, as for get_ga4_data.
+        metrics: List of GA4 metrics, as for get_ga4_data.
+        date_range_start: Start date in YYYY-MM-DD format or relative date like '28daysAgo'.
+        date_range_end: End date in YYYY-MM-DD format or relative date like 'yesterday'.
+        dimension_filter: (Optional) Dimension filter, as for get_ga4_data.
+        metric_filter: (Optional) Metric filter, as for get_ga4_data.
+        order_bys: (Optional) Sort order, as for get_ga4_data.
+        max_rows: (Optional) Maximum number of rows to export. By default the whole report is exported.
+        file_format: (Optional) "csv.gz" (default), "csv" or "parquet" (requires pyarrow; one row group
+                     per page, dimensions dictionary-encoded).
+        output_path: (Optional) File name (or relative path) inside GA4_EXPORT_DIR (the "exports" folder of the
+                     cache directory unless set). Paths outside it and existing files are refused.
+                     Defaults to a new file name.
+        page_size: (Optional) Rows fetched and written per API call.
+        property_id: (Optional) GA4 property ID to export from, with its own client and quota.
+                     Defaults to the configured property.
+        
+    Returns:
+        Dictionary with the file path, format, number of rows and file size, or an error dictionary.
+    """
+    from ga4_export import EXPORT_FORMATS, default_export_path, export_pages, resolve_export_path
+
+    if file_format not in EXPORT_FORMATS:
+        return {"error": f"file_format must be one of {list(EXPORT_FORMATS)}."}
+    try:
+        path = resolve_export_path(output_path) if output_path else default_export_path(file_format)
+        if os.path.exists(path):
+            return {"error": f"{path} already exists; choose another output_path."}
+    except ValueError as e:
+        return {"error": str(e)}
+    try:
+        report, error = _prepare_report(
+            dimensions, metrics, date_range_start, date_range_end, dimension_filter, max_rows,
+            order_bys, metric_filter=metric_filter, property_id=property_id
+        )
+        if error:
+            return error
+        property_id = report["property_id"]
+        client = ScheduledClient(get_client(CREDENTIALS_PATH, property_id), property_id, BULK)
+        pages = iter_report_pages(client, report["request"], page_size=page_size, max_rows=report["max_rows"])
+        return export_pages(pages, path, file_format)
+    except (ImportError, FileExistsError) as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return _error_response(e)
+
+@mcp.tool()
+@instrument_tool
+def query_local_data(
+    dimensions,
+    metrics,
+    date_range_start="28daysAgo",
+    date_range_end="yesterday",
+    dimension_filter=None,
+    metric_filter=None,
+    order_bys=None,
+    limit=None,
+    offset=None,
+    time_grain=None,
+    pivot=None
+):
+    """
+    Re-aggregate GA4 data already fetched by get_ga4_data, without calling the API.
+    
+    Works on reports fetched with the date dimension, which are kept locally per day. From
+    such a report you can drop dimensions (additive metrics like sessions, screenPageViews,
+    eventCount or totalRevenue are summed), coarsen date to week/month/year, filter, take
+    the top N and pivot. For example, after fetching date x country x sessions for 90 days,
+    ask for sessions by month, or the top 5 countries.
+    
+    Args:
+        dimensions: List of dimensions (or a string representation, as for get_ga4_data). Besides the stored
+                    dimensions, year, yearMonth, month, week, isoYearIsoWeek, day and dayOfWeek are derived from date.
+        metrics: List of metrics (or a string representation). Non-additive metrics (users, rates, averages) are
+                 only available at the dimensions they were fetched with.
+        date_range_start: Start date in YYYY-MM-DD format or relative date like '28daysAgo'.
+        date_range_end: End date in YYYY-MM-DD format or relative date like 'yesterday'.
+        dimension_filter: (Optional) Filter on dimension values, as for get_ga4_data, applied before aggregation.
+        metric_filter: (Optional) Filter on metric values, as for get_ga4_data, applied after aggregation.
+        order_bys: (Optional) Sort order, e.g. ["-sessions"]. With pivot, pivoted columns ("sessions:mobile") can be used.
+        limit: (Optional) Number of rows to return after ordering, e.g. 5 for a top 5.
+        offset: (Optional) Number of rows to skip after ordering.
+        time_grain: (Optional) "day", "week", "month" or "year": replaces date in dimensions (or adds it) with
+                    date, isoYearIsoWeek, yearMonth or year.
+        pivot: (Optional) One of the dimensions, whose values become columns named "metric:value".
+        
+    Returns:
+        List of dictionaries like get_ga4_data, or an error dictionary if no stored report covers the query.
+    """
+    try:
+        report, error = _prepare_report(
+            dimensions, metrics, date_range_start, date_range_end, dimension_filter, None,
+            metric_filter=metric_filter
+        )
+        if error:
+            return error
+        if time_grain:
+            if time_grain not in TIME_GRAINS:
+                return {"error": f"time_grain must be one of {list(TIME_GRAINS)}."}
+            from google.analytics.data_v1beta.types import Dimension
+
+            request = report["request"]
+            names = [d.name for d in request.dimensions if d.name != "date"]
+            request.dimensions = [Dimension(name=d) for d in [TIME_GRAINS[time_grain]] + names]
+        report.update(order_bys=order_bys, limit=int(limit) if limit else None, offset=int(offset) if offset else None)
+        rows = _query_store(report, pivot, rollups=True)
+        if rows is None:
+            return {"error": "No stored report covers this query. Fetch it once with get_ga4_data, including the "
+                             "'date' dimension and every dimension and metric needed (no order_bys or limit), "
+                             "then query it here."}
+        return rows
+    except ImportError:
+        return {"error": "Local queries require pandas: pip install pandas"}
+    except ValueError as e:
+        return {"error": str(e)}
+
+@mcp.tool()
+@instrument_tool
+def get_quota_status():
+    """
+    Show the GA4 API quota the server has seen for each property, and its request queue.
+    
+    Quota figures come from the propertyQuota returned with every report, so they are
+    only as fresh as the last report run against the property.
+    
+    Returns:
+        Dictionary keyed by property ID with quota consumed/remaining, in-flight and
+        queued calls by priority, current backoff and throttling counts.
+    """
+    return quota_scheduler.snapshot()
+
+@mcp.tool()
+@instrument_tool
+def server_stats(output_format="json"):
+    """
+    Show where time goes inside the server: per-tool and per-property latency, phase timings and counters.
+    
+    Latencies are in seconds, with percentiles estimated from fixed histogram buckets. Phases
+    are parse, filter_compile, client, queue (waiting for quota), api, decode, cache_read,
+    cache_write and serialize (sampled); each counts its own time only.
+    
+    Args:
+        output_format: (Optional) "json" (default) for a summary, or "prometheus" for every histogram
+                       and counter in the Prometheus text format, e.g. for a textfile collector.
+        
+    Returns:
+        Dictionary with uptime, "histograms" ({name: [{labels..., count, mean, p50, p95, p99, max}]}),
+        "counters", and the report cache, request coalescing and realtime feed statistics;
+        or {"content_type", "text"} for output_format="prometheus".
+    """
+    if output_format == "prometheus":
+        return {"content_type": "text/plain; version=0.0.4", "text": render_prometheus()}
+    if output_format != "json":
+        return {"error": "output_format must be 'json' or 'prometheus'."}
+    from ga4_cache import get_report_cache
+    from ga4_realtime import realtime_stats
+    from ga4_singleflight import report_flights
+
+    stats = telemetry_snapshot()
+    cache = get_report_cache()
+    stats["report_cache"] = cache.stats() if cache is not None else None
+    stats["coalescing"] = report_flights.stats()
+    stats["realtime"] = realtime_stats()
+    return stats
 
 def main():
     """Main entry point for the MCP server"""
+    # Set environment variables
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIALS_PATH
+    os.environ["GA4_PROPERTY_ID"] = GA4_PROPERTY_ID
+
+    # Validate credentials file exists
+    if not os.path.exists(CREDENTIALS_PATH):
+        print(f"ERROR: Credentials file not found: {CREDENTIALS_PATH}", file=sys.stderr)
+        print("Please check the credentials path", file=sys.stderr)
+        sys.exit(1)
+
     print("Starting GA4 MCP server...", file=sys.stderr)
-    mcp.run(transport="stdio")
+    try:
+        mcp.run(transport="stdio")
+    finally:
+        # Only close clients if a data call loaded the client pool
+        client_pool = sys.modules.get("ga4_client_pool")
+        if client_pool is not None:
+            client_pool.shutdown()
 
 # Start the server when run directly
 if __name__ == "__main__":
@@ -0,0 +1,243 @@
+"""
+Live dimension and metric catalog from the Data API's GetMetadata.
+
+GetMetadata returns every dimension and metric a property accepts, including
+its custom definitions (customEvent:*, customUser:*, ...). The response is
+kept in memory and on disk under GA4_CACHE_DIR for METADATA_TTL, so only the
+first call per property and day reaches the API. MetadataCatalog indexes it
+by name (O(1) validation), by category (for the catalog tools) and by sorted
+name (for prefix lookups such as every "customEvent:" dimension).
+
+If metadata cannot be fetched (no credentials, API error) the bundled static
+catalog in ga4_catalog is used instead and the fetch is retried later.
+"""
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from ga4_cache import DEFAULT_CACHE_DIR
+
+METADATA_TTL = 24 * 60 * 60
+# How long to wait before retrying after a failed fetch
+METADATA_RETRY_AFTER = 5 * 60
+
+
+def fetch_metadata(client, property_id):
+    """
+    Fetch a property's metadata and convert it to a JSON-serializable dict.
+
+    Returns:
+        {"dimensions": [...], "metrics": [...]}, each field a dict with apiName, uiName,
+        description, category, customDefinition and deprecatedApiNames (metrics also have type).
+    """
+    from google.analytics.data_v1beta.types import MetricType
+
+    metadata = client.get_metadata(name=f"properties/{property_id}/metadata")
+    fields = {"dimensions": [], "metrics": []}
+    for kind, items in (("dimensions", metadata.dimensions), ("metrics", metadata.metrics)):
+        for item in items:
+            field = {
+                "apiName": item.api_name,
+                "uiName": item.ui_name,
+                "description": item.description,
+                "category": item.category or "Other",
+                "customDefinition": bool(item.custom_definition),
+                "deprecatedApiNames": list(item.deprecated_api_names),
+            }
+            if kind == "metrics":
+                field["type"] = MetricType(item.type_).name
+            fields[kind].append(field)
+    return fields
+
+
+class MetadataCatalog:
+    """Indexed dimensions and metrics of one property."""
+
+    def __init__(self, data, source="api", expires_at=None):
+        self.source = source
+        self.expires_at = expires_at
+        self.dimensions = {d["apiName"]: d for d in data["dimensions"]}
+        self.metrics = {m["apiName"]: m for m in data["metrics"]}
+        self.aliases = {
+            old: field["apiName"]
+            for field in data["dimensions"] + data["metrics"]
+            for old in field.get("deprecatedApiNames", [])
+        }
+        self.dimension_categories = _group_by_category(data["dimensions"])
+        self.metric_categories = _group_by_category(data["metrics"])
+        self._dimension_category_keys = {_category_key(c): c for c in self.dimension_categories}
+        self._metric_category_keys = {_category_key(c): c for c in self.metric_categories}
+        self._sorted_dimensions = sorted(self.dimensions)
+        self._sorted_metrics = sorted(self.metrics)
+
+    @classmethod
+    def from_categories(cls, dimension_categories, metric_categories, source="static", expires_at=None):
+        """Build a catalog from {category: {name: description}} dicts, as in ga4_catalog."""
+        def fields(categories):
+            return [
+                {"apiName": name, "uiName": name, "description": description, "category": category,
+                 "customDefinition": False, "deprecatedApiNames": []}
+                for category, names in categories.items() for name, description in names.items()
+            ]
+        return cls({"dimensions": fields(dimension_categories), "metrics": fields(metric_categories)},
+                   source, expires_at)
+
+    def is_dimension(self, name):
+        return name in self.dimensions
+
+    def is_metric(self, name):
+        return name in self.metrics
+
+    def resolve(self, name):
+        """Return the current API name for a field, following deprecated names."""
+        return self.aliases.get(name, name)
+
+    def find_category(self, category, kind="dimension"):
+        """
+        Look up a category, ignoring case, punctuation and a "_metrics" suffix, so both the
+        bundled names ('traffic_source', 'user_metrics') and the API's ('Traffic source', 'User')
+        work. Returns {name: description} or None.
+        """
+        if kind == "dimension":
+            key = self._dimension_category_keys.get(_category_key(category))
+            return self.dimension_categories.get(key)
+        key = self._metric_category_keys.get(_category_key(category))
+        return self.metric_categories.get(key)
+
+    def with_prefix(self, prefix, kind="dimension"):
+        """Return the sorted field names starting with prefix, e.g. every "customEvent:" dimension."""
+        names = self._sorted_dimensions if kind == "dimension" else self._sorted_metrics
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + "\uffff")
+        return names[start:end]
+
+    def is_fresh(self):
+        return self.expires_at is None or time.time() < self.expires_at
+
+
+def _category_key(category):
+    key = re.sub(r"[^a-z0-9]+", " ", str(category).lower()).strip()
+    return key[:-len(" metrics")] if key.endswith(" metrics") else key
+
+
+def _group_by_category(fields):
+    categories = {}
+    for field in fields:
+        categories.setdefault(field["category"], {})[field["apiName"]] = field["description"]
+    return categories
+
+
+def static_catalog(expires_at=None):
+    """Catalog built from the bundled, hand-maintained ga4_catalog lists."""
+    from ga4_catalog import GA4_DIMENSIONS, GA4_METRICS
+    return MetadataCatalog.from_categories(GA4_DIMENSIONS, GA4_METRICS, expires_at=expires_at)
+
+
+def _cache_path(property_id):
+    cache_dir = os.environ.get("GA4_CACHE_DIR", DEFAULT_CACHE_DIR)
+    return os.path.join(cache_dir, f"metadata-{property_id}.json")
+
+
+def _read_cached(property_id, allow_stale=False):
+    try:
+        with open(_cache_path(property_id)) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not allow_stale and time.time() - data.get("fetched_at", 0) > METADATA_TTL:
+        return None
+    return data
+
+
+def _write_cached(property_id, data):
+    path = _cache_path(property_id)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"DEBUG: Could not write metadata cache: {e}", file=sys.stderr)
+
+
+_catalogs = {}
+# Guards _catalogs and _fetch_locks only; each property's fetch holds its own lock, so
+# properties fetch their metadata in parallel and nothing waits on another's GetMetadata
+_catalogs_lock = threading.Lock()
+_fetch_locks = {}
+
+
+def _load_cached(property_id):
+    """Build a catalog from the fresh disk cache and keep it in memory, or return None."""
+    data = _read_cached(property_id)
+    if data is None:
+        return None
+    catalog = MetadataCatalog(data, "api", expires_at=data["fetched_at"] + METADATA_TTL)
+    with _catalogs_lock:
+        _catalogs[property_id] = catalog
+    return catalog
+
+
+def cached_metadata_catalog(property_id):
+    """
+    Return a property's catalog if it is in memory or fresh on disk, without fetching it.
+
+    Returns:
+        A MetadataCatalog, or None if the metadata has not been fetched (or has expired).
+    """
+    property_id = str(property_id)
+    with _catalogs_lock:
+        catalog = _catalogs.get(property_id)
+    if catalog is not None and catalog.is_fresh():
+        return catalog
+    return _load_cached(property_id)
+
+
+def get_metadata_catalog(property_id, client_factory, refresh=False):
+    """
+    Return the metadata catalog of a property, fetching it at most once per METADATA_TTL.
+
+    Args:
+        property_id: GA4 property ID.
+        client_factory: Zero-argument callable returning a client with get_metadata
+                        (only called when the metadata has to be fetched).
+        refresh: If True, ignore the memory and disk caches and fetch again.
+
+    Returns:
+        A MetadataCatalog. Its source is "api" for live or cached metadata, "stale" for an
+        expired copy used because the fetch failed, or "static" for the bundled catalog.
+    """
+    property_id = str(property_id)
+    with _catalogs_lock:
+        catalog = _catalogs.get(property_id)
+        if catalog is not None and catalog.is_fresh() and not refresh:
+            return catalog
+        fetch_lock = _fetch_locks.setdefault(property_id, threading.Lock())
+
+    with fetch_lock:
+        # Another caller may have fetched it while this one waited
+        if not refresh:
+            catalog = cached_metadata_catalog(property_id)
+            if catalog is not None:
+                return catalog
+
+        try:
+            data = fetch_metadata(client_factory(), property_id)
+            data["fetched_at"] = time.time()
+            _write_cached(property_id, data)
+            catalog = MetadataCatalog(data, "api", expires_at=data["fetched_at"] + METADATA_TTL)
+        except Exception as e:
+            print(f"DEBUG: Could not fetch GA4 metadata, using the cached or bundled catalog: {e}", file=sys.stderr)
+            data = _read_cached(property_id, allow_stale=True)
+            if data is None:
+                catalog = static_catalog(expires_at=time.time() + METADATA_RETRY_AFTER)
+            else:
+                catalog = MetadataCatalog(data, "stale", expires_at=time.time() + METADATA_RETRY_AFTER)
+        with _catalogs_lock:
+            _catalogs[property_id] = catalog
+        return catalog
@@ -0,0 +1,146 @@
+"""
+Server-side pivot reports (RunPivotReport) returned as a compact matrix.
+
+A flat report of country x deviceCategory returns every combination that has
+data, and the client pivots it afterwards. A pivot report instead takes one
+limit and ordering per axis: the API ranks the values of each axis (by default
+by the first metric, descending), keeps the top ones and only returns the
+cells where a kept row meets a kept column. pivot_matrix lays those cells out
+as {metric: [[value per column] per row]} with the axis labels listed once,
+instead of repeating every dimension value in every row.
+"""
+from ga4_reports import build_order_bys, parse_order_bys
+from ga4_telemetry import phase
+
+# The product of the pivot limits may not exceed this
+MAX_PIVOT_CELLS = 250000
+DEFAULT_ROW_LIMIT = 10
+DEFAULT_COLUMN_LIMIT = 10
+
+# Dimension value the API uses in aggregate rows (RESERVED_TOTAL, RESERVED_MIN, ...)
+RESERVED_PREFIX = "RESERVED_"
+
+
+def build_pivots(row_fields, column_fields, metrics, row_limit=DEFAULT_ROW_LIMIT, column_limit=DEFAULT_COLUMN_LIMIT,
+                 row_order_bys=None, column_order_bys=None, totals=False):
+    """
+    Build the Pivot protos of a rows x columns report.
+
+    Args:
+        row_fields: Dimensions forming the rows.
+        column_fields: Dimensions forming the columns (may be empty for a single pivot).
+        metrics: Metric names of the report.
+        row_limit: Number of row values (combinations of row_fields) to keep.
+        column_limit: Number of column values to keep.
+        row_order_bys: Ordering of the rows, as for parse_order_bys (default: first metric, descending).
+        column_order_bys: Ordering of the columns (default: first metric, descending).
+        totals: Also ask for the total of each row and column.
+
+    Returns:
+        List of Pivot objects, the rows' first.
+
+    Raises:
+        ValueError: If a limit is not positive, the limits multiply to more than MAX_PIVOT_CELLS,
+                    or an ordering names a field outside its axis.
+    """
+    from google.analytics.data_v1beta.types import MetricAggregation, Pivot
+
+    row_limit, column_limit = int(row_limit), int(column_limit)
+    if row_limit < 1 or column_limit < 1:
+        raise ValueError("row_limit and column_limit must be at least 1.")
+    if column_fields and row_limit * column_limit > MAX_PIVOT_CELLS:
+        raise ValueError(f"row_limit x column_limit may not exceed {MAX_PIVOT_CELLS} cells.")
+
+    axes = [(row_fields, row_limit, row_order_bys)]
+    if column_fields:
+        axes.append((column_fields, column_limit, column_order_bys))
+    pivots = []
+    for fields, limit, order_bys in axes:
+        parsed = parse_order_bys(order_bys) or [(metrics[0], True)]
+        pivots.append(Pivot(
+            field_names=list(fields),
+            order_bys=build_order_bys(parsed, list(fields), metrics),
+            limit=limit,
+            metric_aggregations=[MetricAggregation.TOTAL] if totals else [],
+        ))
+    return pivots
+
+
+def _number(value, metric_type):
+    if value in (None, ""):
+        return None
+    if metric_type == "TYPE_INTEGER":
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return float(value)
+
+
+@phase("decode")
+def pivot_matrix(response, row_fields, column_fields):
+    """
+    Convert a RunPivotReportResponse to a matrix.
+
+    Returns:
+        Dictionary with "rows" and "columns" (the axis dimensions), "metrics", "row_headers" and
+        "column_headers" (one list of dimension values per row/column, in the API's order),
+        "values" ({metric: [[value per column] per row]}, None where the cell has no data),
+        "row_count" and "column_count" (how many distinct values each axis has before the limits)
+        and, if totals were requested, "row_totals", "column_totals" and "total".
+    """
+    from google.analytics.data_v1beta.types import MetricType
+
+    dimensions = [h.name for h in response.dimension_headers]
+    metrics = [h.name for h in response.metric_headers]
+    types = [MetricType(h.type_).name for h in response.metric_headers]
+    row_positions = [dimensions.index(d) for d in row_fields]
+    column_positions = [dimensions.index(d) for d in column_fields]
+
+    def headers(pivot_header):
+        return [[v.value for v in h.dimension_values] for h in pivot_header.pivot_dimension_headers]
+
+    row_headers = headers(response.pivot_headers[0])
+    column_headers = headers(response.pivot_headers[1]) if column_fields else [[]]
+    row_index = {tuple(h): i for i, h in enumerate(row_headers)}
+    column_index = {tuple(h): i for i, h in enumerate(column_headers)}
+
+    values = {m: [[None] * len(column_headers) for _ in row_headers] for m in metrics}
+    row_totals = {m: [None] * len(row_headers) for m in metrics}
+    column_totals = {m: [None] * len(column_headers) for m in metrics}
+    total = {}
+    for row in list(response.rows) + list(response.aggregates):
+        dimension_values = [v.value for v in row.dimension_values]
+        row_key = tuple(dimension_values[p] for p in row_positions)
+        column_key = tuple(dimension_values[p] for p in column_positions)
+        row_aggregate = any(v.startswith(RESERVED_PREFIX) for v in row_key)
+        column_aggregate = any(v.startswith(RESERVED_PREFIX) for v in column_key)
+        cells = {m: _number(v.value, t) for m, v, t in zip(metrics, row.metric_values, types)}
+        if row_aggregate and (column_aggregate or not column_fields):
+            total = cells
+        elif row_aggregate:
+            if column_key in column_index:
+                for m, value in cells.items():
+                    column_totals[m][column_index[column_key]] = value
+        elif column_aggregate:
+            if row_key in row_index:
+                for m, value in cells.items():
+                    row_totals[m][row_index[row_key]] = value
+        elif row_key in row_index and column_key in column_index:
+            i, j = row_index[row_key], column_index[column_key]
+            for m, value in cells.items():
+                values[m][i][j] = value
+
+    result = {
+        "rows": list(row_fields),
+        "columns": list(column_fields),
+        "metrics": metrics,
+        "row_headers": row_headers,
+        "column_headers": column_headers,
+        "values": values,
+        "row_count": response.pivot_headers[0].row_count,
+        "column_count": response.pivot_headers[1].row_count if column_fields else 1,
+    }
+    if total or any(v is not None for m in metrics for v in row_totals[m] + column_totals[m]):
+        result.update(row_totals=row_totals, column_totals=column_totals, total=total)
+    return result
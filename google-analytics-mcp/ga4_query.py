@@ -0,0 +1,291 @@
+"""
+Local analytical queries over report rows already stored on disk.
+
+Many follow-up questions re-aggregate data that was already fetched: the same
+report by month instead of by date, the top 5 countries of a country-by-date
+report, or one dimension pivoted into columns. This module answers them with
+vectorized pandas operations over the rows kept in the day-partitioned store
+(ga4_store), so they cost no API call:
+
+- rollups: dimensions are dropped and additive metrics summed;
+- time-grain coarsening: year, yearMonth, month, week, isoYearIsoWeek, day
+  and dayOfWeek are derived from the date dimension;
+- filtering: dimension and metric filters in the GA4 filter JSON shape are
+  evaluated locally, before and after aggregation as the API does;
+- ordering, top-N (limit/offset) and pivots.
+
+Non-additive metrics (users, rates, averages) can only be returned at the
+grain they were stored at. Requires pandas.
+"""
+import json
+import operator
+from functools import reduce
+
+from ga4_reports import parse_order_bys
+from ga4_sharding import is_additive_metric
+
+# Time dimensions that can be derived from the date dimension (YYYYMMDD), as strftime formats
+DATE_FORMATS = {"year": "%Y", "yearMonth": "%Y%m", "month": "%m", "day": "%d"}
+DERIVED_TIME_DIMENSIONS = tuple(DATE_FORMATS) + ("week", "isoYearIsoWeek", "dayOfWeek")
+
+# time_grain values accepted by the query tool, mapped to the dimension they produce
+TIME_GRAINS = {"day": "date", "week": "isoYearIsoWeek", "month": "yearMonth", "year": "year"}
+# Grains a date dimension can be rolled up to without summing across any other dimension
+COARSER_DATE_GRAINS = frozenset(("isoYearIsoWeek", "yearMonth", "year"))
+
+NUMERIC_COMPARISONS = {
+    "EQUAL": operator.eq, "LESS_THAN": operator.lt, "LESS_THAN_OR_EQUAL": operator.le,
+    "GREATER_THAN": operator.gt, "GREATER_THAN_OR_EQUAL": operator.ge,
+}
+
+
+def _pandas():
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError("pandas is required for local queries: pip install pandas")
+    return pd
+
+
+def _parse_filter(spec):
+    return json.loads(spec) if isinstance(spec, str) else spec
+
+
+def filter_fields(spec):
+    """Return the set of field names a filter (dict or JSON string) refers to."""
+    spec = _parse_filter(spec)
+    if not spec:
+        return set()
+    for group in ("andGroup", "orGroup"):
+        if group in spec:
+            return set().union(*(filter_fields(e) for e in spec[group]["expressions"]))
+    if "notExpression" in spec:
+        return filter_fields(spec["notExpression"])
+    return {spec["filter"]["fieldName"]}
+
+
+def derivable_dimensions(source_dimensions):
+    """Dimensions a stored report can be queried by: its own, plus time grains derived from date."""
+    derivable = set(source_dimensions)
+    if "date" in derivable:
+        derivable.update(DERIVED_TIME_DIMENSIONS)
+    return derivable
+
+
+def is_regrain(source_dimensions, dimensions):
+    """
+    Check whether dimensions are source_dimensions, or the same with date replaced by a coarser grain.
+
+    Only these queries return exactly what the API would: dropping any other dimension
+    would sum metrics like sessions or users across values that overlap.
+    """
+    source_dimensions, dimensions = set(source_dimensions), set(dimensions)
+    if dimensions == source_dimensions:
+        return True
+    if "date" not in source_dimensions or "date" in dimensions:
+        return False
+    grains = dimensions - source_dimensions
+    return bool(grains) and grains <= COARSER_DATE_GRAINS and dimensions - grains == source_dimensions - {"date"}
+
+
+def can_derive(source, dimensions, metrics, dimension_filter=None, metric_filter=None):
+    """
+    Check whether a query can be answered from a stored report.
+
+    Args:
+        source: The stored report's description (see ga4_store.describe_report).
+        dimensions: Requested dimensions.
+        metrics: Requested metrics.
+        dimension_filter: Requested dimension filter (dict or JSON string), if any.
+        metric_filter: Requested metric filter (dict or JSON string), if any.
+
+    Returns:
+        True if the rows of source contain everything needed to compute the query.
+    """
+    if source["metric_filter"]:
+        return False
+    if not set(dimensions) <= derivable_dimensions(source["dimensions"]):
+        return False
+    if not set(metrics) <= set(source["metrics"]):
+        return False
+    if source["dimension_filter"]:
+        # The stored rows are already filtered, so only the same filter can be asked for
+        if not dimension_filter or json.loads(source["dimension_filter"]) != _parse_filter(dimension_filter):
+            return False
+    elif dimension_filter and not filter_fields(dimension_filter) <= set(source["dimensions"]):
+        return False
+    if metric_filter and not filter_fields(metric_filter) <= set(metrics):
+        return False
+    if set(dimensions) != set(source["dimensions"]):
+        return all(is_additive_metric(m) for m in metrics)
+    return True
+
+
+def _numeric(value):
+    if isinstance(value, dict):
+        value = value.get("int64Value", value.get("doubleValue"))
+    return float(value)
+
+
+def filter_mask(frame, spec):
+    """
+    Evaluate a GA4 filter expression over a DataFrame.
+
+    Args:
+        frame: DataFrame with a column per field the filter refers to.
+        spec: Filter expression as a dict or JSON string (andGroup, orGroup,
+              notExpression, filter with stringFilter, inListFilter,
+              numericFilter, betweenFilter or emptyFilter).
+
+    Returns:
+        Boolean Series, True for rows that match.
+    """
+    spec = _parse_filter(spec)
+    if "andGroup" in spec:
+        return reduce(operator.and_, (filter_mask(frame, e) for e in spec["andGroup"]["expressions"]))
+    if "orGroup" in spec:
+        return reduce(operator.or_, (filter_mask(frame, e) for e in spec["orGroup"]["expressions"]))
+    if "notExpression" in spec:
+        return ~filter_mask(frame, spec["notExpression"])
+
+    f = spec["filter"]
+    column = frame[f["fieldName"]]
+    if "stringFilter" in f:
+        sf = f["stringFilter"]
+        case_sensitive = sf.get("caseSensitive", False)
+        match_type = sf.get("matchType", "EXACT")
+        value = str(sf.get("value", ""))
+        text = column.astype(str)
+        if match_type == "FULL_REGEXP":
+            return text.str.fullmatch(value, case=case_sensitive)
+        if match_type == "PARTIAL_REGEXP":
+            return text.str.contains(value, case=case_sensitive, regex=True)
+        if not case_sensitive:
+            text, value = text.str.lower(), value.lower()
+        if match_type == "BEGINS_WITH":
+            return text.str.startswith(value)
+        if match_type == "ENDS_WITH":
+            return text.str.endswith(value)
+        if match_type == "CONTAINS":
+            return text.str.contains(value, regex=False)
+        return text == value
+    if "inListFilter" in f:
+        ilf = f["inListFilter"]
+        values = [str(v) for v in ilf["values"]]
+        if ilf.get("caseSensitive", False):
+            return column.astype(str).isin(values)
+        return column.astype(str).str.lower().isin([v.lower() for v in values])
+    if "numericFilter" in f:
+        nf = f["numericFilter"]
+        return NUMERIC_COMPARISONS[nf.get("operation", "EQUAL")](column.astype(float), _numeric(nf["value"]))
+    if "betweenFilter" in f:
+        bf = f["betweenFilter"]
+        return column.astype(float).between(_numeric(bf["fromValue"]), _numeric(bf["toValue"]))
+    return column.isna() | (column.astype(str) == "")
+
+
+def _add_time_dimensions(frame, dimensions):
+    """Add the requested time dimensions derived from the date column."""
+    pd = _pandas()
+    wanted = [d for d in dimensions if d in DERIVED_TIME_DIMENSIONS and d not in frame.columns]
+    if not wanted:
+        return frame
+    dates = pd.to_datetime(frame["date"], format="%Y%m%d")
+    for name in wanted:
+        if name in DATE_FORMATS:
+            frame[name] = dates.dt.strftime(DATE_FORMATS[name])
+        elif name == "week":
+            # GA4 puts January 1 in week 01 and starts a new week on each Sunday, unlike %U,
+            # which numbers the days before the first Sunday as week 00
+            jan1_weekday = (dates.dt.dayofweek - dates.dt.dayofyear + 2) % 7
+            frame[name] = ((dates.dt.dayofyear - 1 + jan1_weekday) // 7 + 1).astype(str).str.zfill(2)
+        elif name == "isoYearIsoWeek":
+            iso = dates.dt.isocalendar()
+            frame[name] = iso["year"].astype(str) + iso["week"].astype(str).str.zfill(2)
+        else:
+            # GA4 numbers days of the week from Sunday = 0
+            frame[name] = ((dates.dt.dayofweek + 1) % 7).astype(str)
+    return frame
+
+
+def _format_value(value):
+    """Format a metric value the way the Data API does: integers without a decimal point."""
+    if value != value:
+        return ""
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def derive_report(rows, source_dimensions, source_metrics, dimensions, metrics, dimension_filter=None,
+                  metric_filter=None, order_bys=None, limit=None, offset=None, pivot=None):
+    """
+    Compute a report from stored rows of a finer-grained report.
+
+    Callers should check can_derive first; this function assumes the query is derivable.
+
+    Args:
+        rows: Stored rows (dicts of strings), as returned by the API.
+        source_dimensions: Dimensions of the stored rows.
+        source_metrics: Metrics of the stored rows.
+        dimensions: Dimensions to group by; may include time grains derived from date.
+        metrics: Metrics to return, summed over dropped dimensions.
+        dimension_filter: Optional dimension filter applied before aggregation.
+        metric_filter: Optional metric filter applied after aggregation.
+        order_bys: Optional sort order, as accepted by parse_order_bys.
+        limit: Optional number of rows to return after ordering.
+        offset: Optional number of rows to skip after ordering.
+        pivot: Optional dimension whose values become columns named "metric:value".
+
+    Returns:
+        List of row dictionaries with string values, like get_ga4_data.
+
+    Raises:
+        ValueError: If order_bys or pivot name a field that is not in the result.
+    """
+    pd = _pandas()
+    dimensions = list(dimensions)
+    metrics = list(metrics)
+    frame = pd.DataFrame.from_records(rows, columns=list(source_dimensions) + list(source_metrics))
+    for m in metrics:
+        frame[m] = pd.to_numeric(frame[m], errors="coerce")
+    frame = _add_time_dimensions(frame, dimensions)
+
+    if dimension_filter:
+        frame = frame[filter_mask(frame, dimension_filter)]
+    if set(dimensions) != set(source_dimensions):
+        frame = frame.groupby(dimensions, sort=False, dropna=False)[metrics].sum().reset_index()
+    else:
+        frame = frame[dimensions + metrics]
+    if metric_filter:
+        frame = frame[filter_mask(frame, metric_filter)]
+
+    columns = dimensions + metrics
+    if pivot:
+        if pivot not in dimensions:
+            raise ValueError(f"pivot must be one of the requested dimensions {dimensions}, got '{pivot}'.")
+        index = [d for d in dimensions if d != pivot]
+        if not index:
+            frame = frame.assign(_all="")
+            index = ["_all"]
+        frame = frame.pivot_table(index=index, columns=pivot, values=metrics, aggfunc="sum", fill_value=0, sort=False)
+        frame.columns = [f"{m}:{value}" for m, value in frame.columns]
+        frame = frame.reset_index().drop(columns=["_all"], errors="ignore")
+        metrics = [c for c in frame.columns if c not in index]
+        columns = [d for d in index if d != "_all"] + metrics
+
+    parsed_order_bys = parse_order_bys(order_bys)
+    if parsed_order_bys:
+        unknown = [name for name, _ in parsed_order_bys if name not in columns]
+        if unknown:
+            raise ValueError(f"Cannot order by {unknown}: not in the result columns {columns}.")
+        frame = frame.sort_values(
+            by=[name for name, _ in parsed_order_bys],
+            ascending=[not desc for _, desc in parsed_order_bys],
+            kind="stable",
+        )
+    start = int(offset or 0)
+    frame = frame.iloc[start:start + int(limit)] if limit else frame.iloc[start:]
+
+    frame = frame.assign(**{m: frame[m].map(_format_value) for m in metrics})
+    return frame[columns].astype(str).to_dict("records")
@@ -0,0 +1,367 @@
+"""
+Quota-aware scheduling of GA4 Data API calls.
+
+GA4 enforces per-property token quotas (per hour and per day, plus a
+per-project hourly share) and a cap on concurrent requests. Every request sent
+through a ScheduledClient sets return_property_quota, and the scheduler keeps
+the latest PropertyQuota reported for each property. Before each call it
+decides whether to admit it now, hold it in a priority queue, or fail fast:
+
+- interactive calls (tool calls, dashboard panels) are always queued ahead of
+  bulk work (exports, sharded and multi-property fan-out);
+- bulk calls may use only part of the concurrency limit, and pause while less
+  than BULK_TOKEN_RESERVE of the hourly tokens remain, so interactive calls
+  keep working on the rest;
+- a call fails fast with QuotaExhaustedError once hourly or daily tokens are
+  gone, instead of queueing for up to a day;
+- RESOURCE_EXHAUSTED responses put the property into exponential backoff with
+  full jitter, and the call is retried up to MAX_RETRIES times.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from ga4_telemetry import observe, phase
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# GA4 standard properties allow 10 concurrent requests
+MAX_CONCURRENT_PER_PROPERTY = 10
+# Bulk calls may hold at most this share of the concurrent slots...
+BULK_MAX_SHARE = 0.5
+# ...and wait while less than this fraction of the hourly tokens is left
+BULK_TOKEN_RESERVE = 0.2
+# How long a bulk call waits for quota before giving up, in seconds
+BULK_MAX_WAIT = 300
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+# How often a waiting bulk call re-checks the token reserve, in seconds
+RESERVE_POLL_INTERVAL = 5.0
+# Quota figures older than this are ignored, so an exhausted property is retried
+# once its hourly quota may have recovered
+QUOTA_STALE_AFTER = 300
+
+QUOTA_FIELDS = (
+    "tokens_per_day", "tokens_per_hour", "tokens_per_project_per_hour", "concurrent_requests",
+    "server_errors_per_project_per_hour", "potentially_thresholded_requests_per_hour",
+)
+
+
+class QuotaExhaustedError(RuntimeError):
+    """Raised when a call cannot be admitted because the property's quota is used up."""
+
+
+class _PropertyState:
+    def __init__(self):
+        self.quota = {}
+        self.quota_updated_at = None
+        self.in_flight = {INTERACTIVE: 0, BULK: 0}
+        self.waiting = []
+        self.backoff_until = 0.0
+        self.consecutive_exhausted = 0
+        self.throttled = 0
+        self.calls = 0
+
+
+class QuotaScheduler:
+    """Admits, delays and prioritizes report calls per property based on reported quota."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_PER_PROPERTY):
+        self.max_concurrent = max_concurrent
+        self._cond = threading.Condition()
+        self._states = {}
+        self._seq = itertools.count()
+
+    def _state(self, property_id):
+        state = self._states.get(property_id)
+        if state is None:
+            state = self._states[property_id] = _PropertyState()
+        return state
+
+    def _remaining_fraction(self, quota, field):
+        status = quota.get(field)
+        if not status:
+            return None
+        total = status["consumed"] + status["remaining"]
+        return status["remaining"] / total if total else None
+
+    def _try_admit(self, state, ticket, now):
+        """
+        Decide whether the queued ticket may run now. Called with the condition held.
+
+        Returns:
+            (True, 0) to admit, or (False, seconds) to wait that long before checking again.
+
+        Raises:
+            QuotaExhaustedError: If hourly or daily tokens are used up.
+        """
+        priority = ticket[0]
+        fresh = state.quota_updated_at is not None and now - state.quota_updated_at < QUOTA_STALE_AFTER
+        quota = state.quota if fresh else {}
+        for field in ("tokens_per_hour", "tokens_per_day", "tokens_per_project_per_hour"):
+            status = quota.get(field)
+            if status and status["remaining"] <= 0:
+                raise QuotaExhaustedError(
+                    f"GA4 quota {field} is exhausted for this property "
+                    f"({status['consumed']} tokens consumed). Try again later or narrow the request."
+                )
+        if now < state.backoff_until:
+            return False, state.backoff_until - now
+        if state.waiting[0] != ticket:
+            return False, None
+        if sum(state.in_flight.values()) >= self.max_concurrent:
+            return False, None
+        if priority == BULK:
+            if state.in_flight[BULK] >= max(1, int(self.max_concurrent * BULK_MAX_SHARE)):
+                return False, None
+            for field in ("tokens_per_hour", "tokens_per_project_per_hour"):
+                fraction = self._remaining_fraction(quota, field)
+                if fraction is not None and fraction < BULK_TOKEN_RESERVE:
+                    return False, RESERVE_POLL_INTERVAL
+        return True, 0
+
+    def _admit(self, state, ticket):
+        state.waiting.remove(ticket)
+        heapq.heapify(state.waiting)
+        state.in_flight[ticket[0]] += 1
+        state.calls += 1
+
+    def _abandon(self, state, ticket):
+        if ticket in state.waiting:
+            state.waiting.remove(ticket)
+            heapq.heapify(state.waiting)
+            self._cond.notify_all()
+
+    def acquire(self, property_id, priority=INTERACTIVE, timeout=None):
+        """
+        Block until a call for property_id may run, then take a concurrency slot.
+
+        Args:
+            property_id: GA4 property ID.
+            priority: INTERACTIVE or BULK.
+            timeout: Maximum seconds to wait (defaults to BULK_MAX_WAIT for bulk calls, unlimited otherwise).
+
+        Raises:
+            QuotaExhaustedError: If quota is exhausted or the wait times out.
+        """
+        if timeout is None and priority == BULK:
+            timeout = BULK_MAX_WAIT
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._cond:
+            state = self._state(property_id)
+            ticket = (priority, next(self._seq))
+            heapq.heappush(state.waiting, ticket)
+            try:
+                while True:
+                    admitted, wait = self._try_admit(state, ticket, time.time())
+                    if admitted:
+                        self._admit(state, ticket)
+                        return
+                    if deadline is not None:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            raise QuotaExhaustedError("Timed out waiting for GA4 quota for this property.")
+                        wait = min(wait, left) if wait else left
+                    self._cond.wait(wait)
+            except BaseException:
+                self._abandon(state, ticket)
+                raise
+
+    async def acquire_async(self, property_id, priority=INTERACTIVE, timeout=None):
+        """Async counterpart of acquire; waits with asyncio.sleep instead of blocking a thread."""
+        if timeout is None and priority == BULK:
+            timeout = BULK_MAX_WAIT
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._cond:
+            state = self._state(property_id)
+            ticket = (priority, next(self._seq))
+            heapq.heappush(state.waiting, ticket)
+        try:
+            while True:
+                with self._cond:
+                    admitted, wait = self._try_admit(state, ticket, time.time())
+                    if admitted:
+                        self._admit(state, ticket)
+                        return
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise QuotaExhaustedError("Timed out waiting for GA4 quota for this property.")
+                await asyncio.sleep(min(wait or 0.05, 0.5))
+        except BaseException:
+            with self._cond:
+                self._abandon(state, ticket)
+            raise
+
+    def release(self, property_id, priority=INTERACTIVE):
+        """Give back the concurrency slot taken by acquire."""
+        with self._cond:
+            self._state(property_id).in_flight[priority] -= 1
+            self._cond.notify_all()
+
+    def record_response(self, property_id, response):
+        """Store the PropertyQuota carried by a RunReportResponse or BatchRunReportsResponse."""
+        reports = getattr(response, "reports", None)
+        if reports:
+            response = reports[-1]
+        if "property_quota" not in response:
+            return
+        quota = response.property_quota
+        with self._cond:
+            state = self._state(property_id)
+            state.quota = {
+                field: {"consumed": getattr(quota, field).consumed, "remaining": getattr(quota, field).remaining}
+                for field in QUOTA_FIELDS if field in quota
+            }
+            state.quota_updated_at = time.time()
+            state.consecutive_exhausted = 0
+            self._cond.notify_all()
+
+    def record_exhausted(self, property_id):
+        """
+        Put the property into backoff after a RESOURCE_EXHAUSTED error.
+
+        Returns:
+            The delay in seconds before the next attempt (exponential, with full jitter).
+        """
+        with self._cond:
+            state = self._state(property_id)
+            state.throttled += 1
+            state.consecutive_exhausted += 1
+            ceiling = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (state.consecutive_exhausted - 1))
+            delay = random.uniform(0, ceiling)
+            state.backoff_until = max(state.backoff_until, time.time() + delay)
+            return delay
+
+    def call(self, property_id, fn, priority=INTERACTIVE, method="run_report"):
+        """Run fn() under admission control, recording quota and retrying on RESOURCE_EXHAUSTED."""
+        from google.api_core.exceptions import ResourceExhausted
+
+        for attempt in range(MAX_RETRIES + 1):
+            with phase("queue"):
+                self.acquire(property_id, priority)
+            started = time.perf_counter()
+            try:
+                with phase("api"):
+                    response = fn()
+            except ResourceExhausted:
+                self.record_exhausted(property_id)
+                if attempt == MAX_RETRIES:
+                    raise
+                continue
+            finally:
+                self.release(property_id, priority)
+                observe("ga4_api_duration_seconds", time.perf_counter() - started, property=property_id, method=method)
+            self.record_response(property_id, response)
+            return response
+
+    async def call_async(self, property_id, coro_fn, priority=INTERACTIVE, method="run_report"):
+        """Async counterpart of call for coroutine functions."""
+        from google.api_core.exceptions import ResourceExhausted
+
+        for attempt in range(MAX_RETRIES + 1):
+            with phase("queue"):
+                await self.acquire_async(property_id, priority)
+            started = time.perf_counter()
+            try:
+                with phase("api"):
+                    response = await coro_fn()
+            except ResourceExhausted:
+                self.record_exhausted(property_id)
+                if attempt == MAX_RETRIES:
+                    raise
+                continue
+            finally:
+                self.release(property_id, priority)
+                observe("ga4_api_duration_seconds", time.perf_counter() - started, property=property_id, method=method)
+            self.record_response(property_id, response)
+            return response
+
+    def snapshot(self):
+        """Return the current quota, queue and backoff state of every property seen so far."""
+        now = time.time()
+        with self._cond:
+            result = {}
+            for property_id, state in self._states.items():
+                queued = {name: 0 for name in PRIORITY_NAMES.values()}
+                for priority, _ in state.waiting:
+                    queued[PRIORITY_NAMES[priority]] += 1
+                result[property_id] = {
+                    "quota": state.quota,
+                    "quota_age_seconds": round(now - state.quota_updated_at, 1) if state.quota_updated_at else None,
+                    "in_flight": {PRIORITY_NAMES[p]: n for p, n in state.in_flight.items()},
+                    "queued": queued,
+                    "backoff_seconds": round(max(0.0, state.backoff_until - now), 2),
+                    "calls": state.calls,
+                    "throttled": state.throttled,
+                }
+            return result
+
+
+class ScheduledClient:
+    """Wraps a BetaAnalyticsDataClient so report calls go through the quota scheduler."""
+
+    def __init__(self, client, property_id, priority=INTERACTIVE, scheduler=None):
+        self._client = client
+        self._property_id = str(property_id)
+        self._priority = priority
+        self._scheduler = scheduler or quota_scheduler
+
+    def run_report(self, request, **kwargs):
+        request.return_property_quota = True
+        return self._scheduler.call(self._property_id, lambda: self._client.run_report(request, **kwargs), self._priority)
+
+    def run_pivot_report(self, request, **kwargs):
+        request.return_property_quota = True
+        return self._scheduler.call(
+            self._property_id, lambda: self._client.run_pivot_report(request, **kwargs), self._priority,
+            "run_pivot_report"
+        )
+
+    def run_realtime_report(self, request, **kwargs):
+        # Realtime reports draw on a separate token quota, so they are scheduled without
+        # asking for (and recording) property quota
+        return self._scheduler.call(
+            self._property_id, lambda: self._client.run_realtime_report(request, **kwargs), self._priority,
+            "run_realtime_report"
+        )
+
+    def batch_run_reports(self, request, **kwargs):
+        for report_request in request.requests:
+            report_request.return_property_quota = True
+        return self._scheduler.call(
+            self._property_id, lambda: self._client.batch_run_reports(request, **kwargs), self._priority,
+            "batch_run_reports"
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class AsyncScheduledClient:
+    """Wraps a BetaAnalyticsDataAsyncClient so report calls go through the quota scheduler."""
+
+    def __init__(self, client, property_id, priority=INTERACTIVE, scheduler=None):
+        self._client = client
+        self._property_id = str(property_id)
+        self._priority = priority
+        self._scheduler = scheduler or quota_scheduler
+
+    async def run_report(self, request, **kwargs):
+        request.return_property_quota = True
+        return await self._scheduler.call_async(
+            self._property_id, lambda: self._client.run_report(request, **kwargs), self._priority
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# Shared by every report execution path in the process
+quota_scheduler = QuotaScheduler()
@@ -0,0 +1,238 @@
+"""
+Realtime reports with shared polling and incremental results.
+
+RunRealtimeReport covers the last 30 minutes (60 on 360 properties) and is
+updated within seconds, but every call costs realtime quota tokens. A
+RealtimeFeed is kept per distinct request (property, fields, filters, minute
+range) and shared by every caller in the process: a poll only reaches the API
+once the latest snapshot is older than the poll interval, and concurrent polls
+wait for the one fetch in progress instead of sending their own, so the number
+of watchers does not change the number of API calls.
+
+Each feed keeps a rolling window of its last REALTIME_WINDOW distinct
+snapshots, numbered by a sequence. Callers pass back the cursor they got last
+time and receive only the rows added or changed since that snapshot, plus the
+keys of rows that disappeared. A cursor that has fallen out of the window (or
+belongs to an evicted feed) gets the full snapshot again, flagged as a reset.
+"""
+import collections
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from ga4_reports import decode_rows
+
+# Seconds between API calls for one feed, however many callers poll it
+REALTIME_POLL_INTERVAL = float(os.environ.get("GA4_REALTIME_INTERVAL", "15"))
+# Callers may ask for fresher data, but never more often than this
+MIN_POLL_INTERVAL = 5.0
+# Distinct snapshots kept per feed; older cursors get a full snapshot
+REALTIME_WINDOW = 40
+# Feeds nobody has polled for this long are dropped
+FEED_IDLE_TTL = 15 * 60
+MAX_FEEDS = 64
+# Standard properties report the last 30 minutes
+DEFAULT_MINUTES = 30
+
+# Realtime API schema; custom user-scoped dimensions (customUser:*) are also accepted
+REALTIME_DIMENSIONS = frozenset((
+    "appVersion", "audienceId", "audienceName", "audienceResourceName", "city", "cityId", "country",
+    "countryId", "deviceCategory", "eventName", "minutesAgo", "platform", "streamId", "streamName",
+    "unifiedScreenName",
+))
+REALTIME_METRICS = frozenset(("activeUsers", "eventCount", "keyEvents", "screenPageViews"))
+
+
+def is_realtime_dimension(name):
+    return name in REALTIME_DIMENSIONS or name.startswith("customUser:")
+
+
+def build_realtime_request(property_id, dimensions, metrics, dimension_filter=None, metric_filter=None,
+                           minutes=DEFAULT_MINUTES, limit=None):
+    """
+    Build a RunRealtimeReportRequest.
+
+    Args:
+        property_id: GA4 property ID.
+        dimensions: Realtime dimension names.
+        metrics: Realtime metric names.
+        dimension_filter: Optional compiled FilterExpression on dimensions.
+        metric_filter: Optional compiled FilterExpression on metrics.
+        minutes: How many of the most recent minutes to cover.
+        limit: Optional maximum number of rows.
+    """
+    from google.analytics.data_v1beta.types import Dimension, Metric, MinuteRange, RunRealtimeReportRequest
+
+    return RunRealtimeReportRequest(
+        property=f"properties/{property_id}",
+        dimensions=[Dimension(name=d) for d in dimensions],
+        metrics=[Metric(name=m) for m in metrics],
+        dimension_filter=dimension_filter,
+        metric_filter=metric_filter,
+        minute_ranges=[MinuteRange(start_minutes_ago=int(minutes) - 1, end_minutes_ago=0)],
+        limit=limit,
+    )
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat(timespec="seconds")
+
+
+class _Snapshot:
+    def __init__(self, seq, dimensions, rows, fetched_at):
+        self.seq = seq
+        self.dimensions = dimensions
+        self.rows = rows
+        self.fetched_at = fetched_at
+        self.changed_at = fetched_at
+
+
+class RealtimeFeed:
+    """Latest snapshots of one realtime request, shared by every caller polling it."""
+
+    def __init__(self, window=REALTIME_WINDOW):
+        # Cursors carry the feed's ID, so a cursor from an evicted feed is recognized as stale
+        self.feed_id = uuid.uuid4().hex[:12]
+        self.snapshots = collections.deque(maxlen=window)
+        self.last_polled = time.time()
+        self.fetches = 0
+        self.polls = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._deltas = {}
+        self._error = None
+        self._failed_at = 0.0
+
+    def poll(self, fetch, interval=REALTIME_POLL_INTERVAL):
+        """
+        Return the latest snapshot, calling fetch() first if it is older than interval seconds.
+
+        Concurrent callers wait for the fetch in progress and share its snapshot. A fetch that
+        returns the same rows as before only refreshes the snapshot's fetched_at. After a failed
+        fetch, callers within MIN_POLL_INTERVAL get the same error instead of retrying it.
+        """
+        interval = max(float(interval), MIN_POLL_INTERVAL)
+        with self._lock:
+            self.polls += 1
+            self.last_polled = time.time()
+            latest = self.snapshots[-1] if self.snapshots else None
+            if latest is not None and time.time() - latest.fetched_at < interval:
+                return latest
+            if self._error is not None and time.time() - self._failed_at < MIN_POLL_INTERVAL:
+                raise self._error
+            self.fetches += 1
+            try:
+                response = fetch()
+            except Exception as e:
+                self._error, self._failed_at = e, time.time()
+                raise
+            self._error = None
+            now = time.time()
+            dimensions = [h.name for h in response.dimension_headers]
+            rows = {tuple(row[d] for d in dimensions): row for row in decode_rows(response)}
+            if latest is not None and rows == latest.rows:
+                latest.fetched_at = now
+                return latest
+            self._seq += 1
+            latest = _Snapshot(self._seq, dimensions, rows, now)
+            self.snapshots.append(latest)
+            self._deltas = {}
+            return latest
+
+    def changes_since(self, cursor, snapshot=None):
+        """
+        Rows that changed between the snapshot a cursor points to and the latest one.
+
+        Args:
+            cursor: Cursor returned by an earlier call, or None for the full snapshot.
+            snapshot: Snapshot to compare against (defaults to the latest).
+
+        Returns:
+            Dictionary with the new cursor, "reset" (True when "rows" is the full snapshot),
+            "rows" (added or changed rows), "removed" (dimension values of rows that are gone),
+            "row_count" and the fetch/change times.
+        """
+        with self._lock:
+            snapshot = snapshot or self.snapshots[-1]
+            base = self._find(cursor)
+            # Watchers at the same cursor share one diff
+            delta = self._deltas.get((base.seq if base else None, snapshot.seq))
+            if delta is None:
+                if base is None:
+                    delta = (True, list(snapshot.rows.values()), [])
+                else:
+                    changed = [row for key, row in snapshot.rows.items() if base.rows.get(key) != row]
+                    removed = [key for key in base.rows if key not in snapshot.rows]
+                    delta = (False, changed, removed)
+                self._deltas[(base.seq if base else None, snapshot.seq)] = delta
+        reset, rows, removed = delta
+        return {
+            "cursor": f"{self.feed_id}:{snapshot.seq}",
+            "reset": reset,
+            "rows": rows,
+            "removed": [dict(zip(snapshot.dimensions, key)) for key in removed],
+            "row_count": len(snapshot.rows),
+            "fetched_at": _timestamp(snapshot.fetched_at),
+            "changed_at": _timestamp(snapshot.changed_at),
+            "age_seconds": round(time.time() - snapshot.fetched_at, 1),
+        }
+
+    def _find(self, cursor):
+        if not cursor:
+            return None
+        feed_id, _, seq = str(cursor).rpartition(":")
+        if feed_id != self.feed_id or not seq.isdigit():
+            return None
+        for snapshot in self.snapshots:
+            if snapshot.seq == int(seq):
+                return snapshot
+        return None
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def get_feed(key):
+    """Return the shared feed for a request key, creating it (and dropping idle feeds) as needed."""
+    with _feeds_lock:
+        feed = _feeds.get(key)
+        if feed is None:
+            now = time.time()
+            for idle in [k for k, f in _feeds.items() if now - f.last_polled > FEED_IDLE_TTL]:
+                del _feeds[idle]
+            if len(_feeds) >= MAX_FEEDS:
+                del _feeds[min(_feeds, key=lambda k: _feeds[k].last_polled)]
+            feed = _feeds[key] = RealtimeFeed()
+        return feed
+
+
+def poll_realtime(key, fetch, cursor=None, interval=REALTIME_POLL_INTERVAL):
+    """
+    Poll the shared feed for a realtime request and return what changed since cursor.
+
+    Args:
+        key: Hashable identity of the request, e.g. its serialized RunRealtimeReportRequest.
+        fetch: Zero-argument callable running the request and returning its response.
+        cursor: Cursor from the previous call, or None for the full snapshot.
+        interval: Maximum age in seconds of the snapshot before the API is called again
+                  (at least MIN_POLL_INTERVAL).
+
+    Returns:
+        The changes_since dictionary of the feed.
+    """
+    feed = get_feed(key)
+    return feed.changes_since(cursor, feed.poll(fetch, interval))
+
+
+def realtime_stats():
+    """Polls served and API calls made by each live feed."""
+    with _feeds_lock:
+        feeds = list(_feeds.values())
+    return {
+        "feeds": len(feeds),
+        "polls": sum(f.polls for f in feeds),
+        "fetches": sum(f.fetches for f in feeds),
+    }
@@ -0,0 +1,298 @@
+"""
+Report execution helpers shared by the MCP server and the Streamlit data layer.
+
+The GA4 Data API returns at most `limit` rows per RunReportRequest (10,000 when
+no limit is set) and reports the full size of the result in `row_count`. The
+helpers here follow `row_count` with offset-based paging and hand rows out one
+page at a time, so large reports are never silently truncated and callers can
+start consuming rows before the whole report has been fetched.
+"""
+import json
+import re
+from datetime import date, timedelta
+
+from ga4_telemetry import increment, phase
+
+# Rows requested per page. The API accepts up to 250,000, but smaller pages
+# keep memory flat and get the first rows back sooner.
+DEFAULT_PAGE_SIZE = 10000
+MAX_PAGE_SIZE = 250000
+
+# BatchRunReports accepts at most this many reports per call
+MAX_BATCH_REPORTS = 5
+
+_DAYS_AGO = re.compile(r"^(\d+)daysAgo$")
+
+
+def resolve_date(value, today=None):
+    """
+    Resolve a GA4 date string to an absolute date.
+
+    Handles 'today', 'yesterday', 'NdaysAgo' and ISO dates. Relative dates are
+    resolved against the local calendar date, which may differ from the
+    property's reporting time zone around midnight.
+
+    Args:
+        value: Date string as accepted by the GA4 Data API.
+        today: Optional date to resolve against (defaults to date.today()).
+
+    Returns:
+        The date as a datetime.date.
+    """
+    today = today or date.today()
+    value = str(value).strip()
+    if value == "today":
+        return today
+    if value == "yesterday":
+        return today - timedelta(days=1)
+    match = _DAYS_AGO.match(value)
+    if match:
+        return today - timedelta(days=int(match.group(1)))
+    return date.fromisoformat(value)
+
+
+def parse_order_bys(order_bys):
+    """
+    Normalize order_bys given as strings or dicts to a list of (field, desc) pairs.
+
+    Accepted forms for each entry:
+        "sessions" or "-sessions" (leading '-' for descending), "sessions desc",
+        {"field": "sessions", "desc": true}, or the API's own shape,
+        {"metric": {"metricName": "sessions"}, "desc": true} / {"dimension": {"dimensionName": "date"}},
+        or an already parsed ("sessions", True) pair.
+    A JSON string holding such a list is accepted too.
+
+    Raises:
+        ValueError: If an entry cannot be understood.
+    """
+    if not order_bys:
+        return []
+    if isinstance(order_bys, str):
+        try:
+            order_bys = json.loads(order_bys)
+        except json.JSONDecodeError:
+            order_bys = [o.strip() for o in order_bys.split(",") if o.strip()]
+    if isinstance(order_bys, (str, dict)):
+        order_bys = [order_bys]
+    parsed = []
+    for entry in order_bys:
+        if isinstance(entry, str):
+            parts = entry.split()
+            name, desc = parts[0], len(parts) > 1 and parts[1].lower() == "desc"
+            if name.startswith("-"):
+                name, desc = name[1:], True
+        elif isinstance(entry, dict):
+            desc = bool(entry.get("desc", False))
+            name = entry.get("field")
+            if not name and isinstance(entry.get("metric"), dict):
+                name = entry["metric"].get("metricName")
+            if not name and isinstance(entry.get("dimension"), dict):
+                name = entry["dimension"].get("dimensionName")
+            name = name or entry.get("metric") or entry.get("dimension")
+        elif isinstance(entry, (list, tuple)) and len(entry) == 2:
+            name, desc = entry[0], bool(entry[1])
+        else:
+            name = None
+        if not name or not isinstance(name, str):
+            raise ValueError(f"Unrecognized order_bys entry: {entry!r}")
+        parsed.append((name, desc))
+    return parsed
+
+
+def build_order_bys(order_bys, dimensions, metrics):
+    """
+    Build OrderBy protos for a report.
+
+    Args:
+        order_bys: (field, desc) pairs from parse_order_bys.
+        dimensions: Dimension names in the report.
+        metrics: Metric names in the report.
+
+    Returns:
+        List of OrderBy objects.
+
+    Raises:
+        ValueError: If a field is not one of the report's dimensions or metrics.
+    """
+    from google.analytics.data_v1beta.types import OrderBy
+
+    result = []
+    for name, desc in order_bys:
+        if name in metrics:
+            result.append(OrderBy(metric=OrderBy.MetricOrderBy(metric_name=name), desc=desc))
+        elif name in dimensions:
+            result.append(OrderBy(dimension=OrderBy.DimensionOrderBy(dimension_name=name), desc=desc))
+        else:
+            raise ValueError(f"Cannot order by '{name}': it is not one of the requested dimensions or metrics.")
+    return result
+
+
+def iter_report_pages(client, request, page_size=DEFAULT_PAGE_SIZE, max_rows=None):
+    """
+    Run a report and yield one RunReportResponse per page.
+
+    The request's own `offset` is used as the starting point and its `limit`,
+    if set, caps the total number of rows fetched. The request object is
+    updated in place as pages are requested.
+
+    Args:
+        client: BetaAnalyticsDataClient used to run the report.
+        request: RunReportRequest to execute.
+        page_size: Rows to request per API call (capped at 250,000).
+        max_rows: Optional cap on the total number of rows to fetch.
+
+    Yields:
+        RunReportResponse objects, in row order.
+    """
+    if max_rows is not None and max_rows <= 0:
+        return
+    page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    offset = request.offset or 0
+    remaining = request.limit or None
+    if max_rows is not None:
+        remaining = min(remaining, max_rows) if remaining else max_rows
+
+    while True:
+        request.offset = offset
+        request.limit = min(page_size, remaining) if remaining else page_size
+        response = client.run_report(request)
+        increment("ga4_report_pages_total")
+        yield response
+
+        fetched = len(response.rows)
+        offset += fetched
+        if remaining:
+            remaining -= fetched
+        if fetched == 0 or offset >= response.row_count or remaining == 0:
+            break
+
+
+def rows_from_response(response):
+    """Yield each row of a RunReportResponse as a dict of header name to string value."""
+    dimension_names = [h.name for h in response.dimension_headers]
+    metric_names = [h.name for h in response.metric_headers]
+    for row in response.rows:
+        data_row = {}
+        for i, name in enumerate(dimension_names):
+            data_row[name] = row.dimension_values[i].value if i < len(row.dimension_values) else None
+        for i, name in enumerate(metric_names):
+            data_row[name] = row.metric_values[i].value if i < len(row.metric_values) else None
+        yield data_row
+
+
+def decode_rows(response):
+    """Return the rows of a response as a list of dicts (timed as the "decode" phase)."""
+    with phase("decode"):
+        return list(rows_from_response(response))
+
+
+def iter_report_rows(client, request, page_size=DEFAULT_PAGE_SIZE, max_rows=None):
+    """
+    Run a report and yield its rows as dicts, fetching further pages on demand.
+
+    Only one page of the response is held in memory at a time.
+
+    Args:
+        client: BetaAnalyticsDataClient used to run the report.
+        request: RunReportRequest to execute.
+        page_size: Rows to request per API call.
+        max_rows: Optional cap on the total number of rows to yield.
+
+    Yields:
+        One dict per row, keyed by dimension and metric name.
+    """
+    for response in iter_report_pages(client, request, page_size, max_rows):
+        yield from decode_rows(response)
+
+
+async def iter_report_pages_async(client, request, page_size=DEFAULT_PAGE_SIZE, max_rows=None, timeout=None):
+    """
+    Async counterpart of iter_report_pages for BetaAnalyticsDataAsyncClient.
+
+    Args:
+        client: BetaAnalyticsDataAsyncClient used to run the report.
+        request: RunReportRequest to execute (updated in place as pages are requested).
+        page_size: Rows to request per API call (capped at 250,000).
+        max_rows: Optional cap on the total number of rows to fetch.
+        timeout: Optional per-page RPC deadline in seconds.
+
+    Yields:
+        RunReportResponse objects, in row order.
+    """
+    if max_rows is not None and max_rows <= 0:
+        return
+    page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    offset = request.offset or 0
+    remaining = request.limit or None
+    if max_rows is not None:
+        remaining = min(remaining, max_rows) if remaining else max_rows
+
+    while True:
+        request.offset = offset
+        request.limit = min(page_size, remaining) if remaining else page_size
+        if timeout is None:
+            response = await client.run_report(request)
+        else:
+            response = await client.run_report(request, timeout=timeout)
+        increment("ga4_report_pages_total")
+        yield response
+
+        fetched = len(response.rows)
+        offset += fetched
+        if remaining:
+            remaining -= fetched
+        if fetched == 0 or offset >= response.row_count or remaining == 0:
+            break
+
+
+async def fetch_report_rows_async(client, request, page_size=DEFAULT_PAGE_SIZE, max_rows=None, timeout=None):
+    """Run a report with an async client and return all of its rows as a list of dicts."""
+    rows = []
+    async for response in iter_report_pages_async(client, request, page_size, max_rows, timeout):
+        rows.extend(decode_rows(response))
+    return rows
+
+
+def run_report_batch(client, property_id, requests, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Run several reports through BatchRunReports, five per API call.
+
+    Batched reports are not paged by the API, so any report whose `row_count`
+    exceeds the rows returned is completed with regular offset paging. The
+    request objects are updated in place.
+
+    Args:
+        client: BetaAnalyticsDataClient used to run the reports.
+        property_id: GA4 property ID shared by every report.
+        requests: List of RunReportRequest objects (their `property` field may be left empty).
+        page_size: Row limit for reports that do not set their own.
+
+    Returns:
+        List with one list of row dicts per request, in request order.
+    """
+    from google.analytics.data_v1beta.types import BatchRunReportsRequest
+
+    results = []
+    for start in range(0, len(requests), MAX_BATCH_REPORTS):
+        chunk = requests[start:start + MAX_BATCH_REPORTS]
+        limits = [request.limit for request in chunk]
+        for request in chunk:
+            request.property = ""
+            request.limit = request.limit or page_size
+        response = client.batch_run_reports(BatchRunReportsRequest(
+            property=f"properties/{property_id}",
+            requests=chunk,
+        ))
+        for request, limit, report in zip(chunk, limits, response.reports):
+            rows = decode_rows(report)
+            wanted = report.row_count - request.offset
+            if limit:
+                wanted = min(wanted, limit)
+            if len(rows) < wanted:
+                increment("ga4_batch_reports_paged_total")
+                request.property = f"properties/{property_id}"
+                request.offset += len(rows)
+                request.limit = wanted - len(rows)
+                rows.extend(iter_report_rows(client, request, page_size=page_size))
+            results.append(rows)
+    return results
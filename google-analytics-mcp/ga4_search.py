@@ -0,0 +1,157 @@
+"""
+Ranked, typo-tolerant search over the dimension and metric catalog.
+
+FieldIndex is built once per catalog (see ga4_metadata) as an inverted index
+from tokens to fields. Names are split on camelCase and punctuation
+("sessionDefaultChannelGroup" -> session, default, channel, group) and
+weighted above UI names and descriptions; adjacent name words are also
+indexed joined ("pageviews" finds screenPageViews) and plurals are folded
+("countries" matches country). A query token matches index tokens exactly,
+by prefix (for partly typed words) or, if it is not a known word, within one
+edit (for typos). Typos are found through a precomputed table of
+single-character deletions, so the lookup costs a few dictionary probes
+instead of a scan of the vocabulary. Matches are scored with TF-IDF-style
+weights.
+"""
+import bisect
+import math
+import re
+
+# Weight of a token by where it occurs in a field
+NAME_WEIGHT = 3.0
+UI_NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+# How much a prefix or one-edit match counts relative to an exact token match
+PREFIX_MATCH = 0.7
+FUZZY_MATCH = 0.5
+# Prefix and typo matching only apply to query tokens at least this long
+MIN_FUZZY_LENGTH = 3
+
+STOPWORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is", "it", "its", "of",
+    "on", "or", "that", "the", "this", "to", "was", "were", "which", "with", "what", "how", "many", "much",
+))
+
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def _stem(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Split text into lowercase, plural-folded tokens, breaking camelCase names into words."""
+    tokens = []
+    for word in _CAMEL.findall(str(text)):
+        word = word.lower()
+        if word not in STOPWORDS:
+            tokens.append(_stem(word))
+    return tokens
+
+
+def _deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class FieldIndex:
+    """Inverted index over the names and descriptions of a MetadataCatalog."""
+
+    def __init__(self, catalog):
+        self.fields = []
+        postings = {}
+        words = set()
+        for kind, fields in (("dimension", catalog.dimensions), ("metric", catalog.metrics)):
+            for name, field in fields.items():
+                doc = len(self.fields)
+                self.fields.append({
+                    "name": name, "kind": kind, "category": field["category"],
+                    "description": field["description"],
+                })
+                # Name tokens count more in short names, so 'users' ranks totalUsers above active28DayUsers
+                name_tokens = tokenize(name)
+                name_weight = NAME_WEIGHT / math.sqrt(max(len(name_tokens), 1))
+                # Adjacent name words are also indexed joined, so 'pageviews' finds screenPageViews
+                joined = [a + b for a, b in zip(name_tokens, name_tokens[1:])]
+                weights = {}
+                for tokens, weight in ((name_tokens, name_weight), (joined, name_weight),
+                                       (tokenize(field.get("uiName", "")), UI_NAME_WEIGHT),
+                                       (tokenize(field["description"]), DESCRIPTION_WEIGHT)):
+                    for token in tokens:
+                        weights[token] = max(weights.get(token, 0.0), weight)
+                for token, weight in weights.items():
+                    postings.setdefault(token, []).append((doc, weight))
+                words.update(name_tokens)
+                words.update(tokenize(field["description"]))
+
+        count = max(len(self.fields), 1)
+        self.postings = {
+            token: [(doc, weight * math.log(1 + count / len(docs))) for doc, weight in docs]
+            for token, docs in postings.items()
+        }
+        # Joined name words only match exactly, so prefixes and typos are matched against real words
+        self.vocabulary = sorted(words)
+        self.deletions = {}
+        for token in self.vocabulary:
+            if len(token) >= MIN_FUZZY_LENGTH:
+                for variant in _deletions(token):
+                    self.deletions.setdefault(variant, set()).add(token)
+        self.names = {field["name"].lower(): doc for doc, field in enumerate(self.fields)}
+
+    def _candidates(self, token):
+        """Return {index token: match quality} for one query token."""
+        matches = {}
+        if token in self.postings:
+            matches[token] = 1.0
+        if len(token) < MIN_FUZZY_LENGTH:
+            return matches
+        start = bisect.bisect_left(self.vocabulary, token)
+        for candidate in self.vocabulary[start:bisect.bisect_left(self.vocabulary, token + "\uffff")]:
+            matches.setdefault(candidate, PREFIX_MATCH)
+        if token in self.postings:
+            return matches
+        # Words not in the index may be typos: a deletion, an insertion or a substitution away
+        # from an index token shares one of its deletion variants
+        for candidate in self.deletions.get(token, ()):
+            matches.setdefault(candidate, FUZZY_MATCH)
+        for variant in _deletions(token):
+            if variant in self.postings:
+                matches.setdefault(variant, FUZZY_MATCH)
+            for candidate in self.deletions.get(variant, ()):
+                matches.setdefault(candidate, FUZZY_MATCH)
+        return matches
+
+    def search(self, query, kind=None, top_k=10):
+        """
+        Rank fields against a free-text query.
+
+        Args:
+            query: Words to look for, e.g. 'traffic source', 'bounce rate' or 'countyr'.
+            kind: Optional 'dimension' or 'metric' to restrict the results.
+            top_k: Maximum number of results.
+
+        Returns:
+            List of {name, kind, category, description, score} dicts, best match first.
+        """
+        scores = {}
+        for token in set(tokenize(query)):
+            best = {}
+            for candidate, quality in self._candidates(token).items():
+                for doc, weight in self.postings[candidate]:
+                    best[doc] = max(best.get(doc, 0.0), quality * weight)
+            for doc, score in best.items():
+                scores[doc] = scores.get(doc, 0.0) + score
+        # Typing a field's exact API name always ranks it first
+        exact = self.names.get(str(query).strip().lower())
+        if exact is not None:
+            scores[exact] = scores.get(exact, 0.0) + 100.0
+
+        ranked = sorted(
+            (doc for doc in scores if kind is None or self.fields[doc]["kind"] == kind),
+            key=lambda doc: (-scores[doc], self.fields[doc]["name"]),
+        )
+        return [dict(self.fields[doc], score=round(scores[doc], 3)) for doc in ranked[:top_k]]
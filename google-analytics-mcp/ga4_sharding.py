@@ -0,0 +1,128 @@
+"""
+Date-range sharding for long-horizon reports.
+
+A report over many months can be split into day, week or month shards that
+are fetched concurrently and cached one by one, so extending the range only
+fetches the new shards. Shard results are merged back in date order: when the
+report keeps a date dimension every row belongs to exactly one shard, and
+otherwise rows with the same dimension values are re-aggregated, which is only
+correct for additive metrics (counts and sums, not users, rates or averages).
+"""
+from datetime import timedelta
+
+from ga4_reports import resolve_date
+
+SHARD_GRAINS = ("day", "week", "month")
+
+# Upper bound on shards per report, so a typo cannot fan out into thousands of calls
+MAX_SHARDS = 400
+
+# Dimensions whose values never span two shards
+DATE_PARTITION_DIMENSIONS = ("date", "dateHour", "dateHourMinute")
+
+# Distinct-count metrics that look additive by name but are not
+NON_ADDITIVE_METRICS = frozenset((
+    "totalUsers", "activeUsers", "active1DayUsers", "active7DayUsers", "active28DayUsers", "scrolledUsers",
+    "purchasers", "totalPurchasers", "crashAffectedUsers", "cohortActiveUsers", "cohortTotalUsers",
+))
+# Users counted once in their lifetime, so their daily counts do add up
+ADDITIVE_USER_METRICS = frozenset(("newUsers", "firstTimePurchasers"))
+NON_ADDITIVE_MARKERS = ("Rate", "Per", "average", "Average", "Stickiness", "Position", "returnOnAdSpend")
+
+
+def split_date_range(start, end, grain, today=None):
+    """
+    Split an inclusive date range into consecutive shards.
+
+    Args:
+        start: Start date (ISO or relative, e.g. '365daysAgo').
+        end: End date (ISO or relative, e.g. 'yesterday').
+        grain: 'day', 'week' (Monday to Sunday) or 'month' (calendar months).
+        today: Reference date for relative dates (defaults to today).
+
+    Returns:
+        List of (start, end) ISO date string pairs in date order. The first and last
+        shards are clipped to the range.
+
+    Raises:
+        ValueError: If the grain or dates are invalid, or the range needs more than MAX_SHARDS shards.
+    """
+    if grain not in SHARD_GRAINS:
+        raise ValueError(f"shard_by must be one of {list(SHARD_GRAINS)}, got '{grain}'.")
+    first = resolve_date(start, today)
+    last = resolve_date(end, today)
+    if first > last:
+        raise ValueError(f"date_range_start ({first}) is after date_range_end ({last}).")
+
+    shards = []
+    shard_start = first
+    while shard_start <= last:
+        if grain == "day":
+            shard_end = shard_start
+        elif grain == "week":
+            shard_end = shard_start + timedelta(days=6 - shard_start.weekday())
+        else:
+            next_month = (shard_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+            shard_end = next_month - timedelta(days=1)
+        shard_end = min(shard_end, last)
+        shards.append((shard_start.isoformat(), shard_end.isoformat()))
+        if len(shards) > MAX_SHARDS:
+            raise ValueError(f"Sharding by {grain} needs more than {MAX_SHARDS} shards; use a coarser shard_by.")
+        shard_start = shard_end + timedelta(days=1)
+    return shards
+
+
+def is_additive_metric(name):
+    """Whether summing a metric's values over disjoint date ranges gives the value for the whole range."""
+    if name in ADDITIVE_USER_METRICS:
+        return True
+    if name in NON_ADDITIVE_METRICS or name.endswith("Users"):
+        return False
+    return not any(marker in name for marker in NON_ADDITIVE_MARKERS)
+
+
+def needs_reaggregation(dimensions):
+    """Whether rows from different shards can share dimension values and must be summed."""
+    return not any(d in DATE_PARTITION_DIMENSIONS for d in dimensions)
+
+
+def _add(a, b):
+    try:
+        return str(int(a) + int(b))
+    except ValueError:
+        return repr(float(a or 0) + float(b or 0))
+
+
+def merge_shard_rows(shard_rows, dimensions, metrics):
+    """
+    Merge the row lists of consecutive shards into one report.
+
+    With a date dimension the rows are concatenated and sorted by it. Without one,
+    rows with equal dimension values are summed metric by metric, in order of first
+    appearance; callers must check is_additive_metric first.
+
+    Args:
+        shard_rows: Row lists (dicts of strings, as returned by get_ga4_data) in shard order.
+        dimensions: Dimension names of the report.
+        metrics: Metric names of the report.
+
+    Returns:
+        The merged list of row dictionaries.
+    """
+    if not needs_reaggregation(dimensions):
+        date_dimension = next(d for d in dimensions if d in DATE_PARTITION_DIMENSIONS)
+        merged = [row for rows in shard_rows for row in rows]
+        merged.sort(key=lambda row: row.get(date_dimension, ""))
+        return merged
+
+    totals = {}
+    for rows in shard_rows:
+        for row in rows:
+            key = tuple(row.get(d) for d in dimensions)
+            total = totals.get(key)
+            if total is None:
+                totals[key] = dict(row)
+                continue
+            for m in metrics:
+                total[m] = _add(total.get(m, "0"), row.get(m, "0"))
+    return list(totals.values())
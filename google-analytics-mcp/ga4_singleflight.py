@@ -0,0 +1,121 @@
+"""
+Request coalescing ("single-flight") for report execution.
+
+When several callers ask for the same report at the same time, only the first
+one (the leader) runs it; the others wait for the leader and share its result
+or exception. Calls are matched by key, normally the report cache key, so
+only requests with identical normalized parameters are coalesced. This works
+within one process: threads (Streamlit sessions, sync MCP tools) through do(),
+and coroutines on the same event loop through do_async().
+
+Results are shared, not copied, so callers must not mutate what they get back.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    """An in-flight synchronous call and the outcome its followers are waiting for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Run fn() once for all concurrent callers using the same key.
+
+        Args:
+            key: Hashable identity of the work, e.g. a report cache key.
+            fn: Zero-argument callable doing the work.
+
+        Returns:
+            fn's return value, shared with every caller that joined the same flight.
+
+        Raises:
+            Whatever fn raised, re-raised in every caller that joined the flight.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, coro_fn):
+        """
+        Async counterpart of do() for coroutines on the running event loop.
+
+        The work runs as a separate task. A caller that is cancelled or times out
+        stops waiting without affecting the others; the task itself is cancelled
+        only once every caller waiting on it has gone.
+
+        Args:
+            key: Hashable identity of the work.
+            coro_fn: Zero-argument coroutine function doing the work.
+
+        Returns:
+            The coroutine's result, shared with every caller that joined the same flight.
+        """
+        task_key = (id(asyncio.get_running_loop()), key)
+        entry = self._tasks.get(task_key)
+        if entry is None:
+            task = asyncio.ensure_future(coro_fn())
+            entry = self._tasks[task_key] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"])
+        except asyncio.CancelledError:
+            if not entry["task"].done() and entry["waiters"] == 1:
+                entry["task"].cancel()
+            raise
+        finally:
+            entry["waiters"] -= 1
+
+    def stats(self):
+        """Counts of executed and coalesced calls, and calls currently in flight."""
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": in_flight + len(self._tasks),
+        }
+
+
+# Shared by every report execution path in the process
+report_flights = SingleFlight()
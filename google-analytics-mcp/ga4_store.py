@@ -0,0 +1,310 @@
+"""
+Incremental, day-partitioned local store for reports with a date dimension.
+
+Rows are stored in a SQLite file under GA4_CACHE_DIR, one partition per
+(property, report signature, day), where the signature covers the
+dimensions, metrics and filters but not the date range. A report over a
+range is then assembled from the stored days, and only days that are missing
+or still mutable are fetched from the API, as one request per run of
+consecutive days. Days older than RECENT_DAYS are final and kept until
+evicted; recent days are refetched once their TTL (as for the report cache)
+expires. Like the report cache, the file is kept under a size budget
+(GA4_PARTITIONS_MAX_MB) by evicting the least recently used days.
+
+A "last 90 days" report asked again the next day therefore costs a one-day
+API call plus a local scan, instead of re-downloading all 90 days. The store
+also records what each signature contains, so the local query engine
+(ga4_query) can answer rollups of stored reports without calling the API.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from ga4_cache import DEFAULT_CACHE_DIR, RECENT_DAYS, canonical_json, report_cache_key, ttl_for_date_ranges
+from ga4_reports import resolve_date
+
+# The dimension partitions are keyed on, as returned by the API (YYYYMMDD)
+PARTITION_DIMENSION = "date"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def report_signature(property_id, dimensions, metrics, dimension_filter=None, metric_filter=None):
+    """Identify a report independently of its date range, so its days can be shared between ranges."""
+    return report_cache_key(
+        property_id, dimensions, metrics, [], dimension_filter, extra={"partitioned": True},
+        metric_filter=metric_filter
+    )
+
+
+def describe_report(dimensions, metrics, dimension_filter=None, metric_filter=None):
+    """Describe a partitioned report's contents for PartitionStore.register."""
+    return {
+        "dimensions": list(dimensions),
+        "metrics": list(metrics),
+        "dimension_filter": canonical_json(dimension_filter) if dimension_filter else None,
+        "metric_filter": canonical_json(metric_filter) if metric_filter else None,
+    }
+
+
+def _partition_day(value):
+    """Convert a date dimension value (YYYYMMDD) to an ISO date string."""
+    return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+
+
+def _missing_runs(days, stored):
+    """Group the days not in stored into runs of consecutive days, as (first, last) ISO pairs."""
+    runs = []
+    for day in days:
+        if day in stored:
+            continue
+        if runs and date.fromisoformat(runs[-1][1]) + timedelta(days=1) == date.fromisoformat(day):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def _split_by_day(rows, start, end):
+    """Split rows fetched for start..end into a dict of ISO day to rows, including empty days."""
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    partitions = {(first + timedelta(days=i)).isoformat(): [] for i in range((last - first).days + 1)}
+    for row in rows:
+        day = _partition_day(row.get(PARTITION_DIMENSION, ""))
+        if day in partitions:
+            partitions[day].append(row)
+    return partitions
+
+
+class PartitionStore:
+    """SQLite-backed store of report rows partitioned by property, signature and day, with LRU size eviction."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS partitions ("
+            " property TEXT NOT NULL, signature TEXT NOT NULL, day TEXT NOT NULL, value BLOB NOT NULL,"
+            " fetched_at REAL NOT NULL, expires_at REAL, size INTEGER NOT NULL DEFAULT 0,"
+            " last_access REAL NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (property, signature, day))"
+        )
+        # Stores created before eviction lack the size and access columns
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(partitions)")}
+        if "size" not in columns:
+            self._conn.execute("ALTER TABLE partitions ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("ALTER TABLE partitions ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE partitions SET size = LENGTH(value), last_access = fetched_at")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS partitions_last_access ON partitions (last_access)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            " property TEXT NOT NULL, signature TEXT NOT NULL, description TEXT NOT NULL,"
+            " PRIMARY KEY (property, signature))"
+        )
+        self._conn.commit()
+        self.days_read = 0
+        self.days_fetched = 0
+        self.evictions = 0
+
+    def get(self, property_id, signature, start, end):
+        """Return {ISO day: rows} for the fresh partitions stored between start and end (inclusive)."""
+        now = time.time()
+        with self._lock:
+            result = self._conn.execute(
+                "SELECT day, value FROM partitions WHERE property = ? AND signature = ? AND day BETWEEN ? AND ?"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (str(property_id), signature, start, end, now),
+            ).fetchall()
+            if result:
+                self._conn.execute(
+                    "UPDATE partitions SET last_access = ? WHERE property = ? AND signature = ? AND day BETWEEN ? AND ?",
+                    (now, str(property_id), signature, start, end),
+                )
+                self._conn.commit()
+            self.days_read += len(result)
+        return {day: json.loads(value) for day, value in result}
+
+    def put(self, property_id, signature, partitions, today=None):
+        """
+        Store {ISO day: rows}, evicting old days if over budget.
+
+        Days within RECENT_DAYS of today expire like recent cache entries.
+        """
+        today = today or date.today()
+        now = time.time()
+        recent_from = (today - timedelta(days=RECENT_DAYS)).isoformat()
+        values = []
+        for day, rows in partitions.items():
+            expires_at = now + ttl_for_date_ranges([(day, day)], today) if day >= recent_from else None
+            value = json.dumps(rows, separators=(",", ":")).encode("utf-8")
+            values.append((str(property_id), signature, day, value, now, expires_at, len(value), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO partitions"
+                " (property, signature, day, value, fetched_at, expires_at, size, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                values,
+            )
+            self._evict(now)
+            self._conn.commit()
+            self.days_fetched += len(values)
+
+    def _evict(self, now):
+        """Drop expired days, then least recently used ones until under max_bytes, and reports left without days."""
+        self._conn.execute("DELETE FROM partitions WHERE expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM partitions").fetchone()[0]
+        if total > self.max_bytes:
+            for rowid, size in self._conn.execute(
+                "SELECT rowid, size FROM partitions ORDER BY last_access"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM partitions WHERE rowid = ?", (rowid,))
+                total -= size
+                self.evictions += 1
+        self._conn.execute(
+            "DELETE FROM reports WHERE NOT EXISTS (SELECT 1 FROM partitions"
+            " WHERE partitions.property = reports.property AND partitions.signature = reports.signature)"
+        )
+
+    def register(self, property_id, signature, description):
+        """Record what a signature contains (see describe_report), so it can be found by sources()."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (property, signature, description) VALUES (?, ?, ?)",
+                (str(property_id), signature, json.dumps(description)),
+            )
+            self._conn.commit()
+
+    def sources(self, property_id):
+        """Return {signature: description} of every registered report of a property."""
+        with self._lock:
+            result = self._conn.execute(
+                "SELECT signature, description FROM reports WHERE property = ?", (str(property_id),)
+            ).fetchall()
+        return {signature: json.loads(description) for signature, description in result}
+
+    def covered_days(self, property_id, signature, start, end):
+        """Count the fresh partitions stored for a signature between start and end (inclusive)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM partitions WHERE property = ? AND signature = ? AND day BETWEEN ? AND ?"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (str(property_id), signature, start, end, time.time()),
+            ).fetchone()[0]
+
+    def clear(self, property_id=None):
+        """Remove every partition, or only those of one property."""
+        with self._lock:
+            if property_id is None:
+                self._conn.execute("DELETE FROM partitions")
+                self._conn.execute("DELETE FROM reports")
+            else:
+                self._conn.execute("DELETE FROM partitions WHERE property = ?", (str(property_id),))
+                self._conn.execute("DELETE FROM reports WHERE property = ?", (str(property_id),))
+            self._conn.commit()
+
+    def stats(self):
+        """Return the number of stored partitions and reports, and days read from disk versus fetched."""
+        with self._lock:
+            partitions, signatures, size = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT signature), COALESCE(SUM(size), 0) FROM partitions"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "partitions": partitions,
+            "reports": signatures,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "days_read": self.days_read,
+            "days_fetched": self.days_fetched,
+            "evictions": self.evictions,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_partition_store():
+    """
+    Return the process-wide partition store, creating it on first use.
+
+    Lives next to the report cache in GA4_CACHE_DIR, with its size budget from
+    GA4_PARTITIONS_MAX_MB. Returns None if the store cannot be opened, so
+    callers fall back to fetching whole ranges.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                cache_dir = os.environ.get("GA4_CACHE_DIR", DEFAULT_CACHE_DIR)
+                max_bytes = int(float(os.environ.get("GA4_PARTITIONS_MAX_MB", DEFAULT_MAX_BYTES / (1024 * 1024))) * 1024 * 1024)
+                try:
+                    _store = PartitionStore(os.path.join(cache_dir, "partitions.sqlite3"), max_bytes)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"DEBUG: Partition store disabled: {e}", file=sys.stderr)
+                    return None
+    return _store
+
+
+def _plan(property_id, signature, start, end, refresh, today, description):
+    store = get_partition_store()
+    if store is not None and description is not None:
+        store.register(property_id, signature, description)
+    first, last = resolve_date(start, today), resolve_date(end, today)
+    days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+    stored = {}
+    if store is not None and days and not refresh:
+        stored = store.get(property_id, signature, days[0], days[-1])
+    return store, days, stored
+
+
+def fetch_incremental(property_id, signature, start, end, fetch_range, refresh=False, today=None, description=None):
+    """
+    Return the rows of a date-partitioned report, fetching only missing or expired days.
+
+    Args:
+        property_id: GA4 property ID.
+        signature: Report signature from report_signature.
+        start: Start date (ISO or relative).
+        end: End date (ISO or relative).
+        fetch_range: Callable (start_iso, end_iso) returning the report's rows for that range;
+                     each row must include the date dimension.
+        refresh: If True, refetch every day in the range and overwrite what is stored.
+        today: Reference date for relative dates (defaults to today).
+        description: Optional describe_report output, registered so the local query engine can use the rows.
+
+    Returns:
+        List of row dictionaries in date order.
+    """
+    store, days, stored = _plan(property_id, signature, start, end, refresh, today, description)
+    for run_start, run_end in _missing_runs(days, stored):
+        partitions = _split_by_day(fetch_range(run_start, run_end), run_start, run_end)
+        if store is not None:
+            store.put(property_id, signature, partitions, today)
+        stored.update(partitions)
+    return [row for day in days for row in stored[day]]
+
+
+async def fetch_incremental_async(property_id, signature, start, end, fetch_range, refresh=False, today=None,
+                                  description=None):
+    """Async counterpart of fetch_incremental; fetch_range is a coroutine function and runs are fetched concurrently."""
+    store, days, stored = await asyncio.to_thread(
+        _plan, property_id, signature, start, end, refresh, today, description
+    )
+    runs = _missing_runs(days, stored)
+    fetched = await asyncio.gather(*(fetch_range(run_start, run_end) for run_start, run_end in runs))
+    for (run_start, run_end), rows in zip(runs, fetched):
+        partitions = _split_by_day(rows, run_start, run_end)
+        if store is not None:
+            await asyncio.to_thread(store.put, property_id, signature, partitions, today)
+        stored.update(partitions)
+    return [row for day in days for row in stored[day]]
@@ -0,0 +1,285 @@
+"""
+In-process metrics for the MCP server: per-phase timings, latency histograms and counters.
+
+Histograms use fixed buckets, so recording a value is a bisect and a few
+additions under a lock, and memory does not grow with traffic. What is
+recorded:
+
+- ga4_tool_duration_seconds{tool} and ga4_tool_calls_total{tool,status}, by
+  instrument_tool, plus ga4_rows_returned_total{tool};
+- ga4_report_duration_seconds{property} for each property a report runs on;
+- ga4_api_duration_seconds{property,method} for each Data API call;
+- ga4_phase_duration_seconds{phase} for the phases of a request: parse,
+  filter_compile, client, queue, api, decode, cache_read, cache_write and
+  serialize. Phases may nest (filter_compile runs inside parse); each records
+  only its own time, not that of the phases inside it;
+- ga4_cache_lookups_total{result} and ga4_errors_total{type};
+- ga4_report_pages_total for every report page fetched,
+  ga4_batch_reports_paged_total for batched reports completed by paging and
+  ga4_clients_created_total{client} for clients added to the pool.
+
+MCP serializes tool results after they are returned, so serialization is
+measured on a sample of calls (every SERIALIZE_SAMPLE-th per tool), together
+with the response size in ga4_response_bytes{tool}.
+
+snapshot() summarizes everything with estimated percentiles, and
+render_prometheus() writes the Prometheus text exposition format. Set
+GA4_TELEMETRY=0 to turn recording off.
+"""
+import asyncio
+import bisect
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("GA4_TELEMETRY", "1") != "0"
+SERIALIZE_SAMPLE = max(int(os.environ.get("GA4_TELEMETRY_SERIALIZE_SAMPLE", "20")), 1)
+
+# Upper bounds in seconds; the last bucket (+Inf) is implicit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+HELP = {
+    "ga4_tool_duration_seconds": "Time spent in each MCP tool call.",
+    "ga4_tool_calls_total": "MCP tool calls by outcome.",
+    "ga4_rows_returned_total": "Rows returned by MCP tools.",
+    "ga4_report_duration_seconds": "Time to produce a report for one property, from cache or the API.",
+    "ga4_api_duration_seconds": "Latency of Data API calls, excluding time queued for quota.",
+    "ga4_phase_duration_seconds": "Self time of each request phase.",
+    "ga4_response_bytes": "JSON size of sampled tool results.",
+    "ga4_cache_lookups_total": "Report cache lookups by result.",
+    "ga4_errors_total": "Errors returned while fetching GA4 data, by exception type.",
+    "ga4_report_pages_total": "Report pages fetched from the Data API.",
+    "ga4_batch_reports_paged_total": "Batched reports whose remaining rows were fetched with offset paging.",
+    "ga4_clients_created_total": "GA4 clients created by the client pool, by client class.",
+}
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and max."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket (as Prometheus does)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_started_at = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Record a value in the histogram name{labels}."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def increment(name, value=1, **labels):
+    """Add value to the counter name{labels}."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Frame:
+    def __init__(self):
+        self.nested = 0.0
+
+
+_current_phase = contextvars.ContextVar("ga4_current_phase", default=None)
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a block (or, as a decorator, a function) as one phase of a request.
+
+    Time spent in phases opened inside the block is subtracted, so every phase
+    records its own time only.
+    """
+    if not ENABLED:
+        yield
+        return
+    parent = _current_phase.get()
+    frame = _Frame()
+    token = _current_phase.set(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _current_phase.reset(token)
+        if parent is not None:
+            parent.nested += elapsed
+        observe("ga4_phase_duration_seconds", max(elapsed - frame.nested, 0.0), phase=name)
+
+
+def _row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        if isinstance(result.get("rows"), list):
+            return len(result["rows"])
+        if isinstance(result.get("row_headers"), list):
+            return len(result["row_headers"])
+        if isinstance(result.get("row_count"), int):
+            return result["row_count"]
+    return 0
+
+
+def _record_call(tool, started, result, error, calls):
+    observe("ga4_tool_duration_seconds", time.perf_counter() - started, tool=tool)
+    failed = error or (isinstance(result, dict) and "error" in result)
+    increment("ga4_tool_calls_total", tool=tool, status="error" if failed else "ok")
+    if failed:
+        return
+    increment("ga4_rows_returned_total", _row_count(result), tool=tool)
+    if next(calls) % SERIALIZE_SAMPLE == 0:
+        with phase("serialize"):
+            size = len(json.dumps(result, default=str))
+        observe("ga4_response_bytes", size, buckets=SIZE_BUCKETS, tool=tool)
+
+
+def instrument_tool(fn):
+    """Decorator recording the duration, outcome and rows of each call to an MCP tool (sync or async)."""
+    if not ENABLED:
+        return fn
+    tool = fn.__name__
+    calls = itertools.count()
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException:
+                _record_call(tool, started, None, True, calls)
+                raise
+            _record_call(tool, started, result, False, calls)
+            return result
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                _record_call(tool, started, None, True, calls)
+                raise
+            _record_call(tool, started, result, False, calls)
+            return result
+    return wrapper
+
+
+def snapshot():
+    """
+    Summarize everything recorded so far.
+
+    Returns:
+        Dictionary with "uptime_seconds", "histograms" ({name: [{labels..., count, mean, p50, p95,
+        p99, max}]}, times in seconds) and "counters" ({name: [{labels..., value}]}).
+    """
+    with _lock:
+        histograms = {}
+        for (name, labels), histogram in sorted(_histograms.items()):
+            histograms.setdefault(name, []).append(dict(labels, **histogram.summary()))
+        counters = {}
+        for (name, labels), value in sorted(_counters.items()):
+            counters.setdefault(name, []).append(dict(labels, value=value))
+    return {"uptime_seconds": round(time.time() - _started_at, 1), "histograms": histograms, "counters": counters}
+
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus():
+    """Render every histogram and counter in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+        lines = []
+        described = set()
+        for (name, labels), histogram in histograms:
+            if name not in described:
+                described.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            cumulative = 0
+            for bound, n in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_labels_text(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            if name not in described:
+                described.add(name)
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+            lines.append(f"{name}{_labels_text(labels)} {value}")
+    lines += ["# HELP ga4_uptime_seconds Seconds since metrics were started or reset.",
+              "# TYPE ga4_uptime_seconds gauge", f"ga4_uptime_seconds {time.time() - _started_at:.1f}"]
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Forget everything recorded so far."""
+    global _started_at
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _started_at = time.time()
@@ -1,13 +1,20 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import json
 import tempfile
 import os
+import threading
 import pandas as pd
-from nlq import nlq_to_ga4_params
-from ga4_api import run_ga4_query
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from nlq import match_local_query, nlq_to_ga4_params
+from ga4_api import (
+    REALTIME_POLL_INTERVAL, export_ga4_zip, get_field_lists, get_realtime_changes, plan_batch, run_ga4_batch,
+    run_ga4_query
+)
+# ga4_api has put the server modules one directory up on sys.path
+from ga4_export import default_export_path
+from ga4_reports import MAX_BATCH_REPORTS
 from datetime import datetime, timedelta
-import io
-import zipfile
 
 # Ensure session state keys are initialized
 if 'creds_path' not in st.session_state:
@@ -39,9 +46,14 @@ else:
 
 creds_file = st.sidebar.file_uploader("Upload GA4 credentials (.json)", type=["json"])
 if creds_file:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".json") as tmp:
-        tmp.write(creds_file.read())
-        st.session_state['creds_path'] = tmp.name
+    # Only write a new temp file when a different file is uploaded, so the pooled
+    # GA4 client (keyed by credentials path) is reused across reruns
+    upload_id = getattr(creds_file, 'file_id', None) or (creds_file.name, creds_file.size)
+    if st.session_state.get('creds_upload_id') != upload_id:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".json") as tmp:
+            tmp.write(creds_file.read())
+            st.session_state['creds_path'] = tmp.name
+        st.session_state['creds_upload_id'] = upload_id
     st.sidebar.success("Credentials uploaded!")
 
 property_id = st.sidebar.text_input("GA4 Property ID", value=st.session_state['property_id'])
@@ -56,112 +68,223 @@ st.session_state['days_filter'] = selected_days
 DEFAULT_START = (datetime.today() - timedelta(days=selected_days)).strftime('%Y-%m-%d')
 DEFAULT_END = datetime.today().strftime('%Y-%m-%d')
 
-# --- Helper for running queries ---
-def safe_run_query(metrics, dimensions, start=None, end=None, limit=None):
-    # Always use default date range if not provided
-    if not start:
-        start = DEFAULT_START
-    if not end:
-        end = DEFAULT_END
+# Dashboard panels: name -> (metrics, dimensions, limit)
+DASHBOARD_PANELS = {
+    "users": (["totalUsers"], [], None),
+    "new_users": (["newUsers"], [], None),
+    "sessions": (["sessions"], [], None),
+    "bounce": (["bounceRate"], [], None),
+    "avg_sess": (["averageSessionDuration"], [], None),
+    "users_time": (["totalUsers"], ["date"], None),
+    "top_pages": (["screenPageViews"], ["pagePath"], 10),
+    "sources": (["sessions"], ["sessionSource"], 10),
+    "geo": (["sessions"], ["country"], 10),
+    "devices": (["sessions"], ["deviceCategory"], None),
+}
+
+# CSV member of the dashboard ZIP export for each panel
+ZIP_MEMBERS = {
+    "users": "users.csv", "new_users": "new_users.csv", "sessions": "sessions.csv", "bounce": "bounce_rate.csv",
+    "avg_sess": "avg_session_duration.csv", "users_time": "users_time.csv", "top_pages": "top_pages.csv",
+    "sources": "sources.csv", "geo": "countries.csv", "devices": "devices.csv",
+}
+
+# The dashboard window always ends today, which GA4 is still processing, so panels are kept for
+# five minutes; widget interactions within that time rerun the script without any GA4 call
+PANEL_CACHE_TTL = 5 * 60
+# Batches fetched at once; each BatchRunReports call holds one of GA4's 10 concurrent requests per property
+PANEL_FETCH_WORKERS = 5
+
+@st.cache_data(ttl=PANEL_CACHE_TTL, show_spinner=False)
+def load_batch(property_id, creds_path, queries):
+    # Panels with a limit are top-N by their first metric, computed server-side
+    return run_ga4_batch(property_id, creds_path, queries)
+
+def panel_queries(panels):
+    """Build the run_ga4_batch query of each panel for the selected date window."""
+    # Panels with a limit are top-N by their first metric
+    return {
+        name: {"metrics": metrics, "dimensions": dimensions, "start": DEFAULT_START, "end": DEFAULT_END,
+               "order_bys": [f"-{metrics[0]}"] if limit else None, "limit": limit}
+        for name, (metrics, dimensions, limit) in panels.items()
+    }
+
+def iter_panels(panels):
+    """
+    Fetch panels in concurrent batches and yield (name, DataFrame, error) as each batch arrives.
+
+    Panels sharing dimensions and limit are merged into one report (plan_batch), and the reports
+    are sent five at a time through BatchRunReports, so a cold load takes two round trips. Each
+    batch is cached per property, fields and date window, so reruns are served from memory.
+    """
+    queries = panel_queries(panels)
+    plan = plan_batch(queries)
+    batches = [
+        {name: queries[name] for report in plan[i:i + MAX_BATCH_REPORTS] for name in report["panels"]}
+        for i in range(0, len(plan), MAX_BATCH_REPORTS)
+    ]
+    # Worker threads share the script's context, so cached calls do not warn about a missing one
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=PANEL_FETCH_WORKERS,
+                            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as executor:
+        futures = {
+            executor.submit(load_batch, st.session_state['property_id'], st.session_state['creds_path'], batch): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                frames, error = future.result(), None
+            except Exception as e:
+                frames, error = {}, e
+            for name in batch:
+                yield name, frames.get(name, pd.DataFrame()), error
+
+# --- Panel renderers: each draws one panel into its placeholder ---
+def render_users(df):
+    st.metric("Users", df["totalUsers"].astype(int).sum() if not df.empty else "-")
+
+def render_new_users(df):
+    st.metric("New Users", df["newUsers"].astype(int).sum() if not df.empty else "-")
+
+def render_sessions(df):
+    st.metric("Sessions", df["sessions"].astype(int).sum() if not df.empty else "-")
+
+def render_bounce(df):
+    st.metric("Bounce Rate", f"{float(df['bounceRate'].iloc[0]):.2f}%" if not df.empty else "-")
+
+def render_avg_sess(df):
+    st.metric("Avg. Session Duration", f"{float(df['averageSessionDuration'].iloc[0])/60:.2f} min" if not df.empty else "-")
+
+def render_users_time(df):
+    if not df.empty:
+        chart = df.assign(date=pd.to_datetime(df["date"]))
+        st.line_chart(chart.set_index("date")["totalUsers"].astype(int))
+    else:
+        st.info("No user data for this period.")
+
+def render_top_pages(df):
+    if not df.empty:
+        st.dataframe(df)
+        st.download_button("Download Top Pages CSV", df.to_csv(index=False), "top_pages.csv", "text/csv")
+    else:
+        st.info("No pageview data.")
+
+def render_breakdown(df, dimension, label, file_name, empty_message):
+    if not df.empty:
+        st.bar_chart(df.set_index(dimension)["sessions"].astype(int))
+        st.dataframe(df)
+        st.download_button(f"Download {label} CSV", df.to_csv(index=False), file_name, "text/csv")
+    else:
+        st.info(empty_message)
+
+PANEL_RENDERERS = {
+    "users": render_users,
+    "new_users": render_new_users,
+    "sessions": render_sessions,
+    "bounce": render_bounce,
+    "avg_sess": render_avg_sess,
+    "users_time": render_users_time,
+    "top_pages": render_top_pages,
+    "sources": lambda df: render_breakdown(df, "sessionSource", "Sources", "sources.csv", "No source data."),
+    "geo": lambda df: render_breakdown(df, "country", "Countries", "countries.csv", "No country data."),
+    "devices": lambda df: render_breakdown(df, "deviceCategory", "Devices", "devices.csv", "No device data."),
+}
+
+# --- Live panel: realtime data, refreshed on its own without rerunning the dashboard ---
+def poll_live_report(key, dimensions, metrics):
+    """Apply the realtime rows changed since this session's last poll to its copy of the report."""
+    live = st.session_state.setdefault(key, {"cursor": None, "rows": {}})
+    changes = get_realtime_changes(
+        st.session_state['property_id'], st.session_state['creds_path'], dimensions, metrics, live["cursor"]
+    )
+    if changes["reset"]:
+        live["rows"] = {}
+    for row in changes["rows"]:
+        live["rows"][tuple(row[d] for d in dimensions)] = row
+    for removed in changes["removed"]:
+        live["rows"].pop(tuple(removed[d] for d in dimensions), None)
+    live["cursor"] = changes["cursor"]
+    return pd.DataFrame.from_records(list(live["rows"].values()), columns=dimensions + metrics), changes
+
+@st.fragment(run_every=REALTIME_POLL_INTERVAL)
+def render_live_panel():
     try:
-        df = run_ga4_query(
-            st.session_state['property_id'],
-            st.session_state['creds_path'],
-            metrics, dimensions, start, end
-        )
-        if limit:
-            df = df.head(limit)
-        return df
+        total, changes = poll_live_report("live_total", [], ["activeUsers"])
+        by_minute, _ = poll_live_report("live_minutes", ["minutesAgo"], ["activeUsers"])
+        by_country, _ = poll_live_report("live_countries", ["country"], ["activeUsers"])
     except Exception as e:
         st.error(f"Error: {e}")
-        return pd.DataFrame()
+        return
+    left, right = st.columns([1, 2])
+    left.metric("Active users, last 30 minutes", int(total["activeUsers"].astype(int).sum()) if not total.empty else 0)
+    left.caption(f"Updated {changes['changed_at']} (checked {changes['age_seconds']:.0f}s ago)")
+    if not by_country.empty:
+        by_country = by_country.assign(activeUsers=by_country["activeUsers"].astype(int))
+        left.dataframe(by_country.sort_values("activeUsers", ascending=False).head(10), hide_index=True)
+    if not by_minute.empty:
+        chart = by_minute.assign(minutesAgo=by_minute["minutesAgo"].astype(int), activeUsers=by_minute["activeUsers"].astype(int))
+        right.bar_chart(chart.set_index("minutesAgo")["activeUsers"].sort_index(ascending=False))
+    else:
+        right.info("No active users right now.")
 
 # --- Main Dashboard ---
-users = new_users = sessions = bounce = avg_sess = users_time = top_pages = sources = geo = devices = pd.DataFrame()
-
 if st.session_state['creds_path'] and st.session_state['property_id']:
-    col1, col2, col3, col4, col5 = st.columns(5)
+    # Lay out a placeholder per panel first, then fill each one as its data arrives
+    slots = {}
     # 1. Key Metrics
-    with col1:
-        users = safe_run_query(["totalUsers"], [], None, None)
-        st.metric("Users", users["totalUsers"].astype(int).sum() if not users.empty else "-")
-    with col2:
-        new_users = safe_run_query(["newUsers"], [], None, None)
-        st.metric("New Users", new_users["newUsers"].astype(int).sum() if not new_users.empty else "-")
-    with col3:
-        sessions = safe_run_query(["sessions"], [], None, None)
-        st.metric("Sessions", sessions["sessions"].astype(int).sum() if not sessions.empty else "-")
-    with col4:
-        bounce = safe_run_query(["bounceRate"], [], None, None)
-        st.metric("Bounce Rate", f"{float(bounce['bounceRate'].iloc[0]):.2f}%" if not bounce.empty else "-")
-    with col5:
-        avg_sess = safe_run_query(["averageSessionDuration"], [], None, None)
-        st.metric("Avg. Session Duration", f"{float(avg_sess['averageSessionDuration'].iloc[0])/60:.2f} min" if not avg_sess.empty else "-")
+    for name, col in zip(("users", "new_users", "sessions", "bounce", "avg_sess"), st.columns(5)):
+        slots[name] = col.empty()
 
     st.markdown("---")
     # 2. Time Series
     st.subheader("Users Over Time")
-    users_time = safe_run_query(["totalUsers"], ["date"], None, None)
-    if not users_time.empty:
-        users_time["date"] = pd.to_datetime(users_time["date"])
-        st.line_chart(users_time.set_index("date")["totalUsers"].astype(int))
-    else:
-        st.info("No user data for this period.")
-
+    slots["users_time"] = st.empty()
     # 3. Top Pages
     st.subheader("Top Pages by Pageviews")
-    top_pages = safe_run_query(["screenPageViews"], ["pagePath"], None, None, limit=10)
-    if not top_pages.empty:
-        st.dataframe(top_pages)
-        st.download_button("Download Top Pages CSV", top_pages.to_csv(index=False), "top_pages.csv", "text/csv")
-    else:
-        st.info("No pageview data.")
-
+    slots["top_pages"] = st.empty()
     # 4. Traffic Sources
     st.subheader("Top Traffic Sources")
-    sources = safe_run_query(["sessions"], ["sessionSource"], None, None, limit=10)
-    if not sources.empty:
-        st.bar_chart(sources.set_index("sessionSource")["sessions"].astype(int))
-        st.dataframe(sources)
-        st.download_button("Download Sources CSV", sources.to_csv(index=False), "sources.csv", "text/csv")
-    else:
-        st.info("No source data.")
-
+    slots["sources"] = st.empty()
     # 5. Geography
     st.subheader("Top Countries")
-    geo = safe_run_query(["sessions"], ["country"], None, None, limit=10)
-    if not geo.empty:
-        st.bar_chart(geo.set_index("country")["sessions"].astype(int))
-        st.dataframe(geo)
-        st.download_button("Download Countries CSV", geo.to_csv(index=False), "countries.csv", "text/csv")
-    else:
-        st.info("No country data.")
-
+    slots["geo"] = st.empty()
     # 6. Devices
     st.subheader("Device Category Breakdown")
-    devices = safe_run_query(["sessions"], ["deviceCategory"], None, None)
-    if not devices.empty:
-        st.bar_chart(devices.set_index("deviceCategory")["sessions"].astype(int))
-        st.dataframe(devices)
-        st.download_button("Download Devices CSV", devices.to_csv(index=False), "devices.csv", "text/csv")
-    else:
-        st.info("No device data.")
+    slots["devices"] = st.empty()
+
+    for slot in slots.values():
+        slot.caption("Loading...")
+    for name, df, error in iter_panels(DASHBOARD_PANELS):
+        with slots[name].container():
+            if error is not None:
+                st.error(f"Error: {error}")
+            PANEL_RENDERERS[name](df)
 
     st.markdown("---")
 
+    # 7. Realtime
+    if st.sidebar.checkbox("Show live view (realtime)", value=False):
+        st.subheader("Live: Active Users")
+        render_live_panel()
+        st.markdown("---")
+
     # --- Query Section ---
     st.header("Ask a Custom Question (Natural Language Query)")
     st.markdown("You can ask about any GA4 metric or dimension. [See full schema](https://developers.google.com/analytics/devguides/reporting/data/v1/api-schema)")
+    # The property's fields, including its custom definitions (metadata is cached for a day)
+    valid_metrics, valid_dimensions = get_field_lists(st.session_state['property_id'], st.session_state['creds_path'])
     if st.button("Show valid GA4 fields"):
-        st.info("**Metrics:** totalUsers, newUsers, sessions, bounceRate, averageSessionDuration, screenPageViews, engagedSessions, engagementRate, eventCount, conversions, userEngagementDuration, activeUsers, sessionConversionRate, userConversionRate, views\n**Dimensions:** date, pagePath, landingPage, sessionSource, sessionMedium, country, city, deviceCategory, browser, operatingSystem, language, userGender, userAgeBracket, eventName, sessionDefaultChannelGroup, region, continent, platform, appVersion, pageTitle, sourceMedium, campaignName, hostName")
+        st.info(f"**Metrics:** {', '.join(valid_metrics)}\n**Dimensions:** {', '.join(valid_dimensions)}")
     user_query = st.text_input("Type your question (e.g. 'Show me users from the US'):")
     if user_query:
-        if not st.session_state['openai_api_key']:
+        # Common phrasings are translated locally and work without an OpenAI key
+        if not st.session_state['openai_api_key'] and match_local_query(user_query) is None:
             st.warning("Please enter your OpenAI API key in the sidebar to use natural language queries.")
         else:
             with st.spinner("Processing your query..."):
                 try:
-                    params = nlq_to_ga4_params(user_query, st.session_state['openai_api_key'])
+                    params = nlq_to_ga4_params(user_query, st.session_state['openai_api_key'], (valid_metrics, valid_dimensions))
                 except Exception as e:
                     st.error(f"OpenAI API error: {e}")
                     st.info("Check your API key or try again later.")
@@ -180,7 +303,9 @@ if st.session_state['creds_path'] and st.session_state['property_id']:
                                 params['metrics'],
                                 params['dimensions'],
                                 DEFAULT_START,
-                                DEFAULT_END
+                                DEFAULT_END,
+                                order_bys=params.get('order_bys'),
+                                limit=params.get('limit')
                             )
                             if df.empty:
                                 st.warning("No data returned for this query.")
@@ -195,32 +320,21 @@ if st.session_state['creds_path'] and st.session_state['property_id']:
     # --- Download All Data as ZIP ---
     st.markdown("---")
     st.subheader("Download All Dashboard Data")
-    if st.button("Download All as ZIP"):
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zf:
-            if not users.empty:
-                zf.writestr("users.csv", users.to_csv(index=False))
-            if not new_users.empty:
-                zf.writestr("new_users.csv", new_users.to_csv(index=False))
-            if not sessions.empty:
-                zf.writestr("sessions.csv", sessions.to_csv(index=False))
-            if not bounce.empty:
-                zf.writestr("bounce_rate.csv", bounce.to_csv(index=False))
-            if not avg_sess.empty:
-                zf.writestr("avg_session_duration.csv", avg_sess.to_csv(index=False))
-            if not users_time.empty:
-                zf.writestr("users_time.csv", users_time.to_csv(index=False))
-            if not top_pages.empty:
-                zf.writestr("top_pages.csv", top_pages.to_csv(index=False))
-            if not sources.empty:
-                zf.writestr("sources.csv", sources.to_csv(index=False))
-            if not geo.empty:
-                zf.writestr("countries.csv", geo.to_csv(index=False))
-            if not devices.empty:
-                zf.writestr("devices.csv", devices.to_csv(index=False))
-        zip_buffer.seek(0)
-        st.download_button("Download ZIP", zip_buffer, "ga4_dashboard_data.zip", "application/zip")
-
-    st.caption("All data is live from your GA4 property. Download any table as CSV or all as ZIP. Built with Streamlit.")
+    if st.button("Export All as ZIP"):
+        # The panels are re-run page by page straight into a ZIP under the export directory,
+        # so no table is held in memory however many rows it has
+        queries = panel_queries(DASHBOARD_PANELS)
+        with st.spinner("Exporting dashboard data..."):
+            try:
+                result = export_ga4_zip(
+                    st.session_state['property_id'], st.session_state['creds_path'],
+                    {ZIP_MEMBERS[name]: q for name, q in queries.items()},
+                    default_export_path("zip", "ga4-dashboard")
+                )
+                st.success(f"Saved {sum(result['rows'].values())} rows to {result['path']}")
+            except Exception as e:
+                st.error(f"Error exporting GA4 data: {e}")
+
+    st.caption("All data is live from your GA4 property. Download any table as CSV or export all as ZIP. Built with Streamlit.")
 else:
     st.info("Please upload credentials and enter property ID in the sidebar.") 
\ No newline at end of file
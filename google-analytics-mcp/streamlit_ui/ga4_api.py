@@ -1,22 +1,221 @@
+import os
+import sys
 import pandas as pd
-from google.analytics.data_v1beta import BetaAnalyticsDataClient
 from google.analytics.data_v1beta.types import DateRange, Metric, Dimension, RunReportRequest
 
-def run_ga4_query(property_id, creds_path, metrics, dimensions, date_range_start, date_range_end):
-    client = BetaAnalyticsDataClient.from_service_account_file(creds_path)
-    request = RunReportRequest(
-        property=f"properties/{property_id}",
+# Share the client pool with the MCP server, which lives one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ga4_client_pool import get_client
+from ga4_reports import build_order_bys, iter_report_pages, iter_report_rows, parse_order_bys, run_report_batch
+from ga4_cache import cached_report, get_report_cache, report_cache_key, ttl_for_date_ranges
+from ga4_columnar import ColumnarReport
+from ga4_quota import ScheduledClient
+from ga4_store import describe_report, fetch_incremental, report_signature
+from ga4_metadata import get_metadata_catalog
+from ga4_export import export_pages_zip
+from ga4_realtime import REALTIME_POLL_INTERVAL, build_realtime_request, poll_realtime
+from ga4_fields import GA4_METRICS, GA4_DIMENSIONS
+
+# GA4 accepts at most 10 metrics in a single report
+MAX_METRICS_PER_REPORT = 10
+
+def get_field_lists(property_id, creds_path):
+    """
+    Return the (metrics, dimensions) natural language queries may use for a property: the
+    ga4_fields lists the property accepts, plus its custom definitions from the metadata API.
+    Falls back to the ga4_fields lists when the metadata cannot be fetched.
+    """
+    catalog = get_metadata_catalog(property_id, lambda: get_client(creds_path, property_id))
+    if catalog.source == "static":
+        return list(GA4_METRICS), list(GA4_DIMENSIONS)
+    metrics = [m for m in GA4_METRICS if catalog.is_metric(m)]
+    metrics += [name for name, field in catalog.metrics.items() if field["customDefinition"]]
+    dimensions = [d for d in GA4_DIMENSIONS if catalog.is_dimension(d)]
+    dimensions += [name for name, field in catalog.dimensions.items() if field["customDefinition"]]
+    return metrics, dimensions
+
+def get_realtime_changes(property_id, creds_path, dimensions, metrics, cursor=None, interval=REALTIME_POLL_INTERVAL):
+    """
+    Poll a realtime report and return the rows changed since cursor (see ga4_realtime.poll_realtime).
+
+    The report's snapshot is shared by every dashboard session in the process, so the API is
+    called at most once per interval however many sessions show the live panel.
+    """
+    client = ScheduledClient(get_client(creds_path, property_id), property_id)
+    request = build_realtime_request(property_id, dimensions, metrics)
+    return poll_realtime(
+        type(request).serialize(request), lambda: client.run_realtime_report(request), cursor, interval
+    )
+
+def _query_options(order_bys=None, limit=None, offset=None):
+    """Cache-key options for ordering and limit/offset, or None when none are set."""
+    if not (order_bys or limit or offset):
+        return None
+    return {"order_bys": parse_order_bys(order_bys), "limit": limit or None, "offset": offset or None}
+
+def build_request(metrics, dimensions, date_range_start, date_range_end, order_bys=None, limit=None, offset=None):
+    """Build a RunReportRequest (without property) with ordering and limit/offset applied server-side."""
+    return RunReportRequest(
         dimensions=[Dimension(name=d) for d in dimensions],
         metrics=[Metric(name=m) for m in metrics],
         date_ranges=[DateRange(start_date=date_range_start, end_date=date_range_end)],
+        order_bys=build_order_bys(parse_order_bys(order_bys), dimensions, metrics),
+        limit=limit or None,
+        offset=offset or None,
     )
-    response = client.run_report(request)
-    data = []
-    for row in response.rows:
-        row_data = {}
-        for i, d in enumerate(dimensions):
-            row_data[d] = row.dimension_values[i].value
-        for i, m in enumerate(metrics):
-            row_data[m] = row.metric_values[i].value
-        data.append(row_data)
-    return pd.DataFrame(data) 
\ No newline at end of file
+
+def run_ga4_query(property_id, creds_path, metrics, dimensions, date_range_start, date_range_end,
+                  order_bys=None, limit=None, offset=None, use_cache=True, output_format="rows"):
+    """
+    Run a report and return it as a DataFrame.
+
+    With output_format="rows" every column holds strings, as returned by the API. With
+    output_format="columnar" the rows are decoded straight into typed columns: int64/float64
+    metrics (from the API's metric types) and categorical dimensions, so no .astype() is needed.
+    """
+    date_ranges = [(date_range_start, date_range_end)]
+    columnar = output_format == "columnar"
+
+    def fetch():
+        client = ScheduledClient(get_client(creds_path, property_id), property_id)
+        request = build_request(metrics, dimensions, date_range_start, date_range_end, order_bys, limit, offset)
+        request.property = f"properties/{property_id}"
+        # Rows are pulled page by page, so reports larger than one API page are complete
+        if columnar:
+            return ColumnarReport.from_pages(iter_report_pages(client, request)).to_dict()
+        if "date" in dimensions and not (order_bys or limit or offset):
+            # Daily reports reuse the days already in the local partition store
+            def fetch_range(start, end):
+                request.date_ranges = [DateRange(start_date=start, end_date=end)]
+                return list(iter_report_rows(client, request))
+
+            signature = report_signature(property_id, dimensions, metrics)
+            return fetch_incremental(
+                property_id, signature, date_range_start, date_range_end, fetch_range, refresh=not use_cache,
+                description=describe_report(dimensions, metrics)
+            )
+        return list(iter_report_rows(client, request))
+
+    # Identical queries (e.g. on Streamlit reruns) are answered from the on-disk report cache
+    extra = _query_options(order_bys, limit, offset)
+    if columnar:
+        extra = dict(extra or {}, output_format="columnar")
+    key = report_cache_key(property_id, dimensions, metrics, date_ranges, extra=extra)
+    result = cached_report(key, date_ranges, fetch, use_cache=use_cache)
+    if columnar:
+        return ColumnarReport.from_dict(result).to_pandas()
+    return pd.DataFrame.from_records(result, columns=list(dimensions) + list(metrics))
+
+def plan_batch(queries):
+    """
+    Merge compatible queries into as few reports as possible.
+
+    Queries with the same dimensions, date range, ordering and limit are compatible:
+    they become one report whose metrics are the union of theirs (up to 10 metrics
+    per report).
+
+    Args:
+        queries: Dict of panel name to {"metrics", "dimensions", "start", "end"} plus
+                 optional "order_bys" and "limit".
+
+    Returns:
+        List of planned reports, each {"dimensions", "metrics", "start", "end", "order_bys", "limit", "panels"},
+        where "panels" lists the query names answered by that report.
+    """
+    groups = {}
+    for name, q in queries.items():
+        order_bys = tuple(parse_order_bys(q.get("order_bys")))
+        groups.setdefault((tuple(q["dimensions"]), q["start"], q["end"], order_bys, q.get("limit")), []).append(name)
+    plan = []
+    for (dims, start, end, order_bys, limit), names in groups.items():
+        report = None
+        for name in names:
+            if report is not None:
+                new_metrics = [m for m in queries[name]["metrics"] if m not in report["metrics"]]
+                if len(report["metrics"]) + len(new_metrics) > MAX_METRICS_PER_REPORT:
+                    report = None
+            if report is None:
+                report = {"dimensions": list(dims), "metrics": [], "start": start, "end": end,
+                          "order_bys": list(order_bys), "limit": limit, "panels": []}
+                plan.append(report)
+            report["metrics"].extend(m for m in queries[name]["metrics"] if m not in report["metrics"])
+            report["panels"].append(name)
+    return plan
+
+def run_ga4_batch(property_id, creds_path, queries, use_cache=True):
+    """
+    Run several dashboard queries with as few API round trips as possible.
+
+    Cached queries are answered locally. The rest are merged by plan_batch and sent
+    through BatchRunReports (five reports per call), and each merged result is split
+    back into one DataFrame per query.
+
+    Args:
+        property_id: GA4 property ID.
+        creds_path: Path to the service account JSON key.
+        queries: Dict of panel name to {"metrics", "dimensions", "start", "end"} plus
+                 optional "order_bys" and "limit".
+        use_cache: Read and write the on-disk report cache.
+
+    Returns:
+        Dict of panel name to DataFrame, with the query's dimensions then metrics as columns.
+    """
+    cache = get_report_cache() if use_cache else None
+    results = {}
+    keys = {}
+    pending = {}
+    for name, q in queries.items():
+        keys[name] = report_cache_key(
+            property_id, q["dimensions"], q["metrics"], [(q["start"], q["end"])],
+            extra=_query_options(q.get("order_bys"), q.get("limit"))
+        )
+        rows = cache.get(keys[name]) if cache is not None else None
+        if rows is not None:
+            results[name] = pd.DataFrame.from_records(rows, columns=list(q["dimensions"]) + list(q["metrics"]))
+        else:
+            pending[name] = q
+    if not pending:
+        return results
+
+    plan = plan_batch(pending)
+    requests = [
+        build_request(report["metrics"], report["dimensions"], report["start"], report["end"],
+                      report["order_bys"], report["limit"])
+        for report in plan
+    ]
+    client = ScheduledClient(get_client(creds_path, property_id), property_id)
+    for report, rows in zip(plan, run_report_batch(client, property_id, requests)):
+        for name in report["panels"]:
+            q = pending[name]
+            columns = list(q["dimensions"]) + list(q["metrics"])
+            panel_rows = [{c: row.get(c) for c in columns} for row in rows]
+            if cache is not None:
+                date_ranges = [(q["start"], q["end"])]
+                cache.put(keys[name], panel_rows, ttl_for_date_ranges(date_ranges))
+            results[name] = pd.DataFrame.from_records(panel_rows, columns=columns)
+    return results
+
+def export_ga4_zip(property_id, creds_path, queries, path):
+    """
+    Export several queries into one ZIP of CSV files on disk, page by page.
+
+    Each report is fetched with iter_report_pages and written into its ZIP member as the
+    pages arrive, so memory stays flat however many rows the reports have.
+
+    Args:
+        property_id: GA4 property ID.
+        creds_path: Path to the service account JSON key.
+        queries: Dict of member name (e.g. 'users.csv') to {"metrics", "dimensions", "start", "end"}
+                 plus optional "order_bys" and "limit".
+        path: Destination ZIP path; an existing file is never replaced.
+
+    Returns:
+        Dictionary with the path, number of rows per member and file size in bytes.
+    """
+    client = ScheduledClient(get_client(creds_path, property_id), property_id)
+    members = {}
+    for name, q in queries.items():
+        request = build_request(q["metrics"], q["dimensions"], q["start"], q["end"], q.get("order_bys"), q.get("limit"))
+        request.property = f"properties/{property_id}"
+        members[name] = iter_report_pages(client, request)
+    return export_pages_zip(members, path)
@@ -1,7 +1,142 @@
 import openai
+import copy
+import hashlib
 import json
+import re
+import threading
+import time
+from collections import OrderedDict
 from ga4_fields import GA4_METRICS, GA4_DIMENSIONS, UA_TO_GA4
 
+NLQ_MODEL = "gpt-3.5-turbo"
+
+# Translations are deterministic (temperature=0), so repeated questions are answered from
+# memory. The key includes a version of the field lists and model, so editing them
+# invalidates old answers.
+NLQ_CACHE_TTL = 24 * 60 * 60
+NLQ_CACHE_MAX_ENTRIES = 256
+FIELDS_VERSION = hashlib.sha256(
+    json.dumps([GA4_METRICS, GA4_DIMENSIONS, UA_TO_GA4, NLQ_MODEL], sort_keys=True).encode("utf-8")
+).hexdigest()[:12]
+_translations = OrderedDict()
+_translations_lock = threading.Lock()
+
+# Phrases the local matcher understands, mapped to GA4 fields. Questions made only of
+# these (plus filler words) are translated without calling the model.
+METRIC_PHRASES = {
+    "users": "totalUsers", "total users": "totalUsers", "visitors": "totalUsers", "people": "totalUsers",
+    "new users": "newUsers", "new visitors": "newUsers", "active users": "activeUsers",
+    "sessions": "sessions", "visits": "sessions", "engaged sessions": "engagedSessions",
+    "pageviews": "screenPageViews", "page views": "screenPageViews", "views": "screenPageViews",
+    "bounce rate": "bounceRate", "engagement rate": "engagementRate",
+    "average session duration": "averageSessionDuration", "session duration": "averageSessionDuration",
+    "time on site": "averageSessionDuration", "engagement time": "userEngagementDuration",
+    "events": "eventCount", "event count": "eventCount", "conversions": "conversions",
+    "conversion rate": "sessionConversionRate",
+}
+DIMENSION_PHRASES = {
+    "pages": "pagePath", "page": "pagePath", "page paths": "pagePath", "urls": "pagePath",
+    "page titles": "pageTitle", "landing pages": "landingPage", "landing page": "landingPage",
+    "countries": "country", "country": "country", "cities": "city", "city": "city",
+    "regions": "region", "region": "region", "continents": "continent", "continent": "continent",
+    "devices": "deviceCategory", "device": "deviceCategory", "device category": "deviceCategory",
+    "browsers": "browser", "browser": "browser", "operating systems": "operatingSystem",
+    "operating system": "operatingSystem", "os": "operatingSystem", "languages": "language",
+    "language": "language", "sources": "sessionSource", "source": "sessionSource",
+    "traffic sources": "sessionSource", "referrers": "sessionSource", "mediums": "sessionMedium",
+    "medium": "sessionMedium", "source medium": "sourceMedium", "channels": "sessionDefaultChannelGroup",
+    "channel": "sessionDefaultChannelGroup", "campaigns": "campaignName", "campaign": "campaignName",
+    "events": "eventName", "event": "eventName", "gender": "userGender", "age": "userAgeBracket",
+    "day": "date", "date": "date", "days": "date", "hostnames": "hostName", "platforms": "platform",
+}
+# What "top <dimension>" is ranked by when no metric is given
+DEFAULT_TOP_METRIC = {"pagePath": "screenPageViews", "pageTitle": "screenPageViews", "eventName": "eventCount"}
+DEFAULT_TOP_N = 10
+
+_LEADING_FILLER = re.compile(
+    r"^(?:please |can you |could you )?(?:show me |show |give me |list |get |tell me )?"
+    r"(?:how many |number of |the number of |what is |what's |whats |what are |what were |total )?(?:the |our |my )?"
+)
+_TRAILING_FILLER = re.compile(
+    r"(?: (?:do|did) we (?:have|get)| are there| were there| in total| overall| on the site| on our site)$"
+)
+_UA_FIELDS = {k.lower(): v for k, v in UA_TO_GA4.items()}
+_TOP_QUERY = re.compile(r"^(?:the )?(?:top|best|most popular) (?:(?P<n>\d+) )?(?P<dims>.+?)(?: by (?P<mets>.+))?$")
+_BREAKDOWN_QUERY = re.compile(r"^(?P<mets>.+?)(?: (?:by|per|for each|broken down by|across) (?P<dims>.+))?$")
+
+def normalize_question(nl_query):
+    q = str(nl_query).lower().replace("\u2019", "'")
+    q = re.sub(r"\s*,\s*(?:and\s+)?", " and ", q)
+    q = re.sub(r"[^a-z0-9:_' ]+", " ", q)
+    return re.sub(r"\s+", " ", q).strip()
+
+def _resolve_fields(text, phrases, valid_fields):
+    fields = []
+    for part in re.split(r" and | & ", text):
+        part = part.strip()
+        part = re.sub(r"^(?:the |our |my )", "", part)
+        field = phrases.get(part)
+        if field is None:
+            # Exact GA4 or UA field names are accepted too
+            field = next((f for f in valid_fields if f.lower() == part), None) or _UA_FIELDS.get(part)
+        if field is None or field not in valid_fields:
+            return None
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+def match_local_query(nl_query):
+    q = _TRAILING_FILLER.sub("", _LEADING_FILLER.sub("", normalize_question(nl_query)))
+    if not q:
+        return None
+    top = _TOP_QUERY.match(q)
+    if top:
+        dimensions = _resolve_fields(top.group("dims"), DIMENSION_PHRASES, GA4_DIMENSIONS)
+        if not dimensions:
+            return None
+        if top.group("mets"):
+            metrics = _resolve_fields(top.group("mets"), METRIC_PHRASES, GA4_METRICS)
+        else:
+            metrics = [DEFAULT_TOP_METRIC.get(dimensions[0], "sessions")]
+        if not metrics:
+            return None
+        limit = int(top.group("n") or DEFAULT_TOP_N)
+        return {
+            "metrics": metrics, "dimensions": dimensions,
+            "order_bys": [f"-{metrics[0]}"], "limit": limit,
+            "summary": f"Top {limit} {', '.join(dimensions)} by {metrics[0]}.",
+        }
+
+    breakdown = _BREAKDOWN_QUERY.match(q)
+    metrics = _resolve_fields(breakdown.group("mets"), METRIC_PHRASES, GA4_METRICS)
+    if not metrics:
+        return None
+    dimensions = []
+    if breakdown.group("dims"):
+        dimensions = _resolve_fields(breakdown.group("dims"), DIMENSION_PHRASES, GA4_DIMENSIONS)
+        if not dimensions:
+            return None
+    summary = ", ".join(metrics) + (f" by {', '.join(dimensions)}" if dimensions else " for the site") + "."
+    return {"metrics": metrics, "dimensions": dimensions, "summary": summary}
+
+def _cache_get(key):
+    with _translations_lock:
+        entry = _translations.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _translations[key]
+            return None
+        _translations.move_to_end(key)
+        return copy.deepcopy(entry[1])
+
+def _cache_put(key, params):
+    with _translations_lock:
+        _translations[key] = (time.time() + NLQ_CACHE_TTL, copy.deepcopy(params))
+        _translations.move_to_end(key)
+        while len(_translations) > NLQ_CACHE_MAX_ENTRIES:
+            _translations.popitem(last=False)
+
 def validate_fields(fields, valid_set, mapping):
     valid = []
     invalid = []
@@ -14,14 +149,39 @@ def validate_fields(fields, valid_set, mapping):
             invalid.append(f)
     return valid, invalid
 
-def nlq_to_ga4_params(nl_query, api_key):
+def _fields_version(fields):
+    if fields is None:
+        return None
+    return hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest()[:12]
+
+def nlq_to_ga4_params(nl_query, api_key, fields=None):
+    """
+    Translate a question into GA4 report parameters.
+
+    fields is an optional (metrics, dimensions) pair of the property's valid fields, e.g. from
+    ga4_api.get_field_lists; the model may only use those. Defaults to the ga4_fields lists.
+    """
+    key = (normalize_question(nl_query), FIELDS_VERSION, _fields_version(fields))
+    params = _cache_get(key)
+    if params is not None:
+        return params
+    params = match_local_query(nl_query)
+    if params is None:
+        metrics, dimensions = fields or (GA4_METRICS, GA4_DIMENSIONS)
+        params = _translate_with_model(nl_query, api_key, metrics, dimensions)
+    # Errors are not cached, so a fixed API key or a transient failure is retried
+    if "error" not in params:
+        _cache_put(key, params)
+    return params
+
+def _translate_with_model(nl_query, api_key, valid_metrics, valid_dimensions):
     openai.api_key = api_key
     prompt = f"""
 You are an expert Google Analytics 4 assistant for a tech company. Your job is to analyze and translate ANY custom user query about their website's analytics into valid Google Analytics 4 API parameters. Do NOT copy or repeat examples. Instead, always analyze the user's question and generate the correct metrics, dimensions, and filters for a live GA4 API call.
 
 Only use dimensions and metrics from the following lists. Do not use any other fields.
-Metrics: {GA4_METRICS}
-Dimensions: {GA4_DIMENSIONS}
+Metrics: {valid_metrics}
+Dimensions: {valid_dimensions}
 
 For the question: '{nl_query}'
 If the question is ambiguous, unclear, or cannot be answered directly, respond with a JSON object with a 'rephrase' key containing a suggested, valid rephrasing of the question that would work. Otherwise, respond with a JSON object with keys: metrics (list), dimensions (list), filters (dict, optional), and a summary (string). Do NOT include date_range_start or date_range_end unless the user specifically asks for a time period. Default to site-wide or most recent data if no date is given.
@@ -42,7 +202,7 @@ Now, analyze the user's question and output the correct JSON for a live GA4 API
 """
     try:
         response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
+            model=NLQ_MODEL,
             messages=[{"role": "user", "content": prompt}],
             max_tokens=400,
             temperature=0
@@ -57,8 +217,8 @@ Now, analyze the user's question and output the correct JSON for a live GA4 API
         if 'rephrase' in params:
             return {"rephrase": params['rephrase']}
         # Validate metrics and dimensions
-        metrics, invalid_metrics = validate_fields(params.get("metrics", []), GA4_METRICS, UA_TO_GA4)
-        dimensions, invalid_dims = validate_fields(params.get("dimensions", []), GA4_DIMENSIONS, UA_TO_GA4)
+        metrics, invalid_metrics = validate_fields(params.get("metrics", []), valid_metrics, UA_TO_GA4)
+        dimensions, invalid_dims = validate_fields(params.get("dimensions", []), valid_dimensions, UA_TO_GA4)
         errors = []
         if invalid_metrics:
             errors.append(f"Invalid metrics: {invalid_metrics}")